@@ -0,0 +1,132 @@
+"""API журнала статусов: история переходов по сущности и сводка SLA модерации по дням"""
+import json
+import os
+from datetime import date, timedelta
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+SCHEMA = "t_p13732906_kedoo_music_platform"
+
+ENTITY_TYPES = ('release', 'smartlink', 'ticket', 'promo', 'video', 'platform')
+TIMELINE_LIMIT = 200
+SLA_DEFAULT_DAYS = 30
+
+def get_db_connection():
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+def parse_date(value: str):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return False
+
+def handler(event: dict, context) -> dict:
+    method = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    if method != 'GET':
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    params = event.get('queryStringParameters') or {}
+    entity_type = params.get('entity_type')
+
+    if entity_type and entity_type not in ENTITY_TYPES:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid entity_type'}),
+            'isBase64Encoded': False
+        }
+
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+
+        if params.get('action') == 'sla':
+            # Только готовая сводка moderation_sla_daily: живые таблицы и журнал не сканируются
+            date_from = parse_date(params.get('from'))
+            date_to = parse_date(params.get('to'))
+            if date_from is False or date_to is False:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Invalid from or to date'}),
+                    'isBase64Encoded': False
+                }
+
+            query = f"SELECT * FROM {SCHEMA}.moderation_sla_daily WHERE day >= %s"
+            query_params = [date_from or date.today() - timedelta(days=SLA_DEFAULT_DAYS)]
+            if date_to:
+                query += " AND day <= %s"
+                query_params.append(date_to)
+            if entity_type:
+                query += " AND entity_type = %s"
+                query_params.append(entity_type)
+            query += " ORDER BY day, entity_type"
+            cur.execute(query, query_params)
+            sla = [dict(row) for row in cur.fetchall()]
+
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'sla': sla}, default=str),
+                'isBase64Encoded': False
+            }
+
+        entity_id = params.get('entity_id')
+        if not entity_type or not entity_id:
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Missing entity_type or entity_id'}),
+                'isBase64Encoded': False
+            }
+
+        # Хронология по индексу (entity_type, entity_id, id); after_id — продолжение длинной истории
+        cur.execute(f"""
+            SELECT e.id, e.from_status, e.to_status, e.reason, e.actor_id, u.username AS actor_username, e.created_at
+            FROM {SCHEMA}.status_events e
+            LEFT JOIN {SCHEMA}.users u ON u.id = e.actor_id
+            WHERE e.entity_type = %s AND e.entity_id = %s AND e.id > %s
+            ORDER BY e.id
+            LIMIT %s
+        """, (entity_type, entity_id, params.get('after_id') or 0, TIMELINE_LIMIT))
+        events = [dict(row) for row in cur.fetchall()]
+
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'events': events}, default=str),
+            'isBase64Encoded': False
+        }
+
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
@@ -1,17 +1,236 @@
 """API для авторизации и регистрации пользователей"""
+import base64
+import gzip
 import json
 import os
+import time
 import hashlib
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+SCHEMA = "t_p13732906_kedoo_music_platform"
+
+# Реестр запросов: текст собирается один раз, PREPARE выполняется лениво на каждом соединении
+STATEMENTS = {
+    'login': f"SELECT id, email, username, role, theme FROM {SCHEMA}.users WHERE email = $1 AND password_hash = $2",
+}
+
+# Счётчики переиспользования планов за время жизни тёплого инстанса
+STATEMENT_STATS = {'prepared': 0, 'reused': 0}
+
+_connection = None
+_prepared = set()
 
 def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+    global _connection
+    if _connection is None or _connection.closed:
+        _connection = psycopg2.connect(os.environ['DATABASE_URL'])
+        _prepared.clear()
+    return _connection
+
+def execute_prepared(cur, name: str, params: tuple = ()):
+    if name in _prepared:
+        STATEMENT_STATS['reused'] += 1
+    else:
+        cur.execute(f"PREPARE {name} AS {STATEMENTS[name]}")
+        _prepared.add(name)
+        STATEMENT_STATS['prepared'] += 1
+    if params:
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+    else:
+        cur.execute(f"EXECUTE {name}")
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
-def handler(event: dict, context) -> dict:
+def is_moderator(cur, user_id) -> bool:
+    if not str(user_id or '').isdigit():
+        return False
+    cur.execute(f"SELECT 1 FROM {SCHEMA}.users WHERE id = %s AND role = 'moderator'", (int(user_id),))
+    return cur.fetchone() is not None
+
+# Лимиты запросов по действию: (ёмкость ведра, пополнение токенов в секунду).
+# Переопределяются переменной окружения RATE_LIMITS, например {"POST": [5, 0.01]}
+RATE_LIMITS = {
+    'login': (10, 10 / 60),
+    'register': (5, 5 / 3600),
+    'update_profile': (10, 10 / 60),
+    'update_theme': (30, 30 / 60),
+    # Отдельное ведро на аккаунт: списывается только неудачными входами и щедрее лимита по IP,
+    # чтобы перебор с разных адресов упирался в него, а владелец не блокировался чужими запросами
+    'login_failed': (20, 20 / 600),
+}
+RATE_LIMITS.update({action: tuple(limit) for action, limit in json.loads(os.environ.get('RATE_LIMITS', '{}')).items()})
+RATE_LIMIT_SCOPE = 'auth'
+# До входа личность клиента неизвестна: email и user_id в теле задаёт сам клиент, такие действия ограничиваются по IP
+ANONYMOUS_ACTIONS = ('login', 'register')
+# >>> shared: rate_limit
+RATE_LIMIT_WINDOW_SECONDS = 60
+RATE_LIMIT_SYNC_SECONDS = 10
+
+_buckets = {}
+_pending_hits = {}
+_blocked_until = {}
+_last_rate_limit_sync = 0.0
+
+def get_client_identities(event: dict, user_id=None) -> list:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    identities = []
+    if identity.get('sourceIp'):
+        identities.append(f"ip:{identity['sourceIp']}")
+    if user_id:
+        identities.append(f'user:{user_id}')
+    return identities
+
+def check_rate_limit(action: str, identities: list) -> bool:
+    """Токен-бакет в памяти тёплого инстанса; соединение с БД не требуется"""
+    limit = RATE_LIMITS.get(action)
+    if not limit or not identities:
+        return True
+    capacity, refill_rate = limit
+    now = time.time()
+    keys = [(action, identity) for identity in identities]
+    refilled = {}
+    for key in keys:
+        if _blocked_until.get(key, 0) > now:
+            return False
+        tokens, updated_at = _buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens < 1:
+            _buckets[key] = (tokens, now)
+            return False
+        refilled[key] = tokens
+    window_start = int(now // RATE_LIMIT_WINDOW_SECONDS * RATE_LIMIT_WINDOW_SECONDS)
+    for key, tokens in refilled.items():
+        _buckets[key] = (tokens - 1, now)
+        pending_key = key + (window_start,)
+        _pending_hits[pending_key] = _pending_hits.get(pending_key, 0) + 1
+    return True
+
+def sync_rate_limits(conn):
+    """Пакетно сбрасывает локальные счётчики в общую таблицу и блокирует ключи, превысившие лимит глобально"""
+    global _last_rate_limit_sync
+    now = time.time()
+    if not _pending_hits or now - _last_rate_limit_sync < RATE_LIMIT_SYNC_SECONDS:
+        return
+    _last_rate_limit_sync = now
+    pending = dict(_pending_hits)
+    _pending_hits.clear()
+    try:
+        conn.rollback()
+        with conn.cursor() as cur:
+            rows = execute_values(cur, """
+                INSERT INTO t_p13732906_kedoo_music_platform.rate_limit_counters AS c (scope, bucket_key, window_start, hits)
+                VALUES %s
+                ON CONFLICT (scope, bucket_key, window_start) DO UPDATE SET hits = c.hits + EXCLUDED.hits
+                RETURNING c.scope, c.bucket_key, EXTRACT(EPOCH FROM c.window_start)::BIGINT, c.hits
+            """, [
+                (f'{RATE_LIMIT_SCOPE}:{action}', identity, window_start, hits)
+                for (action, identity, window_start), hits in pending.items()
+            ], template="(%s, %s, to_timestamp(%s) AT TIME ZONE 'UTC', %s)", fetch=True)
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        for key, hits in pending.items():
+            _pending_hits[key] = _pending_hits.get(key, 0) + hits
+        return
+    for scope, identity, window_start, hits in rows:
+        action = scope.split(':', 1)[1]
+        capacity, refill_rate = RATE_LIMITS[action]
+        if hits > capacity + refill_rate * RATE_LIMIT_WINDOW_SECONDS:
+            _blocked_until[(action, identity)] = window_start + RATE_LIMIT_WINDOW_SECONDS
+    for key, (tokens, updated_at) in list(_buckets.items()):
+        capacity, refill_rate = RATE_LIMITS[key[0]]
+        if tokens + (now - updated_at) * refill_rate >= capacity:
+            del _buckets[key]
+    for key, until in list(_blocked_until.items()):
+        if until <= now:
+            del _blocked_until[key]
+
+def rate_limited_response() -> dict:
+    return {
+        'statusCode': 429,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': str(RATE_LIMIT_WINDOW_SECONDS)},
+        'body': json.dumps({'error': 'Too many requests'}),
+        'isBase64Encoded': False
+    }
+# <<< shared: rate_limit
+
+def rate_limit_exhausted(action: str, identities: list) -> bool:
+    """Проверка ведра без списания токена — для лимитов, которые расходуют только неудачные попытки"""
+    limit = RATE_LIMITS.get(action)
+    if not limit:
+        return False
+    capacity, refill_rate = limit
+    now = time.time()
+    for key in [(action, identity) for identity in identities]:
+        if _blocked_until.get(key, 0) > now:
+            return True
+        tokens, updated_at = _buckets.get(key, (capacity, now))
+        if min(capacity, tokens + (now - updated_at) * refill_rate) < 1:
+            return True
+    return False
+
+# >>> shared: compression
+# Сжатие ответа по Accept-Encoding: brotli (если модуль установлен) или gzip, мелкие ответы отдаются как есть.
+# brotli q4 быстрее gzip -6 и даёт меньший ответ; base64 для шлюза съедает треть выигрыша, но JSON сжимается в ~10 раз
+COMPRESS_MIN_BYTES = 1024
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 6
+
+def accepted_encodings(event: dict) -> dict:
+    header = next((v for k, v in (event.get('headers') or {}).items() if k.lower() == 'accept-encoding'), None) or ''
+    encodings = {}
+    for item in header.split(','):
+        name, _, options = item.partition(';')
+        quality = 1.0
+        key, _, value = options.strip().partition('=')
+        if key.strip() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+def compress_response(event: dict, response: dict) -> dict:
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    headers = {**response.get('headers', {}), 'Vary': 'Accept-Encoding'}
+    accepted = accepted_encodings(event)
+    supported = ('br', 'gzip') if brotli else ('gzip',)
+    candidates = [name for name in supported if accepted.get(name, accepted.get('*', 0.0)) > 0]
+    if not candidates:
+        return {**response, 'headers': headers}
+
+    # При равных q выигрывает brotli: max возвращает первый из равных
+    encoding = max(candidates, key=lambda name: accepted.get(name, accepted.get('*', 0.0)))
+    raw = body.encode('utf-8')
+    if encoding == 'br':
+        packed = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        packed = gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    encoded = base64.b64encode(packed).decode('ascii')
+    if len(encoded) >= len(raw):
+        return {**response, 'headers': headers}
+
+    return {
+        **response,
+        'headers': {**headers, 'Content-Encoding': encoding},
+        'body': encoded,
+        'isBase64Encoded': True
+    }
+# <<< shared: compression
+
+def handle_request(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -39,6 +258,10 @@ def handler(event: dict, context) -> dict:
         body = json.loads(event.get('body', '{}'))
         action = body.get('action')
         
+        user_id = None if action in ANONYMOUS_ACTIONS else body.get('user_id')
+        if not check_rate_limit(action, get_client_identities(event, user_id)):
+            return rate_limited_response()
+        
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
         
@@ -83,15 +306,17 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
+            account = [f'account:{email.strip().lower()}']
+            if rate_limit_exhausted('login_failed', account):
+                return rate_limited_response()
+            
             password_hash = hash_password(password)
             
-            cur.execute(
-                "SELECT id, email, username, role, theme FROM t_p13732906_kedoo_music_platform.users WHERE email = %s AND password_hash = %s",
-                (email, password_hash)
-            )
+            execute_prepared(cur, 'login', (email, password_hash))
             user = cur.fetchone()
             
             if not user:
+                check_rate_limit('login_failed', account)
                 return {
                     'statusCode': 401,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -177,6 +402,22 @@ def handler(event: dict, context) -> dict:
                 'isBase64Encoded': False
             }
         
+        elif action == 'statement_stats':
+            # Сколько планов подготовлено и переиспользовано этим инстансом; только модератору
+            if not is_moderator(cur, body.get('user_id')):
+                return {
+                    'statusCode': 403,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Moderator access required'}),
+                    'isBase64Encoded': False
+                }
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'statement_stats': STATEMENT_STATS, 'prepared': sorted(_prepared)}),
+                'isBase64Encoded': False
+            }
+        
         else:
             return {
                 'statusCode': 400,
@@ -194,6 +435,10 @@ def handler(event: dict, context) -> dict:
         }
     
     except Exception as e:
+        # После миграции, поменявшей типы столбцов users, подготовленный план отвечает
+        # «cached plan must not change result type» — новое соединение подготовит планы заново
+        if getattr(e, 'pgcode', None) == '0A000' and 'conn' in locals():
+            conn.close()
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -204,5 +449,9 @@ def handler(event: dict, context) -> dict:
     finally:
         if 'cur' in locals():
             cur.close()
-        if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+        if 'conn' in locals() and not conn.closed:
+            conn.rollback()
+            sync_rate_limits(conn)
+
+def handler(event: dict, context) -> dict:
+    return compress_response(event, handle_request(event, context))
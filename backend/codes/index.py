@@ -0,0 +1,425 @@
+"""API реестра ISRC/UPC: поиск релиза, треков и заявок студии по коду, пакетная проверка и выдача новых кодов блоками"""
+import json
+import os
+import re
+import time
+from datetime import date
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+
+SCHEMA = "t_p13732906_kedoo_music_platform"
+
+ISRC_PATTERN = re.compile(r'^[A-Z]{2}[A-Z0-9]{3}[0-9]{7}$')
+CODE_TYPES = ('isrc', 'upc')
+VALIDATE_MAX_CODES = 1000
+ALLOCATE_MAX_COUNT = 1000
+
+# Номера выдаются блоками по CODE_BLOCK_SIZE за экземпляром функции: UPC — из последовательности (INCREMENT BY
+# в V0022), код записи ISRC — из счётчика своего года (V0032), так как пять цифр нумеруют записи внутри года
+CODE_BLOCK_SIZE = 100
+UPC_SEQUENCE = 'upc_item_seq'
+# ISRC_REGISTRANT — код страны и регистранта (5 символов), UPC_COMPANY_PREFIX — префикс компании GS1
+ISRC_REGISTRANT = os.environ.get('ISRC_REGISTRANT', '').upper()
+UPC_COMPANY_PREFIX = os.environ.get('UPC_COMPANY_PREFIX', '')
+
+# Остаток текущего блока [следующий, конец) по (тип кода, год) живёт между вызовами тёплого экземпляра
+_blocks = {}
+
+def get_db_connection():
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+# Лимиты запросов по действию: (ёмкость ведра, пополнение токенов в секунду).
+# Переопределяются переменной окружения RATE_LIMITS, например {"allocate": [3, 0.001]}
+RATE_LIMITS = {
+    'GET': (120, 2),
+    'validate': (30, 0.5),
+    'allocate': (3, 1 / 1200),
+}
+RATE_LIMITS.update({action: tuple(limit) for action, limit in json.loads(os.environ.get('RATE_LIMITS', '{}')).items()})
+RATE_LIMIT_SCOPE = 'codes'
+# >>> shared: rate_limit
+RATE_LIMIT_WINDOW_SECONDS = 60
+RATE_LIMIT_SYNC_SECONDS = 10
+
+_buckets = {}
+_pending_hits = {}
+_blocked_until = {}
+_last_rate_limit_sync = 0.0
+
+def get_client_identities(event: dict, user_id=None) -> list:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    identities = []
+    if identity.get('sourceIp'):
+        identities.append(f"ip:{identity['sourceIp']}")
+    if user_id:
+        identities.append(f'user:{user_id}')
+    return identities
+
+def check_rate_limit(action: str, identities: list) -> bool:
+    """Токен-бакет в памяти тёплого инстанса; соединение с БД не требуется"""
+    limit = RATE_LIMITS.get(action)
+    if not limit or not identities:
+        return True
+    capacity, refill_rate = limit
+    now = time.time()
+    keys = [(action, identity) for identity in identities]
+    refilled = {}
+    for key in keys:
+        if _blocked_until.get(key, 0) > now:
+            return False
+        tokens, updated_at = _buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens < 1:
+            _buckets[key] = (tokens, now)
+            return False
+        refilled[key] = tokens
+    window_start = int(now // RATE_LIMIT_WINDOW_SECONDS * RATE_LIMIT_WINDOW_SECONDS)
+    for key, tokens in refilled.items():
+        _buckets[key] = (tokens - 1, now)
+        pending_key = key + (window_start,)
+        _pending_hits[pending_key] = _pending_hits.get(pending_key, 0) + 1
+    return True
+
+def sync_rate_limits(conn):
+    """Пакетно сбрасывает локальные счётчики в общую таблицу и блокирует ключи, превысившие лимит глобально"""
+    global _last_rate_limit_sync
+    now = time.time()
+    if not _pending_hits or now - _last_rate_limit_sync < RATE_LIMIT_SYNC_SECONDS:
+        return
+    _last_rate_limit_sync = now
+    pending = dict(_pending_hits)
+    _pending_hits.clear()
+    try:
+        conn.rollback()
+        with conn.cursor() as cur:
+            rows = execute_values(cur, """
+                INSERT INTO t_p13732906_kedoo_music_platform.rate_limit_counters AS c (scope, bucket_key, window_start, hits)
+                VALUES %s
+                ON CONFLICT (scope, bucket_key, window_start) DO UPDATE SET hits = c.hits + EXCLUDED.hits
+                RETURNING c.scope, c.bucket_key, EXTRACT(EPOCH FROM c.window_start)::BIGINT, c.hits
+            """, [
+                (f'{RATE_LIMIT_SCOPE}:{action}', identity, window_start, hits)
+                for (action, identity, window_start), hits in pending.items()
+            ], template="(%s, %s, to_timestamp(%s) AT TIME ZONE 'UTC', %s)", fetch=True)
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        for key, hits in pending.items():
+            _pending_hits[key] = _pending_hits.get(key, 0) + hits
+        return
+    for scope, identity, window_start, hits in rows:
+        action = scope.split(':', 1)[1]
+        capacity, refill_rate = RATE_LIMITS[action]
+        if hits > capacity + refill_rate * RATE_LIMIT_WINDOW_SECONDS:
+            _blocked_until[(action, identity)] = window_start + RATE_LIMIT_WINDOW_SECONDS
+    for key, (tokens, updated_at) in list(_buckets.items()):
+        capacity, refill_rate = RATE_LIMITS[key[0]]
+        if tokens + (now - updated_at) * refill_rate >= capacity:
+            del _buckets[key]
+    for key, until in list(_blocked_until.items()):
+        if until <= now:
+            del _blocked_until[key]
+
+def rate_limited_response() -> dict:
+    return {
+        'statusCode': 429,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': str(RATE_LIMIT_WINDOW_SECONDS)},
+        'body': json.dumps({'error': 'Too many requests'}),
+        'isBase64Encoded': False
+    }
+# <<< shared: rate_limit
+
+def normalize_code(code_type: str, value) -> str:
+    """ISRC — верхний регистр без разделителей, UPC/EAN — 13 цифр (как normalize_code в БД)"""
+    if code_type == 'isrc':
+        return re.sub(r'[^A-Za-z0-9]', '', str(value)).upper()
+    return re.sub(r'[\s-]', '', str(value)).zfill(13)
+
+def ean_check_digit(digits: str) -> int:
+    total = sum(int(digit) * (3 if idx % 2 else 1) for idx, digit in enumerate(digits))
+    return (10 - total % 10) % 10
+
+def is_valid_code(code_type: str, code: str) -> bool:
+    if code_type == 'isrc':
+        return bool(ISRC_PATTERN.match(code))
+    return len(code) == 13 and code.isdigit() and ean_check_digit(code[:12]) == int(code[12])
+
+def detect_code_type(value) -> str:
+    """Коды из одних цифр — UPC/EAN, остальные — ISRC"""
+    return 'upc' if re.sub(r'[\s-]', '', str(value)).isdigit() else 'isrc'
+
+def reserve_block(cur, code_type: str, year: int) -> int:
+    """Первый номер нового блока: счётчик года ISRC заводится при первой выдаче в году и начинается с 1"""
+    if code_type == 'isrc':
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.isrc_designation_counters AS c (year, last_number) VALUES (%s, %s)
+            ON CONFLICT (year) DO UPDATE SET last_number = c.last_number + EXCLUDED.last_number
+            RETURNING c.last_number - %s + 1 AS start
+        """, (year, CODE_BLOCK_SIZE, CODE_BLOCK_SIZE))
+    else:
+        cur.execute(f"SELECT nextval('{SCHEMA}.{UPC_SEQUENCE}') AS start")
+    return cur.fetchone()['start']
+
+def allocate_numbers(cur, code_type: str, count: int, year: int) -> list:
+    numbers = []
+    block = _blocks.setdefault((code_type, year if code_type == 'isrc' else None), [0, 0])
+    while len(numbers) < count:
+        if block[0] >= block[1]:
+            start = reserve_block(cur, code_type, year)
+            block[0], block[1] = start, start + CODE_BLOCK_SIZE
+        take = min(count - len(numbers), block[1] - block[0])
+        numbers.extend(range(block[0], block[0] + take))
+        block[0] += take
+    return numbers
+
+def format_codes(code_type: str, numbers: list, year: int) -> list:
+    if code_type == 'isrc':
+        # Пять цифр кода записи нумеруют записи регистранта внутри года: 99 999 в год
+        if numbers and numbers[-1] > 99999:
+            raise ValueError('ISRC designation range for this year is exhausted')
+        return [f'{ISRC_REGISTRANT}{year % 100:02d}{number:05d}' for number in numbers]
+
+    item_digits = 12 - len(UPC_COMPANY_PREFIX)
+    if numbers and numbers[-1] >= 10 ** item_digits:
+        raise ValueError('UPC item range is exhausted')
+    codes = []
+    for number in numbers:
+        body = f'{UPC_COMPANY_PREFIX}{number:0{item_digits}d}'
+        codes.append(f'{body}{ean_check_digit(body)}')
+    return codes
+
+def allocation_configured(code_type: str) -> bool:
+    if code_type == 'isrc':
+        return bool(re.match(r'^[A-Z]{2}[A-Z0-9]{3}$', ISRC_REGISTRANT))
+    return UPC_COMPANY_PREFIX.isdigit() and 6 <= len(UPC_COMPANY_PREFIX) <= 11
+
+def resolve_code(cur, code_type: str, code: str) -> dict:
+    """Один запрос по индексу (code_type, code): релиз находится по UPC напрямую или через трек по ISRC.
+    В conflicts — релизы с тем же UPC, не попавшие в реестр при заполнении V0022 (code_registry_conflicts)"""
+    cur.execute(f"""
+        WITH hits AS (
+            SELECT entity_type, entity_id, field, is_valid
+            FROM {SCHEMA}.code_registry
+            WHERE code_type = %s AND code = %s
+        ), release_ids AS (
+            SELECT r.id FROM {SCHEMA}.releases r
+            WHERE r.deleted_at IS NULL AND r.id IN (
+                SELECT entity_id FROM hits WHERE entity_type = 'release'
+                UNION
+                SELECT t.release_id FROM hits h JOIN {SCHEMA}.tracks t ON t.id = h.entity_id
+                WHERE h.entity_type = 'track'
+            )
+        )
+        SELECT 'release' AS kind, jsonb_build_object(
+            'id', r.id, 'user_id', r.user_id, 'album_name', r.album_name, 'artists', r.artists,
+            'upc', r.upc, 'status', r.status, 'release_date', r.release_date) AS data
+        FROM {SCHEMA}.releases r WHERE r.id IN (SELECT id FROM release_ids)
+        UNION ALL
+        SELECT 'track', jsonb_build_object(
+            'id', t.id, 'release_id', t.release_id, 'track_name', t.track_name, 'artists', t.artists,
+            'isrc', t.isrc, 'track_order', t.track_order)
+        FROM {SCHEMA}.tracks t WHERE t.release_id IN (SELECT id FROM release_ids)
+        UNION ALL
+        SELECT 'smartlink', jsonb_build_object(
+            'id', s.id, 'user_id', s.user_id, 'release_name', s.release_name, 'status', s.status,
+            'smartlink_url', s.smartlink_url)
+        FROM hits h JOIN {SCHEMA}.smartlinks s ON s.id = h.entity_id WHERE h.entity_type = 'smartlink'
+        UNION ALL
+        SELECT 'promo', jsonb_build_object(
+            'id', p.id, 'user_id', p.user_id, 'key_track_name', p.key_track_name, 'status', p.status, 'field', h.field)
+        FROM hits h JOIN {SCHEMA}.promo_releases p ON p.id = h.entity_id WHERE h.entity_type = 'promo'
+        UNION ALL
+        SELECT 'platform', jsonb_build_object(
+            'id', a.id, 'user_id', a.user_id, 'platform', a.platform, 'status', a.status, 'field', h.field)
+        FROM hits h JOIN {SCHEMA}.platform_accounts a ON a.id = h.entity_id WHERE h.entity_type = 'platform'
+        UNION ALL
+        SELECT 'conflict', jsonb_build_object(
+            'release_id', k.release_id, 'owner_release_id', k.owner_release_id, 'user_id', k.user_id,
+            'detected_at', k.detected_at)
+        FROM {SCHEMA}.code_registry_conflicts k WHERE %s = 'upc' AND k.code = %s
+    """, (code_type, code, code_type, code))
+
+    result = {'releases': [], 'tracks': [], 'smartlinks': [], 'promo': [], 'platform': [], 'conflicts': []}
+    keys = {'release': 'releases', 'track': 'tracks', 'smartlink': 'smartlinks', 'promo': 'promo', 'platform': 'platform',
+            'conflict': 'conflicts'}
+    for row in cur.fetchall():
+        result[keys[row['kind']]].append(row['data'])
+    result['tracks'].sort(key=lambda track: (track['release_id'], track['track_order'] or 0))
+    return result
+
+def handler(event: dict, context) -> dict:
+    method = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    params = event.get('queryStringParameters') or {}
+
+    try:
+        if method == 'GET' and not check_rate_limit('GET', get_client_identities(event)):
+            return rate_limited_response()
+
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+
+        if method == 'GET':
+            value = params.get('code')
+            if not value:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Missing code'}),
+                    'isBase64Encoded': False
+                }
+
+            code_type = params.get('type') or detect_code_type(value)
+            if code_type not in CODE_TYPES:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Invalid type'}),
+                    'isBase64Encoded': False
+                }
+
+            code = normalize_code(code_type, value)
+            result = resolve_code(cur, code_type, code)
+
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'code': code, 'code_type': code_type, 'is_valid': is_valid_code(code_type, code), **result}, default=str),
+                'isBase64Encoded': False
+            }
+
+        elif method == 'POST':
+            body = json.loads(event.get('body') or '{}')
+            action = body.get('action')
+            if action in RATE_LIMITS and not check_rate_limit(action, get_client_identities(event, body.get('user_id'))):
+                return rate_limited_response()
+
+            if action == 'validate':
+                values = body.get('codes') or []
+                if not isinstance(values, list) or len(values) > VALIDATE_MAX_CODES:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': f'codes must be a list of at most {VALIDATE_MAX_CODES} items'}),
+                        'isBase64Encoded': False
+                    }
+
+                results = []
+                for value in values:
+                    code_type = detect_code_type(value)
+                    code = normalize_code(code_type, value)
+                    results.append({'value': value, 'code_type': code_type, 'code': code,
+                                    'is_valid': is_valid_code(code_type, code), 'registered': []})
+
+                # Занятость всех кодов пакета — одним запросом по индексу реестра
+                if results:
+                    cur.execute(f"""
+                        SELECT r.code_type, r.code, r.entity_type, r.entity_id, r.field
+                        FROM {SCHEMA}.code_registry r
+                        JOIN unnest(%s::text[], %s::text[]) AS v(code_type, code)
+                          ON r.code_type = v.code_type AND r.code = v.code
+                    """, ([item['code_type'] for item in results], [item['code'] for item in results]))
+                    registered = {}
+                    for row in cur.fetchall():
+                        registered.setdefault((row['code_type'], row['code']), []).append(
+                            {'entity_type': row['entity_type'], 'entity_id': row['entity_id'], 'field': row['field']}
+                        )
+                    for item in results:
+                        item['registered'] = registered.get((item['code_type'], item['code']), [])
+
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'results': results}),
+                    'isBase64Encoded': False
+                }
+
+            elif action == 'allocate':
+                code_type = body.get('code_type')
+                try:
+                    count = int(body.get('count', 1))
+                except (TypeError, ValueError):
+                    count = 0
+
+                if code_type not in CODE_TYPES or not 1 <= count <= ALLOCATE_MAX_COUNT:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': f'Invalid code_type or count (1..{ALLOCATE_MAX_COUNT})'}),
+                        'isBase64Encoded': False
+                    }
+
+                if not allocation_configured(code_type):
+                    return {
+                        'statusCode': 503,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Code allocation is not configured'}),
+                        'isBase64Encoded': False
+                    }
+
+                year = date.today().year
+                try:
+                    codes = format_codes(code_type, allocate_numbers(cur, code_type, count, year), year)
+                except ValueError as e:
+                    return {
+                        'statusCode': 409,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': str(e)}),
+                        'isBase64Encoded': False
+                    }
+
+                execute_values(
+                    cur,
+                    f"INSERT INTO {SCHEMA}.code_allocations (code_type, code, user_id) VALUES %s",
+                    [(code_type, code, body.get('user_id')) for code in codes]
+                )
+                conn.commit()
+
+                return {
+                    'statusCode': 201,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'code_type': code_type, 'codes': codes}),
+                    'isBase64Encoded': False
+                }
+
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Invalid action'}),
+                'isBase64Encoded': False
+            }
+
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            sync_rate_limits(conn)
+            conn.close()
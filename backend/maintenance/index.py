@@ -0,0 +1,424 @@
+"""Обслуживание БД: нарезка месячных партиций, архивация старых партиций на диск, очистка устаревших ключей идемпотентности и счётчиков лимитов, сводка SLA модерации, сжатие текстов песен, удаление помеченных релизов"""
+import gzip
+import json
+import os
+import time
+import zlib
+from datetime import date
+import psycopg2
+from psycopg2.extras import execute_values
+
+SCHEMA = "t_p13732906_kedoo_music_platform"
+
+# Таблица -> статусы, при которых строка считается холодной и может уйти в архив
+PARTITIONED_TABLES = {
+    'tickets': ('closed',),
+    'releases': ('rejected',),
+    'promo_releases': ('rejected',),
+    'videos': ('rejected',),
+    'platform_accounts': ('rejected',),
+}
+
+# Сущности реестра кодов: DROP партиции не запускает построчные триггеры, записи чистятся явно
+REGISTRY_ENTITIES = {
+    'releases': 'release',
+    'promo_releases': 'promo',
+    'platform_accounts': 'platform',
+}
+
+# Дочерние строки партиции: (суффикс файла архива, выборка, удаление). Внешних ключей на партиционированные
+# таблицы нет, поэтому зависимые строки выгружаются и удаляются до DROP, иначе остаются сиротами.
+# Тексты песен уходят каскадно с треками, записи реестра кодов треков — их триггером
+PARTITION_DEPENDENTS = {
+    'releases': (
+        ('track_lyrics',
+         f"SELECT l.* FROM {SCHEMA}.track_lyrics l JOIN {SCHEMA}.tracks t ON t.id = l.track_id "
+         f"WHERE t.release_id IN (SELECT id FROM {SCHEMA}.{{partition}})",
+         None),
+        ('tracks',
+         f"SELECT * FROM {SCHEMA}.tracks WHERE release_id IN (SELECT id FROM {SCHEMA}.{{partition}})",
+         f"DELETE FROM {SCHEMA}.tracks WHERE release_id IN (SELECT id FROM {SCHEMA}.{{partition}})"),
+        ('royalty_facts',
+         f"SELECT * FROM {SCHEMA}.royalty_facts WHERE release_id IN (SELECT id FROM {SCHEMA}.{{partition}})",
+         f"DELETE FROM {SCHEMA}.royalty_facts WHERE release_id IN (SELECT id FROM {SCHEMA}.{{partition}})"),
+        ('notifications',
+         f"SELECT * FROM {SCHEMA}.notifications WHERE entity_type = 'release' "
+         f"AND entity_id IN (SELECT id FROM {SCHEMA}.{{partition}})",
+         f"DELETE FROM {SCHEMA}.notifications WHERE entity_type = 'release' "
+         f"AND entity_id IN (SELECT id FROM {SCHEMA}.{{partition}})"),
+        # Снимок зависимых удалённого релиза разбирает purge; пока он не пуст, партиция не архивируется
+        ('purge_dependents',
+         f"SELECT * FROM {SCHEMA}.release_purge_dependents WHERE release_id IN (SELECT id FROM {SCHEMA}.{{partition}})",
+         None),
+    ),
+    'tickets': (
+        ('messages',
+         f"SELECT * FROM {SCHEMA}.ticket_messages WHERE ticket_id IN (SELECT id FROM {SCHEMA}.{{partition}})",
+         f"DELETE FROM {SCHEMA}.ticket_messages WHERE ticket_id IN (SELECT id FROM {SCHEMA}.{{partition}})"),
+    ),
+}
+
+# Ссылки на файлы в хранилище: DROP не запускает триггер queue_media_gc, обложки ставятся в очередь явно
+MEDIA_COLUMNS = {
+    'releases': 'cover_url',
+    'videos': 'cover_url',
+}
+
+MONTHS_AHEAD = int(os.environ.get('PARTITION_MONTHS_AHEAD', '3'))
+ARCHIVE_AFTER_MONTHS = int(os.environ.get('ARCHIVE_AFTER_MONTHS', '12'))
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', '/var/lib/kedoo/archive')
+ARCHIVE_LOCK_TIMEOUT = os.environ.get('ARCHIVE_LOCK_TIMEOUT', '5s')
+PURGE_BATCH_SIZE = 1000
+LYRICS_COMPRESS_MIN_BYTES = 256
+PURGE_TIME_BUDGET_SECONDS = int(os.environ.get('PURGE_TIME_BUDGET_SECONDS', '240'))
+
+# Зависимые строки удалённого релиза по порядку; каждая пачка — своя короткая транзакция, блокировки на tracks не копятся.
+# Вместе с треками триггерами уходят тексты, записи реестра кодов и ссылки на аудио (в очередь media_gc_queue);
+# UPC релиза освобождается в реестре последним, вместе со строкой релиза
+RELEASE_PURGE_STEPS = (
+    ('tracks', f"""
+        DELETE FROM {SCHEMA}.tracks
+        WHERE id IN (SELECT id FROM {SCHEMA}.tracks WHERE release_id = %(id)s LIMIT %(limit)s)
+    """),
+    ('royalty_facts', f"""
+        DELETE FROM {SCHEMA}.royalty_facts
+        WHERE ctid IN (SELECT ctid FROM {SCHEMA}.royalty_facts WHERE release_id = %(id)s LIMIT %(limit)s)
+    """),
+    # Смартлинки и промо-заявки — только зафиксированные при удалении релиза; строка снимка уходит вместе с сущностью,
+    # число обработанных строк снимка считается даже для уже удалённых автором сущностей, чтобы шаг не застревал
+    ('smartlinks', f"""
+        WITH batch AS (
+            DELETE FROM {SCHEMA}.release_purge_dependents
+            WHERE (release_id, entity_type, entity_id) IN (
+                SELECT release_id, entity_type, entity_id FROM {SCHEMA}.release_purge_dependents
+                WHERE release_id = %(id)s AND entity_type = 'smartlink'
+                LIMIT %(limit)s
+            )
+            RETURNING entity_id
+        ), purged AS (
+            DELETE FROM {SCHEMA}.smartlinks WHERE id IN (SELECT entity_id FROM batch)
+        )
+        SELECT entity_id FROM batch
+    """),
+    ('promo_releases', f"""
+        WITH batch AS (
+            DELETE FROM {SCHEMA}.release_purge_dependents
+            WHERE (release_id, entity_type, entity_id) IN (
+                SELECT release_id, entity_type, entity_id FROM {SCHEMA}.release_purge_dependents
+                WHERE release_id = %(id)s AND entity_type = 'promo'
+                LIMIT %(limit)s
+            )
+            RETURNING entity_id
+        ), purged AS (
+            DELETE FROM {SCHEMA}.promo_releases WHERE id IN (SELECT entity_id FROM batch)
+        )
+        SELECT entity_id FROM batch
+    """),
+    ('notifications', f"""
+        DELETE FROM {SCHEMA}.notifications
+        WHERE id IN (
+            SELECT id FROM {SCHEMA}.notifications
+            WHERE user_id = %(user_id)s AND entity_type = 'release' AND entity_id = %(id)s
+            LIMIT %(limit)s
+        )
+    """),
+)
+
+def get_db_connection():
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+def months_ago(today: date, months: int) -> date:
+    total = today.year * 12 + today.month - 1 - months
+    return date(total // 12, total % 12 + 1, 1)
+
+def ensure_partitions(conn) -> list:
+    with conn.cursor() as cur:
+        for table in PARTITIONED_TABLES:
+            cur.execute(f"SELECT {SCHEMA}.ensure_monthly_partitions(%s, %s)", (table, MONTHS_AHEAD))
+    conn.commit()
+    return list(PARTITIONED_TABLES)
+
+def list_partitions(cur, table: str) -> list:
+    cur.execute("""
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        JOIN pg_namespace n ON n.oid = p.relnamespace
+        WHERE n.nspname = %s AND p.relname = %s AND c.relname ~ '_p[0-9]{6}$'
+        ORDER BY c.relname
+    """, (SCHEMA, table))
+    return [row[0] for row in cur.fetchall()]
+
+def copy_to_archive(cur, query: str, path: str):
+    with open(path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            cur.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", f)
+        raw.flush()
+        os.fsync(raw.fileno())
+
+def discard_archive(conn, partition: str, files: list, reason: str) -> dict:
+    conn.rollback()
+    for path in files:
+        if os.path.exists(path):
+            os.remove(path)
+    return {'partition': partition, 'archived': False, 'reason': reason}
+
+def archive_partition(conn, table: str, partition: str, cold_statuses: tuple) -> dict:
+    files = []
+    try:
+        with conn.cursor() as cur:
+            # Запись в партицию блокируется до DROP: между проверкой, выгрузкой и удалением никто не сменит статус
+            # и не добавит строку, которая ушла бы без архива; чтение при этом продолжается
+            cur.execute(f"SET LOCAL lock_timeout = '{ARCHIVE_LOCK_TIMEOUT}'")
+            cur.execute(f"LOCK TABLE {SCHEMA}.{partition} IN SHARE ROW EXCLUSIVE MODE")
+            # Строка без статуса не считается холодной
+            cur.execute(
+                f"SELECT EXISTS (SELECT 1 FROM {SCHEMA}.{partition} WHERE status IS NULL OR status <> ALL(%s))",
+                (list(cold_statuses),)
+            )
+            if cur.fetchone()[0]:
+                return discard_archive(conn, partition, files, 'has live rows')
+
+            os.makedirs(ARCHIVE_DIR, exist_ok=True)
+            files.append(os.path.join(ARCHIVE_DIR, f'{partition}.csv.gz'))
+            copy_to_archive(cur, f"SELECT * FROM {SCHEMA}.{partition}", files[0])
+
+            for suffix, select_query, delete_query in PARTITION_DEPENDENTS.get(table, ()):
+                files.append(os.path.join(ARCHIVE_DIR, f'{partition}_{suffix}.csv.gz'))
+                copy_to_archive(cur, select_query.format(partition=partition), files[-1])
+                if delete_query:
+                    cur.execute(delete_query.format(partition=partition))
+
+            # Строка, добавленная параллельно после выгрузки, осталась бы сиротой — такую партицию не трогаем
+            for suffix, select_query, _ in PARTITION_DEPENDENTS.get(table, ()):
+                cur.execute(f"SELECT EXISTS ({select_query.format(partition=partition)})")
+                if cur.fetchone()[0]:
+                    return discard_archive(conn, partition, files, f'has dependent {suffix}')
+
+            if table in MEDIA_COLUMNS:
+                cur.execute(
+                    f"INSERT INTO {SCHEMA}.media_gc_queue (url) "
+                    f"SELECT {MEDIA_COLUMNS[table]} FROM {SCHEMA}.{partition} WHERE {MEDIA_COLUMNS[table]} IS NOT NULL "
+                    f"ON CONFLICT (url) DO UPDATE SET queued_at = CURRENT_TIMESTAMP"
+                )
+
+            if table in REGISTRY_ENTITIES:
+                cur.execute(
+                    f"DELETE FROM {SCHEMA}.code_registry WHERE entity_type = %s "
+                    f"AND entity_id IN (SELECT id FROM {SCHEMA}.{partition})",
+                    (REGISTRY_ENTITIES[table],)
+                )
+
+            cur.execute(f"ALTER TABLE {SCHEMA}.{table} DETACH PARTITION {SCHEMA}.{partition}")
+            cur.execute(f"DROP TABLE {SCHEMA}.{partition}")
+        conn.commit()
+    except psycopg2.OperationalError as e:
+        # 55P03 lock_not_available, 40P01 deadlock: партицию или родителя держит запись — следующий запуск попробует снова
+        if getattr(e, 'pgcode', None) not in ('55P03', '40P01'):
+            raise
+        return discard_archive(conn, partition, files, 'locked')
+    return {'partition': partition, 'archived': True, 'files': files}
+
+def archive_old_partitions(conn) -> list:
+    cutoff = months_ago(date.today(), ARCHIVE_AFTER_MONTHS).strftime('%Y%m')
+    results = []
+    for table, cold_statuses in PARTITIONED_TABLES.items():
+        with conn.cursor() as cur:
+            partitions = list_partitions(cur, table)
+        conn.commit()
+        for partition in partitions:
+            if partition[-6:] < cutoff:
+                results.append(archive_partition(conn, table, partition, cold_statuses))
+    return results
+
+def purge_expired_idempotency_keys(conn) -> int:
+    deleted = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute(f"""
+                DELETE FROM {SCHEMA}.idempotency_keys
+                WHERE ctid IN (
+                    SELECT ctid FROM {SCHEMA}.idempotency_keys
+                    WHERE expires_at < CURRENT_TIMESTAMP
+                    LIMIT %s
+                )
+            """, (PURGE_BATCH_SIZE,))
+            conn.commit()
+            deleted += cur.rowcount
+            if cur.rowcount < PURGE_BATCH_SIZE:
+                return deleted
+
+def purge_old_rate_limit_counters(conn) -> int:
+    with conn.cursor() as cur:
+        cur.execute(
+            f"DELETE FROM {SCHEMA}.rate_limit_counters WHERE window_start < CURRENT_TIMESTAMP - INTERVAL '1 day'"
+        )
+        deleted = cur.rowcount
+    conn.commit()
+    return deleted
+
+def refresh_moderation_sla(conn) -> dict:
+    """Пересчитывает дни начиная со вчерашнего (или с первого события при пустой сводке) по журналу status_events:
+    решения выбираются по BRIN-индексу created_at, момент отправки на модерацию — по индексу (entity_type, entity_id, id)"""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT COALESCE(
+                (SELECT MAX(day) - 1 FROM {SCHEMA}.moderation_sla_daily),
+                (SELECT MIN(created_at)::DATE FROM {SCHEMA}.status_events),
+                CURRENT_DATE
+            )
+        """)
+        since = cur.fetchone()[0]
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.moderation_sla_daily
+                (day, entity_type, decisions, accepted, rejected, avg_seconds, p50_seconds, p90_seconds, p99_seconds, max_seconds)
+            SELECT
+                d.created_at::DATE,
+                d.entity_type,
+                COUNT(*),
+                COUNT(*) FILTER (WHERE d.to_status = 'accepted'),
+                COUNT(*) FILTER (WHERE d.to_status = 'rejected'),
+                ROUND(AVG(w.seconds), 1),
+                ROUND(percentile_cont(0.5) WITHIN GROUP (ORDER BY w.seconds)::NUMERIC, 1),
+                ROUND(percentile_cont(0.9) WITHIN GROUP (ORDER BY w.seconds)::NUMERIC, 1),
+                ROUND(percentile_cont(0.99) WITHIN GROUP (ORDER BY w.seconds)::NUMERIC, 1),
+                ROUND(MAX(w.seconds), 1)
+            FROM {SCHEMA}.status_events d
+            CROSS JOIN LATERAL (
+                SELECT EXTRACT(EPOCH FROM d.created_at - s.created_at)::NUMERIC AS seconds
+                FROM {SCHEMA}.status_events s
+                WHERE s.entity_type = d.entity_type AND s.entity_id = d.entity_id
+                  AND s.id < d.id AND s.to_status = 'on_moderation'
+                ORDER BY s.id DESC
+                LIMIT 1
+            ) w
+            WHERE d.created_at >= %s AND d.from_status = 'on_moderation' AND d.to_status IN ('accepted', 'rejected')
+            GROUP BY 1, 2
+            ON CONFLICT (day, entity_type) DO UPDATE
+            SET decisions = EXCLUDED.decisions, accepted = EXCLUDED.accepted, rejected = EXCLUDED.rejected,
+                avg_seconds = EXCLUDED.avg_seconds, p50_seconds = EXCLUDED.p50_seconds, p90_seconds = EXCLUDED.p90_seconds,
+                p99_seconds = EXCLUDED.p99_seconds, max_seconds = EXCLUDED.max_seconds, refreshed_at = CURRENT_TIMESTAMP
+        """, (since,))
+        refreshed = cur.rowcount
+    conn.commit()
+    return {'since': since.isoformat(), 'rows': refreshed}
+
+def compress_plain_lyrics(conn) -> int:
+    """Пережимает zlib тексты, перенесённые миграцией как 'plain'; идёт по track_id, чтобы несжимаемые не попадали повторно"""
+    compressed = 0
+    last_id = 0
+    with conn.cursor() as cur:
+        while True:
+            cur.execute(f"""
+                SELECT track_id, body FROM {SCHEMA}.track_lyrics
+                WHERE encoding = 'plain' AND size_bytes >= %s AND track_id > %s
+                ORDER BY track_id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (LYRICS_COMPRESS_MIN_BYTES, last_id, PURGE_BATCH_SIZE))
+            rows = cur.fetchall()
+            if not rows:
+                conn.commit()
+                return compressed
+
+            last_id = rows[-1][0]
+            updates = []
+            for track_id, body in rows:
+                packed = zlib.compress(bytes(body), 9)
+                if len(packed) < len(body):
+                    updates.append((track_id, psycopg2.Binary(packed)))
+            if updates:
+                execute_values(cur, f"""
+                    UPDATE {SCHEMA}.track_lyrics l
+                    SET encoding = 'zlib', body = v.body, updated_at = CURRENT_TIMESTAMP
+                    FROM (VALUES %s) AS v(track_id, body)
+                    WHERE l.track_id = v.track_id
+                """, updates, template='(%s::int, %s::bytea)')
+            conn.commit()
+            compressed += len(updates)
+
+def purge_deleted_releases(conn) -> dict:
+    """Дочищает релизы с deleted_at: одна пачка одного шага за транзакцию, сам релиз удаляется последним.
+    SKIP LOCKED по строке релиза позволяет запускать несколько чистильщиков параллельно"""
+    deleted = {name: 0 for name, _ in RELEASE_PURGE_STEPS}
+    purged = 0
+    deadline = time.monotonic() + PURGE_TIME_BUDGET_SECONDS
+    with conn.cursor() as cur:
+        while time.monotonic() < deadline:
+            cur.execute(f"""
+                SELECT id, created_at, user_id FROM {SCHEMA}.releases
+                WHERE deleted_at IS NOT NULL
+                ORDER BY deleted_at
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            """)
+            row = cur.fetchone()
+            if not row:
+                conn.commit()
+                break
+
+            release = {'id': row[0], 'created_at': row[1], 'user_id': row[2], 'limit': PURGE_BATCH_SIZE}
+            for name, statement in RELEASE_PURGE_STEPS:
+                cur.execute(statement, release)
+                if cur.rowcount:
+                    deleted[name] += cur.rowcount
+                    break
+            else:
+                cur.execute(
+                    f"DELETE FROM {SCHEMA}.releases WHERE id = %(id)s AND created_at = %(created_at)s",
+                    release
+                )
+                purged += 1
+            conn.commit()
+    return {'releases': purged, **deleted}
+
+TASKS = {
+    'partitions': ensure_partitions,
+    'archive': archive_old_partitions,
+    'idempotency': purge_expired_idempotency_keys,
+    'rate_limits': purge_old_rate_limit_counters,
+    'moderation_sla': refresh_moderation_sla,
+    'lyrics': compress_plain_lyrics,
+    'purge': purge_deleted_releases,
+}
+
+# Запускается по таймеру или вручную: ?task=partitions|archive|idempotency|rate_limits|moderation_sla|lyrics|purge, без task выполняются все задачи
+def handler(event: dict, context) -> dict:
+    params = event.get('queryStringParameters') or {}
+    task = params.get('task') or event.get('task')
+
+    if task and task not in TASKS:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid task'}),
+            'isBase64Encoded': False
+        }
+
+    conn = get_db_connection()
+
+    try:
+        results = {}
+        for name, run in TASKS.items():
+            if not task or task == name:
+                results[name] = run(conn)
+
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'results': results}, default=str),
+            'isBase64Encoded': False
+        }
+
+    except Exception as e:
+        conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+
+    finally:
+        conn.close()
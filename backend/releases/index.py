@@ -1,15 +1,577 @@
 """API для управления релизами"""
+import base64
+import gzip
+import hashlib
 import json
 import os
+import re
+import time
+import zlib
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_batch, execute_values
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 SCHEMA = "t_p13732906_kedoo_music_platform"
 
-def get_db_connection():
-    return psycopg2.connect(os.environ['DATABASE_URL'])
+# Подготовленные запросы перечисляют столбцы явно: план с SELECT * ломается, когда миграция меняет состав столбцов
+RELEASE_FIELDS = "id, user_id, album_name, artists, cover_url, upc, old_release_date, release_date, is_rerelease, status, rejection_reason, live_at, track_count, has_any_explicit, languages, total_duration_seconds, cover_thumbnails, moderation_requested_at, created_at, updated_at"
+
+RELEASE_LIST_FIELDS = "id, user_id, album_name, artists, upc, old_release_date, release_date, is_rerelease, status, rejection_reason, live_at, track_count, has_any_explicit, languages, total_duration_seconds, cover_thumbnails, moderation_requested_at, created_at, updated_at"
+
+# Окно по created_at: таблица партиционирована по месяцам, границы позволяют отсечь лишние партиции
+CREATED_RANGE = "created_at >= COALESCE(${}::timestamp, '-infinity') AND created_at < COALESCE(${}::timestamp, 'infinity')"
+
+# Реестр запросов: текст собирается один раз, PREPARE выполняется лениво на каждом соединении
+STATEMENTS = {
+    'release_detail': f"""
+        SELECT {', '.join('r.' + field for field in RELEASE_FIELDS.split(', '))},
+               COALESCE(json_agg(
+                   json_build_object(
+                       'id', t.id,
+                       'track_name', t.track_name,
+                       'artists', t.artists,
+                       'audio_url', t.audio_url,
+                       'isrc', t.isrc,
+                       'version', t.version,
+                       'musicians', t.musicians,
+                       'lyricists', t.lyricists,
+                       'tiktok_moment', t.tiktok_moment,
+                       'has_explicit', t.has_explicit,
+                       'has_lyrics', t.has_lyrics,
+                       'language', t.language,
+                       'track_order', t.track_order,
+                       'duration_seconds', t.duration_seconds,
+                       'loudness_lufs', t.loudness_lufs,
+                       'peak_dbfs', t.peak_dbfs,
+                       'suggested_tiktok_moment', t.suggested_tiktok_moment,
+                       'analysis_status', t.analysis_status,
+                       'fingerprint_match_track_id', t.fingerprint_match_track_id,
+                       'fingerprint_match_release_id', t.fingerprint_match_release_id,
+                       'fingerprint_match_score', t.fingerprint_match_score
+                   ) ORDER BY t.track_order
+               ) FILTER (WHERE t.id IS NOT NULL), '[]') as tracks
+        FROM {SCHEMA}.releases r
+        LEFT JOIN {SCHEMA}.tracks t ON r.id = t.release_id
+        WHERE r.id = $1 AND r.deleted_at IS NULL
+        GROUP BY r.id, r.created_at
+    """,
+    'release_lyrics': f"""
+        SELECT l.track_id, l.encoding, l.body
+        FROM {SCHEMA}.track_lyrics l
+        JOIN {SCHEMA}.tracks t ON t.id = l.track_id
+        WHERE t.release_id = $1
+    """,
+    'track_lyrics': f"""
+        SELECT t.id AS track_id, l.encoding, l.body
+        FROM {SCHEMA}.tracks t
+        JOIN {SCHEMA}.releases r ON r.id = t.release_id AND r.deleted_at IS NULL
+        LEFT JOIN {SCHEMA}.track_lyrics l ON l.track_id = t.id
+        WHERE t.id = $1
+    """,
+    'list_by_user': f"SELECT {RELEASE_FIELDS} FROM {SCHEMA}.releases WHERE user_id = $1 AND deleted_at IS NULL AND {CREATED_RANGE.format(2, 3)} ORDER BY created_at DESC",
+    'list_by_user_status': f"SELECT {RELEASE_FIELDS} FROM {SCHEMA}.releases WHERE user_id = $1 AND status = $4 AND deleted_at IS NULL AND {CREATED_RANGE.format(2, 3)} ORDER BY created_at DESC",
+    'list_all': f"SELECT {RELEASE_LIST_FIELDS} FROM {SCHEMA}.releases WHERE deleted_at IS NULL AND {CREATED_RANGE.format(1, 2)} ORDER BY created_at DESC",
+    'list_all_status': f"SELECT {RELEASE_LIST_FIELDS} FROM {SCHEMA}.releases WHERE status = $3 AND deleted_at IS NULL AND {CREATED_RANGE.format(1, 2)} ORDER BY created_at DESC",
+    'insert_release': f"""
+        INSERT INTO {SCHEMA}.releases
+        (user_id, album_name, artists, cover_url, upc, old_release_date, release_date, is_rerelease, status)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+        RETURNING {RELEASE_FIELDS}
+    """,
+    'insert_track': f"""
+        INSERT INTO {SCHEMA}.tracks
+        (release_id, track_name, artists, audio_url, isrc, version, musicians, lyricists,
+         tiktok_moment, has_explicit, has_lyrics, language, track_order)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)
+    """,
+    'release_track_ids': f"SELECT id FROM {SCHEMA}.tracks WHERE release_id = $1 FOR UPDATE",
+    'delete_removed_tracks': f"DELETE FROM {SCHEMA}.tracks WHERE release_id = $1 AND id <> ALL($2::int[])",
+    # Удаление только помечает релиз: треки, роялти и связанные заявки снимает задача purge в maintenance.
+    # Запись UPC в реестре остаётся до конца очистки — код освобождается, когда purge удалит сам релиз
+    'delete_release': f"""
+        UPDATE {SCHEMA}.releases SET deleted_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+        WHERE id = $1 AND deleted_at IS NULL
+    """,
+    # На модерацию релиз уходит, только когда у всех треков с аудио посчитано совпадение с каталогом; иначе он остаётся
+    # черновиком с moderation_requested_at до задачи fingerprint_match воркера. Не ждём треки, которые оценки не получат:
+    # с упавшим анализом и с аудио без записи в media_files (старые треки и ссылки, пришедшие мимо uploads)
+    'request_moderation': f"""
+        UPDATE {SCHEMA}.releases r
+        SET status = CASE WHEN p.pending THEN 'draft' ELSE 'on_moderation' END,
+            moderation_requested_at = CASE WHEN p.pending THEN CURRENT_TIMESTAMP END,
+            updated_at = CURRENT_TIMESTAMP
+        FROM (
+            SELECT EXISTS (
+                SELECT 1 FROM {SCHEMA}.tracks t
+                JOIN {SCHEMA}.media_files m ON m.url = t.audio_url
+                WHERE t.release_id = $1 AND t.fingerprint_checked_at IS NULL AND t.analysis_status <> 'failed'
+            ) AS pending
+        ) p
+        WHERE r.id = $1 AND r.deleted_at IS NULL
+        RETURNING {', '.join('r.' + field for field in RELEASE_FIELDS.split(', '))}
+    """,
+    # Смартлинки и промо-заявки автора с UPC релиза фиксируются в момент удаления: purge удалит ровно их
+    'snapshot_purge_dependents': f"""
+        INSERT INTO {SCHEMA}.release_purge_dependents (release_id, entity_type, entity_id)
+        SELECT r.id, c.entity_type, c.entity_id
+        FROM {SCHEMA}.releases r
+        JOIN {SCHEMA}.code_registry c
+            ON c.code_type = 'upc' AND c.code = {SCHEMA}.normalize_code('upc', r.upc)
+           AND c.user_id = r.user_id AND c.entity_type IN ('smartlink', 'promo') AND c.field = 'upc'
+        WHERE r.id = $1
+        ON CONFLICT DO NOTHING
+    """,
+}
+
+# Счётчики переиспользования планов за время жизни тёплого инстанса
+STATEMENT_STATS = {'prepared': 0, 'reused': 0}
+
+_connection = None
+_prepared = set()
 
-def handler(event: dict, context) -> dict:
+def get_db_connection():
+    global _connection
+    if _connection is None or _connection.closed:
+        _connection = psycopg2.connect(os.environ['DATABASE_URL'])
+        _prepared.clear()
+    return _connection
+
+def ensure_prepared(cur, name: str, param_count: int) -> str:
+    if name in _prepared:
+        STATEMENT_STATS['reused'] += 1
+    else:
+        cur.execute(f"PREPARE {name} AS {STATEMENTS[name]}")
+        _prepared.add(name)
+        STATEMENT_STATS['prepared'] += 1
+    if not param_count:
+        return f"EXECUTE {name}"
+    return f"EXECUTE {name} ({', '.join(['%s'] * param_count)})"
+
+def execute_prepared(cur, name: str, params: tuple = ()):
+    cur.execute(ensure_prepared(cur, name, len(params)), params)
+
+# >>> shared: idempotency
+IDEMPOTENCY_TTL_HOURS = 24
+
+def get_idempotency_key(event: dict):
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'idempotency-key' and value:
+            return value
+    return None
+
+def claim_idempotency_key(cur, scope: str, key: str, request_hash: str):
+    """Резервирует ключ в текущей транзакции; если запрос уже выполнялся, возвращает сохранённый ответ"""
+    cur.execute(
+        """INSERT INTO t_p13732906_kedoo_music_platform.idempotency_keys AS k (scope, idempotency_key, request_hash, expires_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP + make_interval(hours => %s))
+        ON CONFLICT (scope, idempotency_key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, status_code = NULL, response_body = NULL,
+            created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at
+        WHERE k.expires_at < CURRENT_TIMESTAMP
+        RETURNING idempotency_key""",
+        (scope, key, request_hash, IDEMPOTENCY_TTL_HOURS)
+    )
+    if cur.fetchone():
+        return None
+    cur.execute(
+        "SELECT request_hash, status_code, response_body FROM t_p13732906_kedoo_music_platform.idempotency_keys WHERE scope = %s AND idempotency_key = %s",
+        (scope, key)
+    )
+    return dict(cur.fetchone())
+
+def store_idempotent_response(cur, scope: str, key: str, status_code: int, response_body: str):
+    cur.execute(
+        "UPDATE t_p13732906_kedoo_music_platform.idempotency_keys SET status_code = %s, response_body = %s WHERE scope = %s AND idempotency_key = %s",
+        (status_code, response_body, scope, key)
+    )
+
+def replay_response(stored: dict, request_hash: str) -> dict:
+    if stored['request_hash'] != request_hash:
+        return {
+            'statusCode': 422,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Idempotency-Key was already used with a different request body'}),
+            'isBase64Encoded': False
+        }
+    return {
+        'statusCode': stored['status_code'],
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Idempotent-Replayed': 'true'},
+        'body': stored['response_body'],
+        'isBase64Encoded': False
+    }
+# <<< shared: idempotency
+
+ISRC_PATTERN = re.compile(r'^[A-Z]{2}[A-Z0-9]{3}[0-9]{7}$')
+
+def normalize_code(code_type: str, value) -> str:
+    """ISRC — верхний регистр без разделителей, UPC/EAN — 13 цифр (как normalize_code в БД)"""
+    if code_type == 'isrc':
+        return re.sub(r'[^A-Za-z0-9]', '', str(value)).upper()
+    return re.sub(r'[\s-]', '', str(value)).zfill(13)
+
+def is_valid_code(code_type: str, code: str) -> bool:
+    if code_type == 'isrc':
+        return bool(ISRC_PATTERN.match(code))
+    if len(code) != 13 or not code.isdigit():
+        return False
+    total = sum(int(digit) * (3 if idx % 2 else 1) for idx, digit in enumerate(code[:12]))
+    return (10 - total % 10) % 10 == int(code[12])
+
+def normalize_codes(items: list) -> list:
+    """Проверяет все коды запроса за один проход и нормализует их на месте.
+    items — [(словарь, поле, тип кода, метка для ответа)]; возвращает список неверных кодов"""
+    invalid = []
+    for container, field, code_type, label in items:
+        value = container.get(field)
+        if value is None or not str(value).strip():
+            continue
+        code = normalize_code(code_type, value)
+        if is_valid_code(code_type, code):
+            # UPC хранится в исходной длине (12 или 13 цифр), до EAN-13 он дополняется только в реестре
+            container[field] = code if code_type == 'isrc' else re.sub(r'[\s-]', '', str(value))
+        else:
+            invalid.append({'field': label, 'value': value})
+    return invalid
+
+def validate_release_codes(body: dict) -> list:
+    """UPC релиза и ISRC всех треков проверяются вместе, чтобы ответ перечислил все ошибки сразу"""
+    tracks = body.get('tracks') or []
+    invalid = normalize_codes([(body, 'upc', 'upc', 'upc')] +
+                              [(track, 'isrc', 'isrc', f'tracks[{idx}].isrc') for idx, track in enumerate(tracks)])
+    seen = set()
+    for idx, track in enumerate(tracks):
+        isrc = track.get('isrc')
+        if isrc and isrc in seen:
+            invalid.append({'field': f'tracks[{idx}].isrc', 'value': isrc, 'duplicate': True})
+        seen.add(isrc)
+    return invalid
+
+def find_upc_owner(cur, upc: str, release_id=None):
+    """Релиз, за которым UPC уже закреплён в реестре; уникальный индекс всё равно не даст записать дубль"""
+    cur.execute(f"""
+        SELECT entity_id FROM {SCHEMA}.code_registry
+        WHERE code_type = 'upc' AND entity_type = 'release' AND code = %s AND entity_id <> %s
+    """, (upc.zfill(13), release_id or 0))
+    row = cur.fetchone()
+    return row['entity_id'] if row else None
+
+def invalid_codes_response(invalid: list) -> dict:
+    return {
+        'statusCode': 400,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'error': 'Invalid ISRC/UPC codes', 'invalid_codes': invalid}),
+        'isBase64Encoded': False
+    }
+
+def upc_conflict_response(release_id) -> dict:
+    return {
+        'statusCode': 409,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'error': 'UPC is already assigned to another release', 'release_id': release_id}),
+        'isBase64Encoded': False
+    }
+
+# Тексты короче порога хранятся как есть: выигрыш от сжатия меньше накладных расходов zlib
+LYRICS_COMPRESS_MIN_BYTES = 256
+
+def encode_lyrics(text: str) -> tuple:
+    raw = text.encode('utf-8')
+    if len(raw) >= LYRICS_COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(raw, 9)
+        if len(compressed) < len(raw):
+            return 'zlib', compressed, len(raw)
+    return 'plain', raw, len(raw)
+
+def decode_lyrics(encoding: str, body) -> str:
+    raw = bytes(body)
+    return (zlib.decompress(raw) if encoding == 'zlib' else raw).decode('utf-8')
+
+def insert_tracks(cur, release_id, tracks: list, orders=None):
+    orders = list(orders or range(1, len(tracks) + 1))
+    rows = [(
+        release_id,
+        track.get('track_name'),
+        track.get('artists'),
+        track.get('audio_url'),
+        track.get('isrc'),
+        track.get('version', 'Original'),
+        track.get('musicians'),
+        track.get('lyricists'),
+        track.get('tiktok_moment'),
+        track.get('has_explicit', False),
+        track.get('has_lyrics', False),
+        track.get('language'),
+        order
+    ) for order, track in zip(orders, tracks)]
+    if rows:
+        execute_batch(cur, ensure_prepared(cur, 'insert_track', len(rows[0])), rows)
+
+    # Тексты пишутся отдельно и привязываются к только что созданным трекам по номеру в релизе
+    lyrics = [(order, *encode_lyrics(track['lyrics'])) for order, track in zip(orders, tracks) if track.get('lyrics')]
+    if lyrics:
+        execute_values(cur, f"""
+            INSERT INTO {SCHEMA}.track_lyrics (track_id, encoding, body, size_bytes)
+            SELECT t.id, v.encoding, v.body, v.size_bytes
+            FROM (VALUES %s) AS v(release_id, track_order, encoding, body, size_bytes)
+            JOIN {SCHEMA}.tracks t ON t.release_id = v.release_id AND t.track_order = v.track_order
+        """, [
+            (release_id, order, encoding, psycopg2.Binary(body), size) for order, encoding, body, size in lyrics
+        ], template='(%s::int, %s::int, %s, %s::bytea, %s::int)')
+
+def sync_tracks(cur, release_id, tracks: list):
+    """Треки с известным id правятся на месте, остальные добавляются, пропавшие из списка удаляются.
+    id, совпадения по отпечаткам и результаты анализа сохраняются; при смене файла они сбрасываются, и воркер
+    считает трек заново. Строки без изменений не переписываются, тексты без ключа lyrics не трогаются"""
+    execute_prepared(cur, 'release_track_ids', (release_id,))
+    existing = {row['id'] for row in cur.fetchall()}
+    kept = [(idx + 1, track) for idx, track in enumerate(tracks) if track.get('id') in existing]
+    added = [(idx + 1, track) for idx, track in enumerate(tracks) if track.get('id') not in existing]
+
+    execute_prepared(cur, 'delete_removed_tracks', (release_id, [track['id'] for _, track in kept]))
+
+    if kept:
+        execute_values(cur, f"""
+            UPDATE {SCHEMA}.tracks t
+            SET track_name = v.track_name, artists = v.artists, audio_url = v.audio_url, isrc = v.isrc,
+                version = v.version, musicians = v.musicians, lyricists = v.lyricists, tiktok_moment = v.tiktok_moment,
+                has_explicit = v.has_explicit, has_lyrics = v.has_lyrics, language = v.language,
+                track_order = v.track_order,
+                analysis_status = CASE WHEN v.new_audio THEN 'pending' ELSE t.analysis_status END,
+                analysis_error = CASE WHEN v.new_audio THEN NULL ELSE t.analysis_error END,
+                analysis_started_at = CASE WHEN v.new_audio THEN NULL ELSE t.analysis_started_at END,
+                analyzed_at = CASE WHEN v.new_audio THEN NULL ELSE t.analyzed_at END,
+                duration_seconds = CASE WHEN v.new_audio THEN NULL ELSE t.duration_seconds END,
+                loudness_lufs = CASE WHEN v.new_audio THEN NULL ELSE t.loudness_lufs END,
+                peak_dbfs = CASE WHEN v.new_audio THEN NULL ELSE t.peak_dbfs END,
+                suggested_tiktok_moment = CASE WHEN v.new_audio THEN NULL ELSE t.suggested_tiktok_moment END,
+                fingerprint_match_track_id = CASE WHEN v.new_audio THEN NULL ELSE t.fingerprint_match_track_id END,
+                fingerprint_match_release_id = CASE WHEN v.new_audio THEN NULL ELSE t.fingerprint_match_release_id END,
+                fingerprint_match_score = CASE WHEN v.new_audio THEN NULL ELSE t.fingerprint_match_score END,
+                fingerprint_checked_at = CASE WHEN v.new_audio THEN NULL ELSE t.fingerprint_checked_at END
+            FROM (
+                SELECT v.*, t.audio_url IS DISTINCT FROM v.audio_url AS new_audio
+                FROM (VALUES %s) AS v(id, release_id, track_name, artists, audio_url, isrc, version, musicians,
+                                      lyricists, tiktok_moment, has_explicit, has_lyrics, language, track_order)
+                JOIN {SCHEMA}.tracks t ON t.id = v.id
+            ) v
+            WHERE t.id = v.id AND t.release_id = v.release_id
+              AND (t.track_name, t.artists, t.audio_url, t.isrc, t.version, t.musicians, t.lyricists, t.tiktok_moment,
+                   t.has_explicit, t.has_lyrics, t.language, t.track_order)
+                  IS DISTINCT FROM
+                  (v.track_name, v.artists, v.audio_url, v.isrc, v.version, v.musicians, v.lyricists, v.tiktok_moment,
+                   v.has_explicit, v.has_lyrics, v.language, v.track_order)
+        """, [(
+            track['id'],
+            release_id,
+            track.get('track_name'),
+            track.get('artists'),
+            track.get('audio_url'),
+            track.get('isrc'),
+            track.get('version', 'Original'),
+            track.get('musicians'),
+            track.get('lyricists'),
+            track.get('tiktok_moment'),
+            track.get('has_explicit', False),
+            track.get('has_lyrics', False),
+            track.get('language'),
+            order
+        ) for order, track in kept], template='(%s::int, %s::int, %s, %s, %s, %s, %s, %s, %s, %s, %s::boolean, %s::boolean, %s, %s::int)')
+
+        lyrics = [(track['id'], *encode_lyrics(track['lyrics'])) for _, track in kept if track.get('lyrics')]
+        if lyrics:
+            execute_values(cur, f"""
+                INSERT INTO {SCHEMA}.track_lyrics AS l (track_id, encoding, body, size_bytes)
+                VALUES %s
+                ON CONFLICT (track_id) DO UPDATE
+                SET encoding = EXCLUDED.encoding, body = EXCLUDED.body, size_bytes = EXCLUDED.size_bytes,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE (l.encoding, l.body) IS DISTINCT FROM (EXCLUDED.encoding, EXCLUDED.body)
+            """, [
+                (track_id, encoding, psycopg2.Binary(body), size) for track_id, encoding, body, size in lyrics
+            ], template='(%s::int, %s, %s::bytea, %s::int)')
+        cleared = [track['id'] for _, track in kept if 'lyrics' in track and not track['lyrics']]
+        if cleared:
+            cur.execute(f"DELETE FROM {SCHEMA}.track_lyrics WHERE track_id = ANY(%s)", (cleared,))
+
+    if added:
+        insert_tracks(cur, release_id, [track for _, track in added], [order for order, _ in added])
+
+# Лимиты запросов по действию: (ёмкость ведра, пополнение токенов в секунду).
+# Переопределяются переменной окружения RATE_LIMITS, например {"POST": [5, 0.01]}
+RATE_LIMITS = {
+    'GET': (120, 2),
+    'POST': (10, 10 / 600),
+    'PUT': (60, 1),
+    'DELETE': (30, 30 / 60),
+}
+RATE_LIMITS.update({action: tuple(limit) for action, limit in json.loads(os.environ.get('RATE_LIMITS', '{}')).items()})
+RATE_LIMIT_SCOPE = 'releases'
+# >>> shared: rate_limit
+RATE_LIMIT_WINDOW_SECONDS = 60
+RATE_LIMIT_SYNC_SECONDS = 10
+
+_buckets = {}
+_pending_hits = {}
+_blocked_until = {}
+_last_rate_limit_sync = 0.0
+
+def get_client_identities(event: dict, user_id=None) -> list:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    identities = []
+    if identity.get('sourceIp'):
+        identities.append(f"ip:{identity['sourceIp']}")
+    if user_id:
+        identities.append(f'user:{user_id}')
+    return identities
+
+def check_rate_limit(action: str, identities: list) -> bool:
+    """Токен-бакет в памяти тёплого инстанса; соединение с БД не требуется"""
+    limit = RATE_LIMITS.get(action)
+    if not limit or not identities:
+        return True
+    capacity, refill_rate = limit
+    now = time.time()
+    keys = [(action, identity) for identity in identities]
+    refilled = {}
+    for key in keys:
+        if _blocked_until.get(key, 0) > now:
+            return False
+        tokens, updated_at = _buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens < 1:
+            _buckets[key] = (tokens, now)
+            return False
+        refilled[key] = tokens
+    window_start = int(now // RATE_LIMIT_WINDOW_SECONDS * RATE_LIMIT_WINDOW_SECONDS)
+    for key, tokens in refilled.items():
+        _buckets[key] = (tokens - 1, now)
+        pending_key = key + (window_start,)
+        _pending_hits[pending_key] = _pending_hits.get(pending_key, 0) + 1
+    return True
+
+def sync_rate_limits(conn):
+    """Пакетно сбрасывает локальные счётчики в общую таблицу и блокирует ключи, превысившие лимит глобально"""
+    global _last_rate_limit_sync
+    now = time.time()
+    if not _pending_hits or now - _last_rate_limit_sync < RATE_LIMIT_SYNC_SECONDS:
+        return
+    _last_rate_limit_sync = now
+    pending = dict(_pending_hits)
+    _pending_hits.clear()
+    try:
+        conn.rollback()
+        with conn.cursor() as cur:
+            rows = execute_values(cur, """
+                INSERT INTO t_p13732906_kedoo_music_platform.rate_limit_counters AS c (scope, bucket_key, window_start, hits)
+                VALUES %s
+                ON CONFLICT (scope, bucket_key, window_start) DO UPDATE SET hits = c.hits + EXCLUDED.hits
+                RETURNING c.scope, c.bucket_key, EXTRACT(EPOCH FROM c.window_start)::BIGINT, c.hits
+            """, [
+                (f'{RATE_LIMIT_SCOPE}:{action}', identity, window_start, hits)
+                for (action, identity, window_start), hits in pending.items()
+            ], template="(%s, %s, to_timestamp(%s) AT TIME ZONE 'UTC', %s)", fetch=True)
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        for key, hits in pending.items():
+            _pending_hits[key] = _pending_hits.get(key, 0) + hits
+        return
+    for scope, identity, window_start, hits in rows:
+        action = scope.split(':', 1)[1]
+        capacity, refill_rate = RATE_LIMITS[action]
+        if hits > capacity + refill_rate * RATE_LIMIT_WINDOW_SECONDS:
+            _blocked_until[(action, identity)] = window_start + RATE_LIMIT_WINDOW_SECONDS
+    for key, (tokens, updated_at) in list(_buckets.items()):
+        capacity, refill_rate = RATE_LIMITS[key[0]]
+        if tokens + (now - updated_at) * refill_rate >= capacity:
+            del _buckets[key]
+    for key, until in list(_blocked_until.items()):
+        if until <= now:
+            del _blocked_until[key]
+
+def rate_limited_response() -> dict:
+    return {
+        'statusCode': 429,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': str(RATE_LIMIT_WINDOW_SECONDS)},
+        'body': json.dumps({'error': 'Too many requests'}),
+        'isBase64Encoded': False
+    }
+# <<< shared: rate_limit
+
+def is_moderator(cur, user_id) -> bool:
+    if not str(user_id or '').isdigit():
+        return False
+    cur.execute(f"SELECT 1 FROM {SCHEMA}.users WHERE id = %s AND role = 'moderator'", (int(user_id),))
+    return cur.fetchone() is not None
+
+def get_request_user_id(event: dict):
+    params = event.get('queryStringParameters') or {}
+    if params.get('user_id'):
+        return params['user_id']
+    try:
+        return json.loads(event.get('body') or '{}').get('user_id')
+    except (ValueError, AttributeError):
+        return None
+
+# >>> shared: compression
+# Сжатие ответа по Accept-Encoding: brotli (если модуль установлен) или gzip, мелкие ответы отдаются как есть.
+# brotli q4 быстрее gzip -6 и даёт меньший ответ; base64 для шлюза съедает треть выигрыша, но JSON сжимается в ~10 раз
+COMPRESS_MIN_BYTES = 1024
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 6
+
+def accepted_encodings(event: dict) -> dict:
+    header = next((v for k, v in (event.get('headers') or {}).items() if k.lower() == 'accept-encoding'), None) or ''
+    encodings = {}
+    for item in header.split(','):
+        name, _, options = item.partition(';')
+        quality = 1.0
+        key, _, value = options.strip().partition('=')
+        if key.strip() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+def compress_response(event: dict, response: dict) -> dict:
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    headers = {**response.get('headers', {}), 'Vary': 'Accept-Encoding'}
+    accepted = accepted_encodings(event)
+    supported = ('br', 'gzip') if brotli else ('gzip',)
+    candidates = [name for name in supported if accepted.get(name, accepted.get('*', 0.0)) > 0]
+    if not candidates:
+        return {**response, 'headers': headers}
+
+    # При равных q выигрывает brotli: max возвращает первый из равных
+    encoding = max(candidates, key=lambda name: accepted.get(name, accepted.get('*', 0.0)))
+    raw = body.encode('utf-8')
+    if encoding == 'br':
+        packed = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        packed = gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    encoded = base64.b64encode(packed).decode('ascii')
+    if len(encoded) >= len(raw):
+        return {**response, 'headers': headers}
+
+    return {
+        **response,
+        'headers': {**headers, 'Content-Encoding': encoding},
+        'body': encoded,
+        'isBase64Encoded': True
+    }
+# <<< shared: compression
+
+def handle_request(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
 
     if method == 'OPTIONS':
@@ -18,13 +580,16 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
 
+    if not check_rate_limit(method, get_client_identities(event, get_request_user_id(event))):
+        return rate_limited_response()
+
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
 
@@ -34,33 +599,57 @@ def handler(event: dict, context) -> dict:
             user_id = params.get('user_id')
             release_id = params.get('release_id')
             status = params.get('status')
+            include = set((params.get('include') or '').split(','))
+
+            # ?stats=statements — сколько планов подготовлено и переиспользовано этим инстансом; только модератору
+            if params.get('stats') == 'statements':
+                if not is_moderator(cur, user_id):
+                    return {
+                        'statusCode': 403,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Moderator access required'}),
+                        'isBase64Encoded': False
+                    }
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'statement_stats': STATEMENT_STATS, 'prepared': sorted(_prepared)}),
+                    'isBase64Encoded': False
+                }
+
+            if params.get('track_id'):
+                if not params['track_id'].isdigit():
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Invalid track_id'}),
+                        'isBase64Encoded': False
+                    }
+
+                # Трек без текста — lyrics: null, несуществующий трек или трек удалённого релиза — 404
+                execute_prepared(cur, 'track_lyrics', (int(params['track_id']),))
+                row = cur.fetchone()
+
+                if not row:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Track not found'}),
+                        'isBase64Encoded': False
+                    }
+
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({
+                        'track_id': row['track_id'],
+                        'lyrics': decode_lyrics(row['encoding'], row['body']) if row['body'] is not None else None
+                    }),
+                    'isBase64Encoded': False
+                }
 
             if release_id:
-                cur.execute(f"""
-                    SELECT r.*,
-                           COALESCE(json_agg(
-                               json_build_object(
-                                   'id', t.id,
-                                   'track_name', t.track_name,
-                                   'artists', t.artists,
-                                   'audio_url', t.audio_url,
-                                   'isrc', t.isrc,
-                                   'version', t.version,
-                                   'musicians', t.musicians,
-                                   'lyricists', t.lyricists,
-                                   'tiktok_moment', t.tiktok_moment,
-                                   'has_explicit', t.has_explicit,
-                                   'has_lyrics', t.has_lyrics,
-                                   'language', t.language,
-                                   'lyrics', t.lyrics,
-                                   'track_order', t.track_order
-                               ) ORDER BY t.track_order
-                           ) FILTER (WHERE t.id IS NOT NULL), '[]') as tracks
-                    FROM {SCHEMA}.releases r
-                    LEFT JOIN {SCHEMA}.tracks t ON r.id = t.release_id
-                    WHERE r.id = %s
-                    GROUP BY r.id
-                """, (release_id,))
+                execute_prepared(cur, 'release_detail', (release_id,))
                 release = cur.fetchone()
 
                 if not release:
@@ -75,6 +664,13 @@ def handler(event: dict, context) -> dict:
                 if isinstance(release.get('tracks'), str):
                     release['tracks'] = json.loads(release['tracks'])
 
+                # Тексты песен — только по запросу ?include=lyrics, в обычной карточке их нет
+                if 'lyrics' in include:
+                    execute_prepared(cur, 'release_lyrics', (release_id,))
+                    lyrics = {row['track_id']: decode_lyrics(row['encoding'], row['body']) for row in cur.fetchall()}
+                    for track in release['tracks']:
+                        track['lyrics'] = lyrics.get(track['id'])
+
                 return {
                     'statusCode': 200,
                     'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -82,19 +678,19 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
 
+            window = [params.get('created_from'), params.get('created_to')]
             if user_id:
-                query = f"SELECT * FROM {SCHEMA}.releases WHERE user_id = %s"
-                query_params = [user_id]
+                statement = 'list_by_user'
+                query_params = [user_id] + window
             else:
-                query = f"SELECT id, user_id, album_name, artists, upc, old_release_date, release_date, is_rerelease, status, rejection_reason, created_at, updated_at FROM {SCHEMA}.releases WHERE 1=1"
-                query_params = []
+                statement = 'list_all'
+                query_params = window
 
             if status:
-                query += " AND status = %s"
+                statement += '_status'
                 query_params.append(status)
 
-            query += " ORDER BY created_at DESC"
-            cur.execute(query, query_params)
+            execute_prepared(cur, statement, tuple(query_params))
             releases = [dict(row) for row in cur.fetchall()]
 
             return {
@@ -107,12 +703,23 @@ def handler(event: dict, context) -> dict:
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
 
-            cur.execute(f"""
-                INSERT INTO {SCHEMA}.releases
-                (user_id, album_name, artists, cover_url, upc, old_release_date, release_date, is_rerelease, status)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-                RETURNING *
-            """, (
+            invalid = validate_release_codes(body)
+            if invalid:
+                return invalid_codes_response(invalid)
+
+            idempotency_key = get_idempotency_key(event)
+            request_hash = hashlib.sha256((event.get('body') or '').encode()).hexdigest()
+            if idempotency_key:
+                stored = claim_idempotency_key(cur, 'releases', idempotency_key, request_hash)
+                if stored:
+                    return replay_response(stored, request_hash)
+
+            owner_id = find_upc_owner(cur, body['upc']) if body.get('upc') else None
+            if owner_id:
+                return upc_conflict_response(owner_id)
+
+            moderation_requested = body.get('status') == 'on_moderation'
+            execute_prepared(cur, 'insert_release', (
                 body.get('user_id'),
                 body.get('album_name'),
                 body.get('artists'),
@@ -121,41 +728,25 @@ def handler(event: dict, context) -> dict:
                 body.get('old_release_date'),
                 body.get('release_date'),
                 body.get('is_rerelease', False),
-                body.get('status', 'draft')
+                'draft' if moderation_requested else body.get('status', 'draft')
             ))
 
             release = dict(cur.fetchone())
 
-            tracks = body.get('tracks', [])
-            for idx, track in enumerate(tracks):
-                cur.execute(f"""
-                    INSERT INTO {SCHEMA}.tracks
-                    (release_id, track_name, artists, audio_url, isrc, version, musicians, lyricists,
-                     tiktok_moment, has_explicit, has_lyrics, language, lyrics, track_order)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    release['id'],
-                    track.get('track_name'),
-                    track.get('artists'),
-                    track.get('audio_url'),
-                    track.get('isrc'),
-                    track.get('version', 'Original'),
-                    track.get('musicians'),
-                    track.get('lyricists'),
-                    track.get('tiktok_moment'),
-                    track.get('has_explicit', False),
-                    track.get('has_lyrics', False),
-                    track.get('language'),
-                    track.get('lyrics'),
-                    idx + 1
-                ))
+            insert_tracks(cur, release['id'], body.get('tracks', []))
+            if moderation_requested:
+                execute_prepared(cur, 'request_moderation', (release['id'],))
+                release = dict(cur.fetchone())
 
+            response_body = json.dumps({'release': release}, default=str)
+            if idempotency_key:
+                store_idempotent_response(cur, 'releases', idempotency_key, 201, response_body)
             conn.commit()
 
             return {
                 'statusCode': 201,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'release': release}, default=str),
+                'body': response_body,
                 'isBase64Encoded': False
             }
 
@@ -171,19 +762,35 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
 
+            invalid = validate_release_codes(body)
+            if invalid:
+                return invalid_codes_response(invalid)
+
+            owner_id = find_upc_owner(cur, body['upc'], release_id) if body.get('upc') else None
+            if owner_id:
+                return upc_conflict_response(owner_id)
+
+            # Автор смены статуса попадает в журнал status_events через триггер (до конца транзакции)
+            if body.get('actor_id'):
+                cur.execute("SELECT set_config('kedoo.actor_id', %s, true)", (str(body['actor_id']),))
+
             updates = []
             params = []
 
+            # Перевод в on_moderation делает request_moderation после записи треков, остальные статусы снимают ожидание
+            moderation_requested = body.get('status') == 'on_moderation'
             fields = ['album_name', 'artists', 'cover_url', 'upc', 'old_release_date',
                        'release_date', 'is_rerelease', 'status', 'rejection_reason']
             for field in fields:
-                if field in body:
+                if field in body and not (field == 'status' and moderation_requested):
                     updates.append(f"{field} = %s")
                     params.append(body[field])
+            if 'status' in body and not moderation_requested:
+                updates.append("moderation_requested_at = NULL")
 
-            if updates:
+            if updates or moderation_requested:
                 params.append(release_id)
-                query = f"UPDATE {SCHEMA}.releases SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING *"
+                query = f"UPDATE {SCHEMA}.releases SET {', '.join(updates + ['updated_at = CURRENT_TIMESTAMP'])} WHERE id = %s AND deleted_at IS NULL RETURNING {RELEASE_FIELDS}"
                 cur.execute(query, params)
                 release = cur.fetchone()
 
@@ -198,29 +805,11 @@ def handler(event: dict, context) -> dict:
                 release = dict(release)
 
                 if 'tracks' in body:
-                    cur.execute(f"DELETE FROM {SCHEMA}.tracks WHERE release_id = %s", (release_id,))
-                    for idx, track in enumerate(body['tracks']):
-                        cur.execute(f"""
-                            INSERT INTO {SCHEMA}.tracks
-                            (release_id, track_name, artists, audio_url, isrc, version, musicians, lyricists,
-                             tiktok_moment, has_explicit, has_lyrics, language, lyrics, track_order)
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                        """, (
-                            release_id,
-                            track.get('track_name'),
-                            track.get('artists'),
-                            track.get('audio_url'),
-                            track.get('isrc'),
-                            track.get('version', 'Original'),
-                            track.get('musicians'),
-                            track.get('lyricists'),
-                            track.get('tiktok_moment'),
-                            track.get('has_explicit', False),
-                            track.get('has_lyrics', False),
-                            track.get('language'),
-                            track.get('lyrics'),
-                            idx + 1
-                        ))
+                    sync_tracks(cur, release_id, body['tracks'])
+
+                if moderation_requested:
+                    execute_prepared(cur, 'request_moderation', (release_id,))
+                    release = dict(cur.fetchone())
 
                 conn.commit()
 
@@ -250,8 +839,9 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
 
-            cur.execute(f"DELETE FROM {SCHEMA}.tracks WHERE release_id = %s", (release_id,))
-            cur.execute(f"DELETE FROM {SCHEMA}.releases WHERE id = %s", (release_id,))
+            execute_prepared(cur, 'delete_release', (release_id,))
+            if cur.rowcount:
+                execute_prepared(cur, 'snapshot_purge_dependents', (release_id,))
             conn.commit()
 
             return {
@@ -269,6 +859,10 @@ def handler(event: dict, context) -> dict:
         }
 
     except Exception as e:
+        # После миграции, поменявшей типы столбцов, подготовленный план отвечает
+        # «cached plan must not change result type» — новое соединение подготовит планы заново
+        if getattr(e, 'pgcode', None) == '0A000':
+            conn.close()
         return {
             'statusCode': 500,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
@@ -277,7 +871,10 @@ def handler(event: dict, context) -> dict:
         }
 
     finally:
-        if 'cur' in locals():
-            cur.close()
-        if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+        cur.close()
+        if not conn.closed:
+            conn.rollback()
+            sync_rate_limits(conn)
+
+def handler(event: dict, context) -> dict:
+    return compress_response(event, handle_request(event, context))
@@ -0,0 +1,188 @@
+"""API отчётов площадок и статистики роялти: регистрация отчёта для фоновой загрузки и агрегаты по месяцам, площадкам и ISRC"""
+import json
+import os
+import re
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+SCHEMA = "t_p13732906_kedoo_music_platform"
+
+PLATFORMS = ('yandex_music', 'vk_music', 'spotify', 'apple_music', 'youtube_music')
+MONTH_RE = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+
+# Группировки статистики: SELECT, GROUP BY и ORDER BY по таблице агрегированных фактов
+STATS_GROUPS = {
+    'month': ("to_char(f.period_month, 'YYYY-MM') AS month", "f.period_month", "f.period_month"),
+    'platform': ("f.platform", "f.platform", "revenue DESC"),
+    'release': ("f.release_id, r.album_name, r.upc", "f.release_id, r.album_name, r.upc", "revenue DESC"),
+    'isrc': ("f.isrc, f.release_id, r.album_name", "f.isrc, f.release_id, r.album_name", "revenue DESC"),
+}
+
+def get_db_connection():
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+def handler(event: dict, context) -> dict:
+    method = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    params = event.get('queryStringParameters') or {}
+
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+
+        if method == 'GET':
+            if params.get('action') == 'reports':
+                query = f"SELECT * FROM {SCHEMA}.royalty_reports WHERE 1=1"
+                query_params = []
+                if params.get('status'):
+                    query += " AND status = %s"
+                    query_params.append(params['status'])
+                if params.get('platform'):
+                    query += " AND platform = %s"
+                    query_params.append(params['platform'])
+                query += " ORDER BY period_month DESC, id DESC"
+                cur.execute(query, query_params)
+                reports = [dict(row) for row in cur.fetchall()]
+
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'reports': reports}, default=str),
+                    'isBase64Encoded': False
+                }
+
+            user_id = params.get('user_id')
+            group_by = params.get('group_by', 'month')
+            date_from = params.get('from')
+            date_to = params.get('to')
+
+            if not user_id or group_by not in STATS_GROUPS or any(v and not MONTH_RE.match(v) for v in (date_from, date_to)):
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Missing user_id or invalid group_by, from or to'}),
+                    'isBase64Encoded': False
+                }
+
+            # Читаются только агрегаты по индексу (user_id, period_month), сырые строки отчётов не хранятся
+            conditions = ["f.user_id = %s"]
+            query_params = [user_id]
+            if date_from:
+                conditions.append("f.period_month >= %s::DATE")
+                query_params.append(f'{date_from}-01')
+            if date_to:
+                conditions.append("f.period_month <= %s::DATE")
+                query_params.append(f'{date_to}-01')
+            if params.get('platform'):
+                conditions.append("f.platform = %s")
+                query_params.append(params['platform'])
+            if params.get('isrc'):
+                conditions.append("f.isrc = %s")
+                query_params.append(re.sub(r'[^A-Z0-9]', '', params['isrc'].upper()))
+
+            select_fields, group_fields, order_fields = STATS_GROUPS[group_by]
+            cur.execute(f"""
+                SELECT {select_fields}, SUM(f.streams) AS streams, SUM(f.revenue) AS revenue
+                FROM {SCHEMA}.royalty_facts f
+                LEFT JOIN {SCHEMA}.releases r ON r.id = f.release_id
+                WHERE {' AND '.join(conditions)}
+                GROUP BY {group_fields}
+                ORDER BY {order_fields}
+            """, query_params)
+            stats = [dict(row) for row in cur.fetchall()]
+            totals = {
+                'streams': sum(row['streams'] for row in stats),
+                'revenue': sum(row['revenue'] for row in stats),
+            }
+
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'stats': stats, 'totals': totals}, default=str),
+                'isBase64Encoded': False
+            }
+
+        elif method == 'POST':
+            body = json.loads(event.get('body', '{}'))
+            upload_id = body.get('upload_id')
+            platform = body.get('platform')
+            period_month = body.get('period_month') or ''
+
+            if not upload_id or platform not in PLATFORMS or not MONTH_RE.match(period_month):
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Missing or invalid upload_id, platform or period_month'}),
+                    'isBase64Encoded': False
+                }
+
+            cur.execute(
+                f"SELECT user_id, content_hash FROM {SCHEMA}.uploads WHERE id = %s AND kind = 'report' AND status = 'completed'",
+                (upload_id,)
+            )
+            upload = cur.fetchone()
+            if not upload:
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Completed report upload not found'}),
+                    'isBase64Encoded': False
+                }
+
+            cur.execute(f"""
+                INSERT INTO {SCHEMA}.royalty_reports (content_hash, platform, period_month, uploaded_by)
+                VALUES (%s, %s, %s::DATE, %s)
+                ON CONFLICT (content_hash) DO NOTHING
+                RETURNING *
+            """, (upload['content_hash'], platform, f'{period_month}-01', upload['user_id']))
+            report = cur.fetchone()
+            conn.commit()
+
+            if not report:
+                return {
+                    'statusCode': 409,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Report already registered'}),
+                    'isBase64Encoded': False
+                }
+
+            return {
+                'statusCode': 201,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'report': dict(report)}, default=str),
+                'isBase64Encoded': False
+            }
+
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            conn.close()
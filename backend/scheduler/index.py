@@ -0,0 +1,113 @@
+"""Планировщик: перевод принятых релизов в статус live в день релиза с отметкой смартлинков и уведомлением артиста"""
+import json
+import os
+import time
+import psycopg2
+from psycopg2.extras import RealDictCursor
+
+SCHEMA = "t_p13732906_kedoo_music_platform"
+
+RELEASE_BATCH_SIZE = int(os.environ.get('RELEASE_BATCH_SIZE', '100'))
+# Запас до таймаута функции: новая пачка не начинается, если время вышло
+RUN_TIME_BUDGET_SECONDS = int(os.environ.get('RUN_TIME_BUDGET_SECONDS', '20'))
+# release_date хранится без часового пояса: «сегодня» считается по времени лейбла
+RELEASE_TIMEZONE = os.environ.get('RELEASE_TIMEZONE', 'Europe/Moscow')
+
+def get_db_connection():
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+def publish_due_releases(conn) -> dict:
+    """Пачками по RELEASE_BATCH_SIZE: одна транзакция на пачку меняет статус, отмечает смартлинки и пишет уведомления.
+    FOR UPDATE SKIP LOCKED позволяет запускать планировщик на нескольких узлах одновременно без двойной обработки"""
+    published, smartlinks, batches = 0, 0, 0
+    deadline = time.monotonic() + RUN_TIME_BUDGET_SECONDS
+
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        while time.monotonic() < deadline:
+            cur.execute(f"""
+                WITH due AS (
+                    SELECT id, created_at
+                    FROM {SCHEMA}.releases
+                    WHERE status = 'accepted' AND release_date <= (CURRENT_TIMESTAMP AT TIME ZONE %s)::DATE AND deleted_at IS NULL
+                    ORDER BY release_date, id
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED
+                ), live AS (
+                    UPDATE {SCHEMA}.releases r
+                    SET status = 'live', live_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                    FROM due
+                    WHERE r.id = due.id AND r.created_at = due.created_at
+                    RETURNING r.id, r.user_id, r.upc, r.album_name, r.artists, r.release_date
+                ), links AS (
+                    UPDATE {SCHEMA}.smartlinks s
+                    SET release_live_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                    FROM live
+                    WHERE s.user_id = live.user_id AND s.upc = live.upc AND s.release_live_at IS NULL
+                    RETURNING s.id, live.id AS release_id
+                ), notified AS (
+                    INSERT INTO {SCHEMA}.notifications (user_id, type, entity_type, entity_id, payload)
+                    SELECT live.user_id, 'release_live', 'release', live.id, jsonb_build_object(
+                        'album_name', live.album_name,
+                        'artists', live.artists,
+                        'release_date', live.release_date,
+                        'smartlink_ids', COALESCE((SELECT jsonb_agg(links.id) FROM links WHERE links.release_id = live.id), '[]'::JSONB)
+                    )
+                    FROM live
+                    RETURNING entity_id
+                )
+                SELECT (SELECT COUNT(*) FROM notified) AS published, (SELECT COUNT(*) FROM links) AS smartlinks
+            """, (RELEASE_TIMEZONE, RELEASE_BATCH_SIZE))
+            row = cur.fetchone()
+            conn.commit()
+
+            batches += 1
+            published += row['published']
+            smartlinks += row['smartlinks']
+            if row['published'] < RELEASE_BATCH_SIZE:
+                break
+
+    return {'published': published, 'smartlinks': smartlinks, 'batches': batches}
+
+TASKS = {
+    'release_dates': publish_due_releases,
+}
+
+# Запускается по таймеру или вручную: ?task=release_dates, без task выполняются все задачи
+def handler(event: dict, context) -> dict:
+    params = event.get('queryStringParameters') or {}
+    task = params.get('task') or event.get('task')
+
+    if task and task not in TASKS:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid task'}),
+            'isBase64Encoded': False
+        }
+
+    conn = get_db_connection()
+
+    try:
+        results = {}
+        for name, run in TASKS.items():
+            if not task or task == name:
+                results[name] = run(conn)
+
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'results': results}, default=str),
+            'isBase64Encoded': False
+        }
+
+    except Exception as e:
+        conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+
+    finally:
+        conn.close()
@@ -1,13 +1,396 @@
-"""API для управления смартлинками"""
+"""API для управления смартлинками и поиска ссылок на релиз по UPC на площадках"""
+import asyncio
+import base64
+import gzip
+import hashlib
 import json
 import os
+import re
+import time
+import aiohttp
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 def get_db_connection():
     return psycopg2.connect(os.environ['DATABASE_URL'])
 
-def handler(event: dict, context) -> dict:
+# >>> shared: idempotency
+IDEMPOTENCY_TTL_HOURS = 24
+
+def get_idempotency_key(event: dict):
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'idempotency-key' and value:
+            return value
+    return None
+
+def claim_idempotency_key(cur, scope: str, key: str, request_hash: str):
+    """Резервирует ключ в текущей транзакции; если запрос уже выполнялся, возвращает сохранённый ответ"""
+    cur.execute(
+        """INSERT INTO t_p13732906_kedoo_music_platform.idempotency_keys AS k (scope, idempotency_key, request_hash, expires_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP + make_interval(hours => %s))
+        ON CONFLICT (scope, idempotency_key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, status_code = NULL, response_body = NULL,
+            created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at
+        WHERE k.expires_at < CURRENT_TIMESTAMP
+        RETURNING idempotency_key""",
+        (scope, key, request_hash, IDEMPOTENCY_TTL_HOURS)
+    )
+    if cur.fetchone():
+        return None
+    cur.execute(
+        "SELECT request_hash, status_code, response_body FROM t_p13732906_kedoo_music_platform.idempotency_keys WHERE scope = %s AND idempotency_key = %s",
+        (scope, key)
+    )
+    return dict(cur.fetchone())
+
+def store_idempotent_response(cur, scope: str, key: str, status_code: int, response_body: str):
+    cur.execute(
+        "UPDATE t_p13732906_kedoo_music_platform.idempotency_keys SET status_code = %s, response_body = %s WHERE scope = %s AND idempotency_key = %s",
+        (status_code, response_body, scope, key)
+    )
+
+def replay_response(stored: dict, request_hash: str) -> dict:
+    if stored['request_hash'] != request_hash:
+        return {
+            'statusCode': 422,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Idempotency-Key was already used with a different request body'}),
+            'isBase64Encoded': False
+        }
+    return {
+        'statusCode': stored['status_code'],
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Idempotent-Replayed': 'true'},
+        'body': stored['response_body'],
+        'isBase64Encoded': False
+    }
+# <<< shared: idempotency
+
+# Лимиты запросов по действию: (ёмкость ведра, пополнение токенов в секунду).
+# Переопределяются переменной окружения RATE_LIMITS, например {"POST": [5, 0.01]}
+RATE_LIMITS = {
+    'GET': (120, 2),
+    'POST': (10, 10 / 600),
+    'PUT': (60, 1),
+}
+RATE_LIMITS.update({action: tuple(limit) for action, limit in json.loads(os.environ.get('RATE_LIMITS', '{}')).items()})
+RATE_LIMIT_SCOPE = 'smartlinks'
+# >>> shared: rate_limit
+RATE_LIMIT_WINDOW_SECONDS = 60
+RATE_LIMIT_SYNC_SECONDS = 10
+
+_buckets = {}
+_pending_hits = {}
+_blocked_until = {}
+_last_rate_limit_sync = 0.0
+
+def get_client_identities(event: dict, user_id=None) -> list:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    identities = []
+    if identity.get('sourceIp'):
+        identities.append(f"ip:{identity['sourceIp']}")
+    if user_id:
+        identities.append(f'user:{user_id}')
+    return identities
+
+def check_rate_limit(action: str, identities: list) -> bool:
+    """Токен-бакет в памяти тёплого инстанса; соединение с БД не требуется"""
+    limit = RATE_LIMITS.get(action)
+    if not limit or not identities:
+        return True
+    capacity, refill_rate = limit
+    now = time.time()
+    keys = [(action, identity) for identity in identities]
+    refilled = {}
+    for key in keys:
+        if _blocked_until.get(key, 0) > now:
+            return False
+        tokens, updated_at = _buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens < 1:
+            _buckets[key] = (tokens, now)
+            return False
+        refilled[key] = tokens
+    window_start = int(now // RATE_LIMIT_WINDOW_SECONDS * RATE_LIMIT_WINDOW_SECONDS)
+    for key, tokens in refilled.items():
+        _buckets[key] = (tokens - 1, now)
+        pending_key = key + (window_start,)
+        _pending_hits[pending_key] = _pending_hits.get(pending_key, 0) + 1
+    return True
+
+def sync_rate_limits(conn):
+    """Пакетно сбрасывает локальные счётчики в общую таблицу и блокирует ключи, превысившие лимит глобально"""
+    global _last_rate_limit_sync
+    now = time.time()
+    if not _pending_hits or now - _last_rate_limit_sync < RATE_LIMIT_SYNC_SECONDS:
+        return
+    _last_rate_limit_sync = now
+    pending = dict(_pending_hits)
+    _pending_hits.clear()
+    try:
+        conn.rollback()
+        with conn.cursor() as cur:
+            rows = execute_values(cur, """
+                INSERT INTO t_p13732906_kedoo_music_platform.rate_limit_counters AS c (scope, bucket_key, window_start, hits)
+                VALUES %s
+                ON CONFLICT (scope, bucket_key, window_start) DO UPDATE SET hits = c.hits + EXCLUDED.hits
+                RETURNING c.scope, c.bucket_key, EXTRACT(EPOCH FROM c.window_start)::BIGINT, c.hits
+            """, [
+                (f'{RATE_LIMIT_SCOPE}:{action}', identity, window_start, hits)
+                for (action, identity, window_start), hits in pending.items()
+            ], template="(%s, %s, to_timestamp(%s) AT TIME ZONE 'UTC', %s)", fetch=True)
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        for key, hits in pending.items():
+            _pending_hits[key] = _pending_hits.get(key, 0) + hits
+        return
+    for scope, identity, window_start, hits in rows:
+        action = scope.split(':', 1)[1]
+        capacity, refill_rate = RATE_LIMITS[action]
+        if hits > capacity + refill_rate * RATE_LIMIT_WINDOW_SECONDS:
+            _blocked_until[(action, identity)] = window_start + RATE_LIMIT_WINDOW_SECONDS
+    for key, (tokens, updated_at) in list(_buckets.items()):
+        capacity, refill_rate = RATE_LIMITS[key[0]]
+        if tokens + (now - updated_at) * refill_rate >= capacity:
+            del _buckets[key]
+    for key, until in list(_blocked_until.items()):
+        if until <= now:
+            del _blocked_until[key]
+
+def rate_limited_response() -> dict:
+    return {
+        'statusCode': 429,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': str(RATE_LIMIT_WINDOW_SECONDS)},
+        'body': json.dumps({'error': 'Too many requests'}),
+        'isBase64Encoded': False
+    }
+# <<< shared: rate_limit
+
+def get_request_user_id(event: dict):
+    params = event.get('queryStringParameters') or {}
+    if params.get('user_id'):
+        return params['user_id']
+    try:
+        return json.loads(event.get('body') or '{}').get('user_id')
+    except (ValueError, AttributeError):
+        return None
+
+# >>> shared: compression
+# Сжатие ответа по Accept-Encoding: brotli (если модуль установлен) или gzip, мелкие ответы отдаются как есть.
+# brotli q4 быстрее gzip -6 и даёт меньший ответ; base64 для шлюза съедает треть выигрыша, но JSON сжимается в ~10 раз
+COMPRESS_MIN_BYTES = 1024
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 6
+
+def accepted_encodings(event: dict) -> dict:
+    header = next((v for k, v in (event.get('headers') or {}).items() if k.lower() == 'accept-encoding'), None) or ''
+    encodings = {}
+    for item in header.split(','):
+        name, _, options = item.partition(';')
+        quality = 1.0
+        key, _, value = options.strip().partition('=')
+        if key.strip() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+def compress_response(event: dict, response: dict) -> dict:
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    headers = {**response.get('headers', {}), 'Vary': 'Accept-Encoding'}
+    accepted = accepted_encodings(event)
+    supported = ('br', 'gzip') if brotli else ('gzip',)
+    candidates = [name for name in supported if accepted.get(name, accepted.get('*', 0.0)) > 0]
+    if not candidates:
+        return {**response, 'headers': headers}
+
+    # При равных q выигрывает brotli: max возвращает первый из равных
+    encoding = max(candidates, key=lambda name: accepted.get(name, accepted.get('*', 0.0)))
+    raw = body.encode('utf-8')
+    if encoding == 'br':
+        packed = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        packed = gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    encoded = base64.b64encode(packed).decode('ascii')
+    if len(encoded) >= len(raw):
+        return {**response, 'headers': headers}
+
+    return {
+        **response,
+        'headers': {**headers, 'Content-Encoding': encoding},
+        'body': encoded,
+        'isBase64Encoded': True
+    }
+# <<< shared: compression
+
+ISRC_PATTERN = re.compile(r'^[A-Z]{2}[A-Z0-9]{3}[0-9]{7}$')
+
+def normalize_code(code_type: str, value) -> str:
+    """ISRC — верхний регистр без разделителей, UPC/EAN — 13 цифр (как normalize_code в БД)"""
+    if code_type == 'isrc':
+        return re.sub(r'[^A-Za-z0-9]', '', str(value)).upper()
+    return re.sub(r'[\s-]', '', str(value)).zfill(13)
+
+def is_valid_code(code_type: str, code: str) -> bool:
+    if code_type == 'isrc':
+        return bool(ISRC_PATTERN.match(code))
+    if len(code) != 13 or not code.isdigit():
+        return False
+    total = sum(int(digit) * (3 if idx % 2 else 1) for idx, digit in enumerate(code[:12]))
+    return (10 - total % 10) % 10 == int(code[12])
+
+def normalize_codes(items: list) -> list:
+    """Проверяет все коды запроса за один проход и нормализует их на месте.
+    items — [(словарь, поле, тип кода, метка для ответа)]; возвращает список неверных кодов"""
+    invalid = []
+    for container, field, code_type, label in items:
+        value = container.get(field)
+        if value is None or not str(value).strip():
+            continue
+        code = normalize_code(code_type, value)
+        if is_valid_code(code_type, code):
+            # UPC хранится в исходной длине (12 или 13 цифр), до EAN-13 он дополняется только в реестре
+            container[field] = code if code_type == 'isrc' else re.sub(r'[\s-]', '', str(value))
+        else:
+            invalid.append({'field': label, 'value': value})
+    return invalid
+
+# Поиск ссылок по UPC: площадки опрашиваются одновременно, автозаполнение занимает время самой медленной из них.
+# Адреса API переопределяются переменными окружения, чтобы проверять резолвер на локальной заглушке
+PLATFORMS = ('yandex_music', 'vk_music', 'spotify', 'apple_music', 'youtube_music')
+DEFAULT_LOOKUP_TIMEOUT_SECONDS = float(os.environ.get('DSP_LOOKUP_TIMEOUT_SECONDS', '5'))
+PLATFORM_TIMEOUTS = {'apple_music': 3.0, 'spotify': 4.0}
+ITUNES_LOOKUP_URL = os.environ.get('ITUNES_LOOKUP_URL', 'https://itunes.apple.com/lookup')
+SPOTIFY_TOKEN_URL = os.environ.get('SPOTIFY_TOKEN_URL', 'https://accounts.spotify.com/api/token')
+SPOTIFY_API_URL = os.environ.get('SPOTIFY_API_URL', 'https://api.spotify.com/v1')
+
+# Найденные ссылки живут в кэше тёплого экземпляра дольше, чем промахи: релиз может появиться на площадке позже
+LINK_CACHE_TTL_SECONDS = 6 * 3600
+LINK_CACHE_MISS_TTL_SECONDS = 15 * 60
+LINK_CACHE_MAX_ENTRIES = 10000
+
+_link_cache = {}
+_spotify_token = {'value': None, 'expires_at': 0.0}
+
+class LookupNotConfigured(Exception):
+    pass
+
+def upc_variants(upc: str) -> list:
+    """UPC-A (12 цифр) и EAN-13 с ведущим нулём — один код; площадки могут знать релиз под любой из двух записей.
+    Смартлинк хранит UPC в исходной длине, поэтому вторая форма строится из любой"""
+    if len(upc) == 12:
+        return [upc, '0' + upc]
+    if len(upc) == 13 and upc.startswith('0'):
+        return [upc, upc[1:]]
+    return [upc]
+
+async def fetch_apple_music(session, upc: str):
+    for code in upc_variants(upc):
+        async with session.get(ITUNES_LOOKUP_URL, params={'upc': code, 'entity': 'album'}) as response:
+            response.raise_for_status()
+            data = await response.json(content_type=None)
+        for item in data.get('results') or []:
+            if item.get('collectionViewUrl'):
+                return item['collectionViewUrl'].split('?')[0]
+    return None
+
+async def get_spotify_token(session) -> str:
+    if _spotify_token['value'] and _spotify_token['expires_at'] > time.monotonic():
+        return _spotify_token['value']
+    client_id = os.environ.get('SPOTIFY_CLIENT_ID')
+    client_secret = os.environ.get('SPOTIFY_CLIENT_SECRET')
+    if not client_id or not client_secret:
+        raise LookupNotConfigured()
+    async with session.post(SPOTIFY_TOKEN_URL, data={'grant_type': 'client_credentials'},
+                            auth=aiohttp.BasicAuth(client_id, client_secret)) as response:
+        response.raise_for_status()
+        data = await response.json()
+    _spotify_token['value'] = data['access_token']
+    _spotify_token['expires_at'] = time.monotonic() + int(data.get('expires_in', 3600)) - 60
+    return _spotify_token['value']
+
+async def fetch_spotify(session, upc: str):
+    token = await get_spotify_token(session)
+    for code in upc_variants(upc):
+        async with session.get(f'{SPOTIFY_API_URL}/search', params={'q': f'upc:{code}', 'type': 'album', 'limit': '1'},
+                               headers={'Authorization': f'Bearer {token}'}) as response:
+            response.raise_for_status()
+            data = await response.json()
+        items = (data.get('albums') or {}).get('items') or []
+        if items:
+            return items[0]['external_urls']['spotify']
+    return None
+
+def url_template_fetcher(platform: str):
+    """Площадки без публичного поиска по UPC: DSP_LOOKUP_URL_<PLATFORM> с {upc} должен вернуть JSON {"url": ...}"""
+    async def fetch(session, upc: str):
+        template = os.environ.get(f'DSP_LOOKUP_URL_{platform.upper()}')
+        if not template:
+            raise LookupNotConfigured()
+        for code in upc_variants(upc):
+            async with session.get(template.format(upc=code)) as response:
+                if response.status == 404:
+                    continue
+                response.raise_for_status()
+                data = await response.json(content_type=None)
+            if data.get('url'):
+                return data['url']
+        return None
+    return fetch
+
+# Площадка -> корутина (session, upc) -> URL или None
+PLATFORM_FETCHERS = {
+    'yandex_music': url_template_fetcher('yandex_music'),
+    'vk_music': url_template_fetcher('vk_music'),
+    'spotify': fetch_spotify,
+    'apple_music': fetch_apple_music,
+    'youtube_music': url_template_fetcher('youtube_music'),
+}
+
+def cache_link(platform: str, upc: str, url):
+    if len(_link_cache) >= LINK_CACHE_MAX_ENTRIES:
+        _link_cache.pop(next(iter(_link_cache)))
+    ttl = LINK_CACHE_TTL_SECONDS if url else LINK_CACHE_MISS_TTL_SECONDS
+    _link_cache[(platform, upc)] = (time.monotonic() + ttl, url)
+
+async def resolve_platform(session, platform: str, upc: str, use_cache: bool) -> tuple:
+    cached = _link_cache.get((platform, upc))
+    if use_cache and cached and cached[0] > time.monotonic():
+        return platform, {'status': 'found' if cached[1] else 'not_found', 'url': cached[1], 'cached': True}
+
+    timeout = PLATFORM_TIMEOUTS.get(platform, DEFAULT_LOOKUP_TIMEOUT_SECONDS)
+    try:
+        url = await asyncio.wait_for(PLATFORM_FETCHERS[platform](session, upc), timeout)
+    except LookupNotConfigured:
+        return platform, {'status': 'not_configured'}
+    except asyncio.TimeoutError:
+        return platform, {'status': 'timeout'}
+    except Exception as e:
+        return platform, {'status': 'error', 'error': str(e)[:200]}
+
+    # Таймауты и ошибки не кэшируются: следующий запрос спросит площадку снова
+    cache_link(platform, upc, url)
+    return platform, {'status': 'found' if url else 'not_found', 'url': url, 'cached': False}
+
+async def resolve_platform_links(upc: str, platforms: list, use_cache: bool = True) -> dict:
+    # Ключ кэша один для 12- и 13-значной записи кода
+    upc = normalize_code('upc', upc)
+    async with aiohttp.ClientSession() as session:
+        results = await asyncio.gather(*(resolve_platform(session, platform, upc, use_cache) for platform in platforms))
+    return dict(results)
+
+def handle_request(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -16,13 +399,16 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
+    if not check_rate_limit(method, get_client_identities(event, get_request_user_id(event))):
+        return rate_limited_response()
+    
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
@@ -46,7 +432,7 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
-            base_fields = "id, user_id, release_name, artists, upc, status, rejection_reason, smartlink_url, created_at, updated_at"
+            base_fields = "id, user_id, release_name, artists, upc, status, rejection_reason, smartlink_url, platform_links, cover_thumbnails, created_at, updated_at"
             query = f"SELECT {base_fields} FROM t_p13732906_kedoo_music_platform.smartlinks WHERE 1=1"
             params = []
             
@@ -75,7 +461,6 @@ def handler(event: dict, context) -> dict:
             release_name = body.get('release_name')
             artists = body.get('artists')
             cover_url = body.get('cover_url')
-            upc = body.get('upc')
             
             if not all([user_id, release_name, artists]):
                 return {
@@ -85,6 +470,23 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
+            invalid = normalize_codes([(body, 'upc', 'upc', 'upc')])
+            if invalid:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Invalid ISRC/UPC codes', 'invalid_codes': invalid}),
+                    'isBase64Encoded': False
+                }
+            upc = body.get('upc')
+            
+            idempotency_key = get_idempotency_key(event)
+            request_hash = hashlib.sha256((event.get('body') or '').encode()).hexdigest()
+            if idempotency_key:
+                stored = claim_idempotency_key(cur, 'smartlinks', idempotency_key, request_hash)
+                if stored:
+                    return replay_response(stored, request_hash)
+            
             status = body.get('status', 'on_moderation')
             cur.execute(
                 """INSERT INTO t_p13732906_kedoo_music_platform.smartlinks 
@@ -94,12 +496,15 @@ def handler(event: dict, context) -> dict:
                 (user_id, release_name, artists, cover_url, upc, status)
             )
             smartlink = dict(cur.fetchone())
+            response_body = json.dumps({'smartlink': smartlink}, default=str)
+            if idempotency_key:
+                store_idempotent_response(cur, 'smartlinks', idempotency_key, 201, response_body)
             conn.commit()
             
             return {
                 'statusCode': 201,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'smartlink': smartlink}, default=str),
+                'body': response_body,
                 'isBase64Encoded': False
             }
         
@@ -115,6 +520,62 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
+            if body.get('action') == 'resolve_links':
+                platforms = body.get('platforms') or list(PLATFORMS)
+                if not isinstance(platforms, list) or any(platform not in PLATFORMS for platform in platforms):
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Invalid platforms'}),
+                        'isBase64Encoded': False
+                    }
+                
+                cur.execute("SELECT id, upc FROM t_p13732906_kedoo_music_platform.smartlinks WHERE id = %s", (smartlink_id,))
+                smartlink = cur.fetchone()
+                if not smartlink or not smartlink['upc']:
+                    return {
+                        'statusCode': 404 if not smartlink else 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Smartlink not found' if not smartlink else 'Smartlink has no UPC'}),
+                        'isBase64Encoded': False
+                    }
+                # Транзакция не остаётся открытой, пока идут запросы к площадкам
+                conn.commit()
+                
+                results = asyncio.run(resolve_platform_links(smartlink['upc'], platforms, not body.get('force')))
+                links = {platform: result['url'] for platform, result in results.items() if result.get('url')}
+                
+                # Найденное дополняет ссылки, внесённые вручную; ненайденные площадки не затирают старые значения
+                cur.execute("""
+                    UPDATE t_p13732906_kedoo_music_platform.smartlinks
+                    SET platform_links = COALESCE(platform_links, '{}'::JSONB) || %s::JSONB,
+                        platform_links_resolved_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                    RETURNING *
+                """, (json.dumps(links), smartlink_id))
+                smartlink = cur.fetchone()
+                conn.commit()
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'smartlink': dict(smartlink) if smartlink else None, 'platforms': results}, default=str),
+                    'isBase64Encoded': False
+                }
+            
+            # Автор смены статуса попадает в журнал status_events через триггер (до конца транзакции)
+            if body.get('actor_id'):
+                cur.execute("SELECT set_config('kedoo.actor_id', %s, true)", (str(body['actor_id']),))
+            
+            invalid = normalize_codes([(body, 'upc', 'upc', 'upc')])
+            if invalid:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Invalid ISRC/UPC codes', 'invalid_codes': invalid}),
+                    'isBase64Encoded': False
+                }
+            
             updates = []
             params = []
             
@@ -177,4 +638,8 @@ def handler(event: dict, context) -> dict:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            sync_rate_limits(conn)
+            conn.close()
+
+def handler(event: dict, context) -> dict:
+    return compress_response(event, handle_request(event, context))
@@ -1,13 +1,284 @@
 """API для работы со студией: промо-релизы, видео, аккаунты платформ"""
+import base64
+import gzip
+import hashlib
 import json
 import os
+import re
+import time
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 def get_db_connection():
     return psycopg2.connect(os.environ['DATABASE_URL'])
 
-def handler(event: dict, context) -> dict:
+# Списки не читают длинные описания: они отдаются по ?include=<поле> или в карточке по id
+STUDIO_LIST_FIELDS = {
+    'promo': "id, user_id, upc, key_track_isrc, key_track_name, artists, smartlink_url, status, rejection_reason, created_at, updated_at",
+    'video': "*",
+    'platform': "id, user_id, platform, latest_release_upc, upcoming_release_upc, artist_photo_url, artist_video_url, links, "
+                "youtube_channel_url, youtube_artist_card_url, status, rejection_reason, created_at, updated_at",
+}
+# Описания остаются TEXT: длинные значения уже сжимает TOAST, а из списков они не читаются вовсе
+STUDIO_TEXT_FIELDS = {
+    'promo': ('release_description', 'key_track_description'),
+    'video': (),
+    'platform': ('artist_description',),
+}
+
+# >>> shared: idempotency
+IDEMPOTENCY_TTL_HOURS = 24
+
+def get_idempotency_key(event: dict):
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'idempotency-key' and value:
+            return value
+    return None
+
+def claim_idempotency_key(cur, scope: str, key: str, request_hash: str):
+    """Резервирует ключ в текущей транзакции; если запрос уже выполнялся, возвращает сохранённый ответ"""
+    cur.execute(
+        """INSERT INTO t_p13732906_kedoo_music_platform.idempotency_keys AS k (scope, idempotency_key, request_hash, expires_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP + make_interval(hours => %s))
+        ON CONFLICT (scope, idempotency_key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, status_code = NULL, response_body = NULL,
+            created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at
+        WHERE k.expires_at < CURRENT_TIMESTAMP
+        RETURNING idempotency_key""",
+        (scope, key, request_hash, IDEMPOTENCY_TTL_HOURS)
+    )
+    if cur.fetchone():
+        return None
+    cur.execute(
+        "SELECT request_hash, status_code, response_body FROM t_p13732906_kedoo_music_platform.idempotency_keys WHERE scope = %s AND idempotency_key = %s",
+        (scope, key)
+    )
+    return dict(cur.fetchone())
+
+def store_idempotent_response(cur, scope: str, key: str, status_code: int, response_body: str):
+    cur.execute(
+        "UPDATE t_p13732906_kedoo_music_platform.idempotency_keys SET status_code = %s, response_body = %s WHERE scope = %s AND idempotency_key = %s",
+        (status_code, response_body, scope, key)
+    )
+
+def replay_response(stored: dict, request_hash: str) -> dict:
+    if stored['request_hash'] != request_hash:
+        return {
+            'statusCode': 422,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Idempotency-Key was already used with a different request body'}),
+            'isBase64Encoded': False
+        }
+    return {
+        'statusCode': stored['status_code'],
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Idempotent-Replayed': 'true'},
+        'body': stored['response_body'],
+        'isBase64Encoded': False
+    }
+# <<< shared: idempotency
+
+# Лимиты запросов по действию: (ёмкость ведра, пополнение токенов в секунду).
+# Переопределяются переменной окружения RATE_LIMITS, например {"POST": [5, 0.01]}
+RATE_LIMITS = {
+    'GET': (120, 2),
+    'POST': (10, 10 / 600),
+    'PUT': (60, 1),
+}
+RATE_LIMITS.update({action: tuple(limit) for action, limit in json.loads(os.environ.get('RATE_LIMITS', '{}')).items()})
+RATE_LIMIT_SCOPE = 'studio'
+# >>> shared: rate_limit
+RATE_LIMIT_WINDOW_SECONDS = 60
+RATE_LIMIT_SYNC_SECONDS = 10
+
+_buckets = {}
+_pending_hits = {}
+_blocked_until = {}
+_last_rate_limit_sync = 0.0
+
+def get_client_identities(event: dict, user_id=None) -> list:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    identities = []
+    if identity.get('sourceIp'):
+        identities.append(f"ip:{identity['sourceIp']}")
+    if user_id:
+        identities.append(f'user:{user_id}')
+    return identities
+
+def check_rate_limit(action: str, identities: list) -> bool:
+    """Токен-бакет в памяти тёплого инстанса; соединение с БД не требуется"""
+    limit = RATE_LIMITS.get(action)
+    if not limit or not identities:
+        return True
+    capacity, refill_rate = limit
+    now = time.time()
+    keys = [(action, identity) for identity in identities]
+    refilled = {}
+    for key in keys:
+        if _blocked_until.get(key, 0) > now:
+            return False
+        tokens, updated_at = _buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens < 1:
+            _buckets[key] = (tokens, now)
+            return False
+        refilled[key] = tokens
+    window_start = int(now // RATE_LIMIT_WINDOW_SECONDS * RATE_LIMIT_WINDOW_SECONDS)
+    for key, tokens in refilled.items():
+        _buckets[key] = (tokens - 1, now)
+        pending_key = key + (window_start,)
+        _pending_hits[pending_key] = _pending_hits.get(pending_key, 0) + 1
+    return True
+
+def sync_rate_limits(conn):
+    """Пакетно сбрасывает локальные счётчики в общую таблицу и блокирует ключи, превысившие лимит глобально"""
+    global _last_rate_limit_sync
+    now = time.time()
+    if not _pending_hits or now - _last_rate_limit_sync < RATE_LIMIT_SYNC_SECONDS:
+        return
+    _last_rate_limit_sync = now
+    pending = dict(_pending_hits)
+    _pending_hits.clear()
+    try:
+        conn.rollback()
+        with conn.cursor() as cur:
+            rows = execute_values(cur, """
+                INSERT INTO t_p13732906_kedoo_music_platform.rate_limit_counters AS c (scope, bucket_key, window_start, hits)
+                VALUES %s
+                ON CONFLICT (scope, bucket_key, window_start) DO UPDATE SET hits = c.hits + EXCLUDED.hits
+                RETURNING c.scope, c.bucket_key, EXTRACT(EPOCH FROM c.window_start)::BIGINT, c.hits
+            """, [
+                (f'{RATE_LIMIT_SCOPE}:{action}', identity, window_start, hits)
+                for (action, identity, window_start), hits in pending.items()
+            ], template="(%s, %s, to_timestamp(%s) AT TIME ZONE 'UTC', %s)", fetch=True)
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        for key, hits in pending.items():
+            _pending_hits[key] = _pending_hits.get(key, 0) + hits
+        return
+    for scope, identity, window_start, hits in rows:
+        action = scope.split(':', 1)[1]
+        capacity, refill_rate = RATE_LIMITS[action]
+        if hits > capacity + refill_rate * RATE_LIMIT_WINDOW_SECONDS:
+            _blocked_until[(action, identity)] = window_start + RATE_LIMIT_WINDOW_SECONDS
+    for key, (tokens, updated_at) in list(_buckets.items()):
+        capacity, refill_rate = RATE_LIMITS[key[0]]
+        if tokens + (now - updated_at) * refill_rate >= capacity:
+            del _buckets[key]
+    for key, until in list(_blocked_until.items()):
+        if until <= now:
+            del _blocked_until[key]
+
+def rate_limited_response() -> dict:
+    return {
+        'statusCode': 429,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': str(RATE_LIMIT_WINDOW_SECONDS)},
+        'body': json.dumps({'error': 'Too many requests'}),
+        'isBase64Encoded': False
+    }
+# <<< shared: rate_limit
+
+def get_request_user_id(event: dict):
+    params = event.get('queryStringParameters') or {}
+    if params.get('user_id'):
+        return params['user_id']
+    try:
+        return json.loads(event.get('body') or '{}').get('user_id')
+    except (ValueError, AttributeError):
+        return None
+
+# >>> shared: compression
+# Сжатие ответа по Accept-Encoding: brotli (если модуль установлен) или gzip, мелкие ответы отдаются как есть.
+# brotli q4 быстрее gzip -6 и даёт меньший ответ; base64 для шлюза съедает треть выигрыша, но JSON сжимается в ~10 раз
+COMPRESS_MIN_BYTES = 1024
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 6
+
+def accepted_encodings(event: dict) -> dict:
+    header = next((v for k, v in (event.get('headers') or {}).items() if k.lower() == 'accept-encoding'), None) or ''
+    encodings = {}
+    for item in header.split(','):
+        name, _, options = item.partition(';')
+        quality = 1.0
+        key, _, value = options.strip().partition('=')
+        if key.strip() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+def compress_response(event: dict, response: dict) -> dict:
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    headers = {**response.get('headers', {}), 'Vary': 'Accept-Encoding'}
+    accepted = accepted_encodings(event)
+    supported = ('br', 'gzip') if brotli else ('gzip',)
+    candidates = [name for name in supported if accepted.get(name, accepted.get('*', 0.0)) > 0]
+    if not candidates:
+        return {**response, 'headers': headers}
+
+    # При равных q выигрывает brotli: max возвращает первый из равных
+    encoding = max(candidates, key=lambda name: accepted.get(name, accepted.get('*', 0.0)))
+    raw = body.encode('utf-8')
+    if encoding == 'br':
+        packed = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        packed = gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    encoded = base64.b64encode(packed).decode('ascii')
+    if len(encoded) >= len(raw):
+        return {**response, 'headers': headers}
+
+    return {
+        **response,
+        'headers': {**headers, 'Content-Encoding': encoding},
+        'body': encoded,
+        'isBase64Encoded': True
+    }
+# <<< shared: compression
+
+ISRC_PATTERN = re.compile(r'^[A-Z]{2}[A-Z0-9]{3}[0-9]{7}$')
+
+def normalize_code(code_type: str, value) -> str:
+    """ISRC — верхний регистр без разделителей, UPC/EAN — 13 цифр (как normalize_code в БД)"""
+    if code_type == 'isrc':
+        return re.sub(r'[^A-Za-z0-9]', '', str(value)).upper()
+    return re.sub(r'[\s-]', '', str(value)).zfill(13)
+
+def is_valid_code(code_type: str, code: str) -> bool:
+    if code_type == 'isrc':
+        return bool(ISRC_PATTERN.match(code))
+    if len(code) != 13 or not code.isdigit():
+        return False
+    total = sum(int(digit) * (3 if idx % 2 else 1) for idx, digit in enumerate(code[:12]))
+    return (10 - total % 10) % 10 == int(code[12])
+
+def normalize_codes(items: list) -> list:
+    """Проверяет все коды запроса за один проход и нормализует их на месте.
+    items — [(словарь, поле, тип кода, метка для ответа)]; возвращает список неверных кодов"""
+    invalid = []
+    for container, field, code_type, label in items:
+        value = container.get(field)
+        if value is None or not str(value).strip():
+            continue
+        code = normalize_code(code_type, value)
+        if is_valid_code(code_type, code):
+            # UPC хранится в исходной длине (12 или 13 цифр), до EAN-13 он дополняется только в реестре
+            container[field] = code if code_type == 'isrc' else re.sub(r'[\s-]', '', str(value))
+        else:
+            invalid.append({'field': label, 'value': value})
+    return invalid
+
+def handle_request(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -16,13 +287,16 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
+    if not check_rate_limit(method, get_client_identities(event, get_request_user_id(event))):
+        return rate_limited_response()
+    
     conn = get_db_connection()
     cur = conn.cursor(cursor_factory=RealDictCursor)
     
@@ -59,7 +333,11 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
-            query = f"SELECT * FROM {table} WHERE 1=1"
+            include = (params.get('include') or '').split(',')
+            fields = STUDIO_LIST_FIELDS[entity_type] + ''.join(
+                f", {field}" for field in STUDIO_TEXT_FIELDS[entity_type] if field in include
+            )
+            query = f"SELECT {fields} FROM {table} WHERE 1=1"
             query_params = []
             
             if user_id:
@@ -70,6 +348,14 @@ def handler(event: dict, context) -> dict:
                 query += " AND status = %s"
                 query_params.append(status)
             
+            if params.get('created_from'):
+                query += " AND created_at >= %s"
+                query_params.append(params['created_from'])
+            
+            if params.get('created_to'):
+                query += " AND created_at < %s"
+                query_params.append(params['created_to'])
+            
             query += " ORDER BY created_at DESC"
             cur.execute(query, query_params)
             entities = [dict(row) for row in cur.fetchall()]
@@ -93,6 +379,28 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
+            # Все коды заявки проверяются одним проходом до записи
+            invalid = normalize_codes([
+                (body, 'upc', 'upc', 'upc'),
+                (body, 'key_track_isrc', 'isrc', 'key_track_isrc'),
+                (body, 'latest_release_upc', 'upc', 'latest_release_upc'),
+                (body, 'upcoming_release_upc', 'upc', 'upcoming_release_upc'),
+            ])
+            if invalid:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Invalid ISRC/UPC codes', 'invalid_codes': invalid}),
+                    'isBase64Encoded': False
+                }
+            
+            idempotency_key = get_idempotency_key(event)
+            request_hash = hashlib.sha256((event.get('body') or '').encode()).hexdigest()
+            if idempotency_key:
+                stored = claim_idempotency_key(cur, f'studio:{entity_type}', idempotency_key, request_hash)
+                if stored:
+                    return replay_response(stored, request_hash)
+            
             if entity_type == 'promo':
                 cur.execute(
                     """INSERT INTO t_p13732906_kedoo_music_platform.promo_releases 
@@ -138,12 +446,15 @@ def handler(event: dict, context) -> dict:
                 }
             
             entity = dict(cur.fetchone())
+            response_body = json.dumps({entity_type: entity}, default=str)
+            if idempotency_key:
+                store_idempotent_response(cur, f'studio:{entity_type}', idempotency_key, 201, response_body)
             conn.commit()
             
             return {
                 'statusCode': 201,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({entity_type: entity}, default=str),
+                'body': response_body,
                 'isBase64Encoded': False
             }
         
@@ -176,6 +487,10 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
+            # Автор смены статуса попадает в журнал status_events через триггер (до конца транзакции)
+            if body.get('actor_id'):
+                cur.execute("SELECT set_config('kedoo.actor_id', %s, true)", (str(body['actor_id']),))
+            
             updates = []
             query_params = []
             
@@ -235,4 +550,8 @@ def handler(event: dict, context) -> dict:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            sync_rate_limits(conn)
+            conn.close()
+
+def handler(event: dict, context) -> dict:
+    return compress_response(event, handle_request(event, context))
@@ -1,13 +1,249 @@
 """API для системы тикетов"""
+import base64
+import gzip
+import hashlib
 import json
 import os
+import time
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import RealDictCursor, execute_values
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 def get_db_connection():
     return psycopg2.connect(os.environ['DATABASE_URL'])
 
-def handler(event: dict, context) -> dict:
+# Список не читает тексты обращений: они отдаются по ?include=message,moderator_response или в карточке тикета
+TICKET_LIST_FIELDS = ("t.id, t.user_id, t.subject, t.status, t.moderator_response IS NOT NULL AS has_response, "
+                      "t.last_message_id, t.last_message_at, t.unread_user, t.unread_moderator, t.created_at, t.updated_at")
+TICKET_TEXT_FIELDS = ('message', 'moderator_response')
+
+# Переписка читается по ключу (ticket_id, id): since_id — новые сообщения после последнего виденного, before_id — более ранние.
+# Тексты сообщений хранятся как TEXT без сжатия на стороне функции, в отличие от track_lyrics: сообщения в основном
+# короче порога zlib в 256 байт, а длинные Postgres сам сжимает в TOAST
+MESSAGES_PAGE_SIZE = 50
+MESSAGES_MAX_PAGE_SIZE = 200
+AUTHOR_ROLES = ('user', 'moderator')
+
+# >>> shared: idempotency
+IDEMPOTENCY_TTL_HOURS = 24
+
+def get_idempotency_key(event: dict):
+    for name, value in (event.get('headers') or {}).items():
+        if name.lower() == 'idempotency-key' and value:
+            return value
+    return None
+
+def claim_idempotency_key(cur, scope: str, key: str, request_hash: str):
+    """Резервирует ключ в текущей транзакции; если запрос уже выполнялся, возвращает сохранённый ответ"""
+    cur.execute(
+        """INSERT INTO t_p13732906_kedoo_music_platform.idempotency_keys AS k (scope, idempotency_key, request_hash, expires_at)
+        VALUES (%s, %s, %s, CURRENT_TIMESTAMP + make_interval(hours => %s))
+        ON CONFLICT (scope, idempotency_key) DO UPDATE
+        SET request_hash = EXCLUDED.request_hash, status_code = NULL, response_body = NULL,
+            created_at = CURRENT_TIMESTAMP, expires_at = EXCLUDED.expires_at
+        WHERE k.expires_at < CURRENT_TIMESTAMP
+        RETURNING idempotency_key""",
+        (scope, key, request_hash, IDEMPOTENCY_TTL_HOURS)
+    )
+    if cur.fetchone():
+        return None
+    cur.execute(
+        "SELECT request_hash, status_code, response_body FROM t_p13732906_kedoo_music_platform.idempotency_keys WHERE scope = %s AND idempotency_key = %s",
+        (scope, key)
+    )
+    return dict(cur.fetchone())
+
+def store_idempotent_response(cur, scope: str, key: str, status_code: int, response_body: str):
+    cur.execute(
+        "UPDATE t_p13732906_kedoo_music_platform.idempotency_keys SET status_code = %s, response_body = %s WHERE scope = %s AND idempotency_key = %s",
+        (status_code, response_body, scope, key)
+    )
+
+def replay_response(stored: dict, request_hash: str) -> dict:
+    if stored['request_hash'] != request_hash:
+        return {
+            'statusCode': 422,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Idempotency-Key was already used with a different request body'}),
+            'isBase64Encoded': False
+        }
+    return {
+        'statusCode': stored['status_code'],
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Idempotent-Replayed': 'true'},
+        'body': stored['response_body'],
+        'isBase64Encoded': False
+    }
+# <<< shared: idempotency
+
+# Лимиты запросов по действию: (ёмкость ведра, пополнение токенов в секунду).
+# Переопределяются переменной окружения RATE_LIMITS, например {"POST": [5, 0.01]}
+RATE_LIMITS = {
+    'GET': (120, 2),
+    'POST': (5, 5 / 600),
+    'PUT': (60, 1),
+}
+RATE_LIMITS.update({action: tuple(limit) for action, limit in json.loads(os.environ.get('RATE_LIMITS', '{}')).items()})
+RATE_LIMIT_SCOPE = 'tickets'
+# >>> shared: rate_limit
+RATE_LIMIT_WINDOW_SECONDS = 60
+RATE_LIMIT_SYNC_SECONDS = 10
+
+_buckets = {}
+_pending_hits = {}
+_blocked_until = {}
+_last_rate_limit_sync = 0.0
+
+def get_client_identities(event: dict, user_id=None) -> list:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    identities = []
+    if identity.get('sourceIp'):
+        identities.append(f"ip:{identity['sourceIp']}")
+    if user_id:
+        identities.append(f'user:{user_id}')
+    return identities
+
+def check_rate_limit(action: str, identities: list) -> bool:
+    """Токен-бакет в памяти тёплого инстанса; соединение с БД не требуется"""
+    limit = RATE_LIMITS.get(action)
+    if not limit or not identities:
+        return True
+    capacity, refill_rate = limit
+    now = time.time()
+    keys = [(action, identity) for identity in identities]
+    refilled = {}
+    for key in keys:
+        if _blocked_until.get(key, 0) > now:
+            return False
+        tokens, updated_at = _buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens < 1:
+            _buckets[key] = (tokens, now)
+            return False
+        refilled[key] = tokens
+    window_start = int(now // RATE_LIMIT_WINDOW_SECONDS * RATE_LIMIT_WINDOW_SECONDS)
+    for key, tokens in refilled.items():
+        _buckets[key] = (tokens - 1, now)
+        pending_key = key + (window_start,)
+        _pending_hits[pending_key] = _pending_hits.get(pending_key, 0) + 1
+    return True
+
+def sync_rate_limits(conn):
+    """Пакетно сбрасывает локальные счётчики в общую таблицу и блокирует ключи, превысившие лимит глобально"""
+    global _last_rate_limit_sync
+    now = time.time()
+    if not _pending_hits or now - _last_rate_limit_sync < RATE_LIMIT_SYNC_SECONDS:
+        return
+    _last_rate_limit_sync = now
+    pending = dict(_pending_hits)
+    _pending_hits.clear()
+    try:
+        conn.rollback()
+        with conn.cursor() as cur:
+            rows = execute_values(cur, """
+                INSERT INTO t_p13732906_kedoo_music_platform.rate_limit_counters AS c (scope, bucket_key, window_start, hits)
+                VALUES %s
+                ON CONFLICT (scope, bucket_key, window_start) DO UPDATE SET hits = c.hits + EXCLUDED.hits
+                RETURNING c.scope, c.bucket_key, EXTRACT(EPOCH FROM c.window_start)::BIGINT, c.hits
+            """, [
+                (f'{RATE_LIMIT_SCOPE}:{action}', identity, window_start, hits)
+                for (action, identity, window_start), hits in pending.items()
+            ], template="(%s, %s, to_timestamp(%s) AT TIME ZONE 'UTC', %s)", fetch=True)
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        for key, hits in pending.items():
+            _pending_hits[key] = _pending_hits.get(key, 0) + hits
+        return
+    for scope, identity, window_start, hits in rows:
+        action = scope.split(':', 1)[1]
+        capacity, refill_rate = RATE_LIMITS[action]
+        if hits > capacity + refill_rate * RATE_LIMIT_WINDOW_SECONDS:
+            _blocked_until[(action, identity)] = window_start + RATE_LIMIT_WINDOW_SECONDS
+    for key, (tokens, updated_at) in list(_buckets.items()):
+        capacity, refill_rate = RATE_LIMITS[key[0]]
+        if tokens + (now - updated_at) * refill_rate >= capacity:
+            del _buckets[key]
+    for key, until in list(_blocked_until.items()):
+        if until <= now:
+            del _blocked_until[key]
+
+def rate_limited_response() -> dict:
+    return {
+        'statusCode': 429,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': str(RATE_LIMIT_WINDOW_SECONDS)},
+        'body': json.dumps({'error': 'Too many requests'}),
+        'isBase64Encoded': False
+    }
+# <<< shared: rate_limit
+
+def get_request_user_id(event: dict):
+    params = event.get('queryStringParameters') or {}
+    if params.get('user_id'):
+        return params['user_id']
+    try:
+        return json.loads(event.get('body') or '{}').get('user_id')
+    except (ValueError, AttributeError):
+        return None
+
+# >>> shared: compression
+# Сжатие ответа по Accept-Encoding: brotli (если модуль установлен) или gzip, мелкие ответы отдаются как есть.
+# brotli q4 быстрее gzip -6 и даёт меньший ответ; base64 для шлюза съедает треть выигрыша, но JSON сжимается в ~10 раз
+COMPRESS_MIN_BYTES = 1024
+BROTLI_QUALITY = 4
+GZIP_LEVEL = 6
+
+def accepted_encodings(event: dict) -> dict:
+    header = next((v for k, v in (event.get('headers') or {}).items() if k.lower() == 'accept-encoding'), None) or ''
+    encodings = {}
+    for item in header.split(','):
+        name, _, options = item.partition(';')
+        quality = 1.0
+        key, _, value = options.strip().partition('=')
+        if key.strip() == 'q':
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        if name.strip():
+            encodings[name.strip().lower()] = quality
+    return encodings
+
+def compress_response(event: dict, response: dict) -> dict:
+    body = response.get('body')
+    if response.get('isBase64Encoded') or not isinstance(body, str) or len(body) < COMPRESS_MIN_BYTES:
+        return response
+
+    headers = {**response.get('headers', {}), 'Vary': 'Accept-Encoding'}
+    accepted = accepted_encodings(event)
+    supported = ('br', 'gzip') if brotli else ('gzip',)
+    candidates = [name for name in supported if accepted.get(name, accepted.get('*', 0.0)) > 0]
+    if not candidates:
+        return {**response, 'headers': headers}
+
+    # При равных q выигрывает brotli: max возвращает первый из равных
+    encoding = max(candidates, key=lambda name: accepted.get(name, accepted.get('*', 0.0)))
+    raw = body.encode('utf-8')
+    if encoding == 'br':
+        packed = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        packed = gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    encoded = base64.b64encode(packed).decode('ascii')
+    if len(encoded) >= len(raw):
+        return {**response, 'headers': headers}
+
+    return {
+        **response,
+        'headers': {**headers, 'Content-Encoding': encoding},
+        'body': encoded,
+        'isBase64Encoded': True
+    }
+# <<< shared: compression
+
+def handle_request(event: dict, context) -> dict:
     method = event.get('httpMethod', 'GET')
     
     if method == 'OPTIONS':
@@ -16,13 +252,16 @@ def handler(event: dict, context) -> dict:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type',
+                'Access-Control-Allow-Headers': 'Content-Type, Idempotency-Key',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
+    if not check_rate_limit(method, get_client_identities(event, get_request_user_id(event))):
+        return rate_limited_response()
+    
     try:
         conn = get_db_connection()
         cur = conn.cursor(cursor_factory=RealDictCursor)
@@ -33,6 +272,60 @@ def handler(event: dict, context) -> dict:
             ticket_id = params.get('ticket_id')
             status = params.get('status')
             
+            if params.get('action') == 'unread':
+                # Частичные индексы по unread_* > 0: сводка не трогает прочитанные тикеты
+                if user_id:
+                    cur.execute("""
+                        SELECT COUNT(*) AS tickets, COALESCE(SUM(unread_user), 0) AS messages
+                        FROM t_p13732906_kedoo_music_platform.tickets
+                        WHERE user_id = %s AND unread_user > 0
+                    """, (user_id,))
+                else:
+                    cur.execute("""
+                        SELECT COUNT(*) AS tickets, COALESCE(SUM(unread_moderator), 0) AS messages
+                        FROM t_p13732906_kedoo_music_platform.tickets
+                        WHERE unread_moderator > 0
+                    """)
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'unread': dict(cur.fetchone())}),
+                    'isBase64Encoded': False
+                }
+            
+            if ticket_id and params.get('action') == 'messages':
+                try:
+                    limit = min(int(params.get('limit') or MESSAGES_PAGE_SIZE), MESSAGES_MAX_PAGE_SIZE)
+                except ValueError:
+                    limit = MESSAGES_PAGE_SIZE
+                
+                if params.get('before_id'):
+                    cur.execute("""
+                        SELECT * FROM t_p13732906_kedoo_music_platform.ticket_messages
+                        WHERE ticket_id = %s AND id < %s
+                        ORDER BY id DESC
+                        LIMIT %s
+                    """, (ticket_id, params['before_id'], limit + 1))
+                    rows = cur.fetchall()
+                    messages = [dict(row) for row in reversed(rows[:limit])]
+                else:
+                    cur.execute("""
+                        SELECT * FROM t_p13732906_kedoo_music_platform.ticket_messages
+                        WHERE ticket_id = %s AND id > %s
+                        ORDER BY id
+                        LIMIT %s
+                    """, (ticket_id, params.get('since_id') or 0, limit + 1))
+                    rows = cur.fetchall()
+                    messages = [dict(row) for row in rows[:limit]]
+                
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'messages': messages, 'has_more': len(rows) > limit}, default=str),
+                    'isBase64Encoded': False
+                }
+            
             if ticket_id:
                 cur.execute("SELECT * FROM t_p13732906_kedoo_music_platform.tickets WHERE id = %s", (ticket_id,))
                 ticket = cur.fetchone()
@@ -52,7 +345,9 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
-            query = "SELECT t.*, u.username, u.email FROM t_p13732906_kedoo_music_platform.tickets t JOIN t_p13732906_kedoo_music_platform.users u ON t.user_id = u.id WHERE 1=1"
+            include = (params.get('include') or '').split(',')
+            fields = TICKET_LIST_FIELDS + ''.join(f", t.{field}" for field in TICKET_TEXT_FIELDS if field in include)
+            query = f"SELECT {fields}, u.username, u.email FROM t_p13732906_kedoo_music_platform.tickets t JOIN t_p13732906_kedoo_music_platform.users u ON t.user_id = u.id WHERE 1=1"
             query_params = []
             
             if user_id:
@@ -63,7 +358,15 @@ def handler(event: dict, context) -> dict:
                 query += " AND status = %s"
                 query_params.append(status)
             
-            query += " ORDER BY created_at DESC"
+            if params.get('created_from'):
+                query += " AND t.created_at >= %s"
+                query_params.append(params['created_from'])
+            
+            if params.get('created_to'):
+                query += " AND t.created_at < %s"
+                query_params.append(params['created_to'])
+            
+            query += " ORDER BY t.created_at DESC"
             
             cur.execute(query, query_params)
             tickets = [dict(row) for row in cur.fetchall()]
@@ -78,6 +381,50 @@ def handler(event: dict, context) -> dict:
         elif method == 'POST':
             body = json.loads(event.get('body', '{}'))
             
+            if body.get('ticket_id'):
+                # Ответ в существующий тикет; счётчики непрочитанного обновляет триггер trg_ticket_messages_unread
+                if not body.get('message') or body.get('author_role') not in AUTHOR_ROLES:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Missing message or invalid author_role'}),
+                        'isBase64Encoded': False
+                    }
+                
+                idempotency_key = get_idempotency_key(event)
+                request_hash = hashlib.sha256((event.get('body') or '').encode()).hexdigest()
+                if idempotency_key:
+                    stored = claim_idempotency_key(cur, 'ticket_messages', idempotency_key, request_hash)
+                    if stored:
+                        return replay_response(stored, request_hash)
+                
+                cur.execute("""
+                    INSERT INTO t_p13732906_kedoo_music_platform.ticket_messages (ticket_id, author_id, author_role, body)
+                    SELECT id, %s, %s, %s FROM t_p13732906_kedoo_music_platform.tickets WHERE id = %s
+                    RETURNING *
+                """, (body.get('author_id'), body['author_role'], body['message'], body['ticket_id']))
+                message = cur.fetchone()
+                
+                if not message:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Ticket not found'}),
+                        'isBase64Encoded': False
+                    }
+                
+                response_body = json.dumps({'message': dict(message)}, default=str)
+                if idempotency_key:
+                    store_idempotent_response(cur, 'ticket_messages', idempotency_key, 201, response_body)
+                conn.commit()
+                
+                return {
+                    'statusCode': 201,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': response_body,
+                    'isBase64Encoded': False
+                }
+            
             if not body.get('user_id') or not body.get('subject') or not body.get('message'):
                 return {
                     'statusCode': 400,
@@ -86,6 +433,13 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
+            idempotency_key = get_idempotency_key(event)
+            request_hash = hashlib.sha256((event.get('body') or '').encode()).hexdigest()
+            if idempotency_key:
+                stored = claim_idempotency_key(cur, 'tickets', idempotency_key, request_hash)
+                if stored:
+                    return replay_response(stored, request_hash)
+            
             cur.execute("""
                 INSERT INTO t_p13732906_kedoo_music_platform.tickets (user_id, subject, message, status)
                 VALUES (%s, %s, %s, %s)
@@ -98,12 +452,19 @@ def handler(event: dict, context) -> dict:
             ))
             
             ticket = dict(cur.fetchone())
+            cur.execute("""
+                INSERT INTO t_p13732906_kedoo_music_platform.ticket_messages (ticket_id, author_id, author_role, body, created_at)
+                VALUES (%s, %s, 'user', %s, %s)
+            """, (ticket['id'], ticket['user_id'], ticket['message'], ticket['created_at']))
+            response_body = json.dumps({'ticket': ticket}, default=str)
+            if idempotency_key:
+                store_idempotent_response(cur, 'tickets', idempotency_key, 201, response_body)
             conn.commit()
             
             return {
                 'statusCode': 201,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'ticket': ticket}, default=str),
+                'body': response_body,
                 'isBase64Encoded': False
             }
         
@@ -119,6 +480,55 @@ def handler(event: dict, context) -> dict:
                     'isBase64Encoded': False
                 }
             
+            if body.get('action') == 'read':
+                # Прочитано до last_read_id (по умолчанию — всё); остаток считается по первичному ключу переписки
+                role = body.get('role')
+                if role not in AUTHOR_ROLES:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Invalid role'}),
+                        'isBase64Encoded': False
+                    }
+                
+                other_role = 'moderator' if role == 'user' else 'user'
+                cur.execute(f"""
+                    UPDATE t_p13732906_kedoo_music_platform.tickets t
+                    SET {role}_read_id = r.read_id,
+                        unread_{role} = (
+                            SELECT COUNT(*) FROM t_p13732906_kedoo_music_platform.ticket_messages m
+                            WHERE m.ticket_id = t.id AND m.id > r.read_id AND m.author_role = %s
+                        )
+                    FROM (
+                        SELECT id, GREATEST({role}_read_id, LEAST(COALESCE(%s, last_message_id), last_message_id)) AS read_id
+                        FROM t_p13732906_kedoo_music_platform.tickets
+                        WHERE id = %s
+                    ) r
+                    WHERE t.id = r.id
+                    RETURNING t.id, t.last_message_id, t.{role}_read_id AS read_id, t.unread_{role} AS unread
+                """, (other_role, body.get('last_read_id'), ticket_id))
+                ticket = cur.fetchone()
+                
+                if not ticket:
+                    return {
+                        'statusCode': 404,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Ticket not found'}),
+                        'isBase64Encoded': False
+                    }
+                
+                conn.commit()
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'ticket': dict(ticket)}),
+                    'isBase64Encoded': False
+                }
+            
+            # Автор смены статуса попадает в журнал status_events через триггер (до конца транзакции)
+            if body.get('actor_id'):
+                cur.execute("SELECT set_config('kedoo.actor_id', %s, true)", (str(body['actor_id']),))
+            
             updates = []
             params = []
             
@@ -135,6 +545,12 @@ def handler(event: dict, context) -> dict:
                 query = f"UPDATE t_p13732906_kedoo_music_platform.tickets SET {', '.join(updates)}, updated_at = CURRENT_TIMESTAMP WHERE id = %s RETURNING *"
                 cur.execute(query, params)
                 ticket = dict(cur.fetchone())
+                # Ответ модератора через старое поле продолжает переписку, а не затирает её
+                if body.get('moderator_response'):
+                    cur.execute("""
+                        INSERT INTO t_p13732906_kedoo_music_platform.ticket_messages (ticket_id, author_id, author_role, body)
+                        VALUES (%s, %s, 'moderator', %s)
+                    """, (ticket_id, body.get('actor_id'), body['moderator_response']))
                 conn.commit()
                 
                 return {
@@ -170,4 +586,8 @@ def handler(event: dict, context) -> dict:
         if 'cur' in locals():
             cur.close()
         if 'conn' in locals():
-            conn.close()
\ No newline at end of file
+            sync_rate_limits(conn)
+            conn.close()
+
+def handler(event: dict, context) -> dict:
+    return compress_response(event, handle_request(event, context))
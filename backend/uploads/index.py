@@ -0,0 +1,556 @@
+"""API для загрузки аудио, обложек и отчётов площадок: возобновляемая загрузка по частям с дедупликацией по хешу содержимого"""
+import base64
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
+
+SCHEMA = "t_p13732906_kedoo_music_platform"
+
+# Размер части фиксирован: хеш содержимого считается как SHA-256 от списка SHA-256 частей,
+# поэтому одинаковые файлы дают одинаковый хеш только при одинаковом разбиении.
+# 5 МБ — минимальный размер части multipart-загрузки в S3.
+CHUNK_SIZE = 5 * 1024 * 1024
+
+UPLOAD_KINDS = {
+    'audio': {'extensions': ('.wav', '.flac'), 'max_size': 2 * 1024 ** 3},
+    'cover': {'extensions': ('.jpg', '.jpeg', '.png'), 'max_size': 20 * 1024 ** 2},
+    'report': {'extensions': ('.csv', '.tsv', '.txt', '.csv.gz', '.tsv.gz', '.txt.gz'), 'max_size': 10 * 1024 ** 3},
+}
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 's3')
+
+def get_db_connection():
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+# Лимиты запросов по действию: (ёмкость ведра, пополнение токенов в секунду). Части идут по одной на запрос,
+# поэтому лимит PUT рассчитан на 2 ГБ мастер (410 частей) без пауз.
+# Переопределяются переменной окружения RATE_LIMITS, например {"init": [5, 0.01]}
+RATE_LIMITS = {
+    'GET': (120, 2),
+    'PUT': (600, 10),
+    'DELETE': (30, 0.5),
+    'init': (20, 20 / 3600),
+    'complete': (20, 20 / 600),
+}
+RATE_LIMITS.update({action: tuple(limit) for action, limit in json.loads(os.environ.get('RATE_LIMITS', '{}')).items()})
+RATE_LIMIT_SCOPE = 'uploads'
+# >>> shared: rate_limit
+RATE_LIMIT_WINDOW_SECONDS = 60
+RATE_LIMIT_SYNC_SECONDS = 10
+
+_buckets = {}
+_pending_hits = {}
+_blocked_until = {}
+_last_rate_limit_sync = 0.0
+
+def get_client_identities(event: dict, user_id=None) -> list:
+    identity = (event.get('requestContext') or {}).get('identity') or {}
+    identities = []
+    if identity.get('sourceIp'):
+        identities.append(f"ip:{identity['sourceIp']}")
+    if user_id:
+        identities.append(f'user:{user_id}')
+    return identities
+
+def check_rate_limit(action: str, identities: list) -> bool:
+    """Токен-бакет в памяти тёплого инстанса; соединение с БД не требуется"""
+    limit = RATE_LIMITS.get(action)
+    if not limit or not identities:
+        return True
+    capacity, refill_rate = limit
+    now = time.time()
+    keys = [(action, identity) for identity in identities]
+    refilled = {}
+    for key in keys:
+        if _blocked_until.get(key, 0) > now:
+            return False
+        tokens, updated_at = _buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+        if tokens < 1:
+            _buckets[key] = (tokens, now)
+            return False
+        refilled[key] = tokens
+    window_start = int(now // RATE_LIMIT_WINDOW_SECONDS * RATE_LIMIT_WINDOW_SECONDS)
+    for key, tokens in refilled.items():
+        _buckets[key] = (tokens - 1, now)
+        pending_key = key + (window_start,)
+        _pending_hits[pending_key] = _pending_hits.get(pending_key, 0) + 1
+    return True
+
+def sync_rate_limits(conn):
+    """Пакетно сбрасывает локальные счётчики в общую таблицу и блокирует ключи, превысившие лимит глобально"""
+    global _last_rate_limit_sync
+    now = time.time()
+    if not _pending_hits or now - _last_rate_limit_sync < RATE_LIMIT_SYNC_SECONDS:
+        return
+    _last_rate_limit_sync = now
+    pending = dict(_pending_hits)
+    _pending_hits.clear()
+    try:
+        conn.rollback()
+        with conn.cursor() as cur:
+            rows = execute_values(cur, """
+                INSERT INTO t_p13732906_kedoo_music_platform.rate_limit_counters AS c (scope, bucket_key, window_start, hits)
+                VALUES %s
+                ON CONFLICT (scope, bucket_key, window_start) DO UPDATE SET hits = c.hits + EXCLUDED.hits
+                RETURNING c.scope, c.bucket_key, EXTRACT(EPOCH FROM c.window_start)::BIGINT, c.hits
+            """, [
+                (f'{RATE_LIMIT_SCOPE}:{action}', identity, window_start, hits)
+                for (action, identity, window_start), hits in pending.items()
+            ], template="(%s, %s, to_timestamp(%s) AT TIME ZONE 'UTC', %s)", fetch=True)
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        for key, hits in pending.items():
+            _pending_hits[key] = _pending_hits.get(key, 0) + hits
+        return
+    for scope, identity, window_start, hits in rows:
+        action = scope.split(':', 1)[1]
+        capacity, refill_rate = RATE_LIMITS[action]
+        if hits > capacity + refill_rate * RATE_LIMIT_WINDOW_SECONDS:
+            _blocked_until[(action, identity)] = window_start + RATE_LIMIT_WINDOW_SECONDS
+    for key, (tokens, updated_at) in list(_buckets.items()):
+        capacity, refill_rate = RATE_LIMITS[key[0]]
+        if tokens + (now - updated_at) * refill_rate >= capacity:
+            del _buckets[key]
+    for key, until in list(_blocked_until.items()):
+        if until <= now:
+            del _blocked_until[key]
+
+def rate_limited_response() -> dict:
+    return {
+        'statusCode': 429,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', 'Retry-After': str(RATE_LIMIT_WINDOW_SECONDS)},
+        'body': json.dumps({'error': 'Too many requests'}),
+        'isBase64Encoded': False
+    }
+# <<< shared: rate_limit
+
+class LocalStorage:
+    """Хранилище на локальной файловой системе (тесты и локальная разработка)"""
+
+    def __init__(self, root: str, public_url: str):
+        self.root = root
+        self.public_url = public_url.rstrip('/')
+
+    def _part_path(self, upload_id: str, index: int) -> str:
+        return os.path.join(self.root, '.parts', upload_id, f'{index:06d}')
+
+    def start(self, key: str, content_type: str):
+        return None
+
+    def write_part(self, upload_id: str, storage_upload_id, key: str, index: int, data: bytes) -> str:
+        path = self._part_path(upload_id, index)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+        return hashlib.md5(data).hexdigest()
+
+    def complete(self, upload_id: str, storage_upload_id, key: str, parts: list):
+        target = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target + '.tmp', 'wb') as out:
+            for part in parts:
+                with open(self._part_path(upload_id, part['chunk_index']), 'rb') as f:
+                    shutil.copyfileobj(f, out, 1024 * 1024)
+        os.replace(target + '.tmp', target)
+        shutil.rmtree(os.path.join(self.root, '.parts', upload_id), ignore_errors=True)
+
+    def abort(self, upload_id: str, storage_upload_id, key: str):
+        shutil.rmtree(os.path.join(self.root, '.parts', upload_id), ignore_errors=True)
+
+    def url(self, key: str) -> str:
+        return f'{self.public_url}/{key}'
+
+class S3Storage:
+    """S3-совместимое хранилище: каждая часть загружается как часть multipart-загрузки"""
+
+    def __init__(self, bucket: str, public_url: str):
+        import boto3
+        self.client = boto3.client(
+            's3',
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev'),
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+        )
+        self.bucket = bucket
+        self.public_url = public_url.rstrip('/')
+
+    def start(self, key: str, content_type: str):
+        response = self.client.create_multipart_upload(Bucket=self.bucket, Key=key, ContentType=content_type)
+        return response['UploadId']
+
+    def write_part(self, upload_id: str, storage_upload_id, key: str, index: int, data: bytes) -> str:
+        response = self.client.upload_part(
+            Bucket=self.bucket, Key=key, UploadId=storage_upload_id, PartNumber=index + 1, Body=data
+        )
+        return response['ETag']
+
+    def complete(self, upload_id: str, storage_upload_id, key: str, parts: list):
+        self.client.complete_multipart_upload(
+            Bucket=self.bucket, Key=key, UploadId=storage_upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': p['chunk_index'] + 1, 'ETag': p['etag']} for p in parts]}
+        )
+
+    def abort(self, upload_id: str, storage_upload_id, key: str):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=key, UploadId=storage_upload_id)
+
+    def url(self, key: str) -> str:
+        return f'{self.public_url}/{key}'
+
+def get_storage():
+    if STORAGE_BACKEND == 'local':
+        return LocalStorage(
+            os.environ.get('LOCAL_STORAGE_ROOT', '/tmp/kedoo-media'),
+            os.environ.get('LOCAL_STORAGE_URL', '/media')
+        )
+    return S3Storage(
+        os.environ.get('S3_BUCKET', 'files'),
+        os.environ.get('PUBLIC_MEDIA_URL', f"https://cdn.poehali.dev/projects/{os.environ.get('AWS_ACCESS_KEY_ID')}/bucket")
+    )
+
+def has_valid_signature(kind: str, data: bytes) -> bool:
+    if kind == 'audio':
+        return (data[:4] == b'RIFF' and data[8:12] == b'WAVE') or data[:4] == b'fLaC'
+    if kind == 'report':
+        # gzip или текст: в текстовом отчёте не бывает нулевых байтов
+        return data[:2] == b'\x1f\x8b' or b'\x00' not in data[:65536]
+    return data[:3] == b'\xff\xd8\xff' or data[:8] == b'\x89PNG\r\n\x1a\n'
+
+def safe_filename(filename: str) -> str:
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', os.path.basename(filename))[:200] or 'file'
+
+def read_chunk_body(event: dict) -> bytes:
+    body = event.get('body') or ''
+    if isinstance(body, bytes):
+        return body
+    return base64.b64decode(body)
+
+def handler(event: dict, context) -> dict:
+    method = event.get('httpMethod', 'GET')
+
+    if method == 'OPTIONS':
+        return {
+            'statusCode': 200,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Chunk-Sha256',
+                'Access-Control-Max-Age': '86400'
+            },
+            'body': '',
+            'isBase64Encoded': False
+        }
+
+    params = event.get('queryStringParameters') or {}
+    if method in RATE_LIMITS and not check_rate_limit(method, get_client_identities(event)):
+        return rate_limited_response()
+
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor(cursor_factory=RealDictCursor)
+
+        if method == 'GET':
+            upload_id = params.get('upload_id')
+            if not upload_id:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Missing upload_id'}),
+                    'isBase64Encoded': False
+                }
+
+            cur.execute(f"SELECT * FROM {SCHEMA}.uploads WHERE id = %s", (upload_id,))
+            upload = cur.fetchone()
+            if not upload:
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Upload not found'}),
+                    'isBase64Encoded': False
+                }
+
+            upload = dict(upload)
+            upload.pop('storage_upload_id')
+            cur.execute(
+                f"SELECT chunk_index FROM {SCHEMA}.upload_chunks WHERE upload_id = %s ORDER BY chunk_index",
+                (upload_id,)
+            )
+            upload['received_chunks'] = [row['chunk_index'] for row in cur.fetchall()]
+
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'upload': upload}, default=str),
+                'isBase64Encoded': False
+            }
+
+        elif method == 'POST':
+            body = json.loads(event.get('body', '{}'))
+            action = body.get('action')
+            if action in RATE_LIMITS and not check_rate_limit(action, get_client_identities(event, body.get('user_id'))):
+                return rate_limited_response()
+
+            if action == 'init':
+                user_id = body.get('user_id')
+                kind = body.get('kind')
+                filename = body.get('filename') or ''
+                total_size = body.get('total_size')
+
+                if not user_id or kind not in UPLOAD_KINDS or not filename or not isinstance(total_size, int) or total_size <= 0:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Missing or invalid user_id, kind, filename or total_size'}),
+                        'isBase64Encoded': False
+                    }
+
+                rules = UPLOAD_KINDS[kind]
+                if not filename.lower().endswith(rules['extensions']) or total_size > rules['max_size']:
+                    return {
+                        'statusCode': 400,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Unsupported file type or file too large'}),
+                        'isBase64Encoded': False
+                    }
+
+                upload_id = str(uuid.uuid4())
+                content_type = body.get('content_type') or 'application/octet-stream'
+                storage_key = f'{kind}/{upload_id}/{safe_filename(filename)}'
+                storage_upload_id = get_storage().start(storage_key, content_type)
+
+                cur.execute(f"""
+                    INSERT INTO {SCHEMA}.uploads
+                    (id, user_id, kind, filename, content_type, total_size, chunk_size, chunk_count,
+                     storage_key, storage_upload_id, release_id, track_id)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    RETURNING id, user_id, kind, filename, content_type, total_size, chunk_size, chunk_count,
+                              release_id, track_id, status, created_at
+                """, (
+                    upload_id, user_id, kind, filename, content_type, total_size, CHUNK_SIZE,
+                    -(-total_size // CHUNK_SIZE), storage_key, storage_upload_id,
+                    body.get('release_id'), body.get('track_id')
+                ))
+                upload = dict(cur.fetchone())
+                conn.commit()
+
+                return {
+                    'statusCode': 201,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'upload': upload}, default=str),
+                    'isBase64Encoded': False
+                }
+
+            elif action == 'complete':
+                upload_id = body.get('upload_id')
+                cur.execute(f"SELECT * FROM {SCHEMA}.uploads WHERE id = %s FOR UPDATE", (upload_id,))
+                upload = cur.fetchone()
+
+                if not upload or upload['status'] != 'uploading':
+                    return {
+                        'statusCode': 404 if not upload else 409,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Upload not found' if not upload else f"Upload is {upload['status']}"}),
+                        'isBase64Encoded': False
+                    }
+
+                cur.execute(
+                    f"SELECT chunk_index, size_bytes, sha256, etag FROM {SCHEMA}.upload_chunks WHERE upload_id = %s ORDER BY chunk_index",
+                    (upload_id,)
+                )
+                parts = [dict(row) for row in cur.fetchall()]
+                received = {part['chunk_index'] for part in parts}
+                missing = [i for i in range(upload['chunk_count']) if i not in received]
+
+                if missing:
+                    return {
+                        'statusCode': 409,
+                        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                        'body': json.dumps({'error': 'Upload is incomplete', 'missing_chunks': missing}),
+                        'isBase64Encoded': False
+                    }
+
+                tree_hash = hashlib.sha256()
+                for part in parts:
+                    tree_hash.update(bytes.fromhex(part['sha256']))
+                content_hash = tree_hash.hexdigest()
+
+                storage = get_storage()
+                # Одинаковые загрузки завершаются по очереди: без блокировки обе не видят файла, обе собирают объект,
+                # и объект проигравшего в ON CONFLICT остаётся в хранилище без строки media_files (сборщик его не найдёт)
+                cur.execute("SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))", (content_hash,))
+                cur.execute(f"SELECT url FROM {SCHEMA}.media_files WHERE content_hash = %s", (content_hash,))
+                existing = cur.fetchone()
+
+                if existing:
+                    storage.abort(upload_id, upload['storage_upload_id'], upload['storage_key'])
+                    url = existing['url']
+                else:
+                    storage.complete(upload_id, upload['storage_upload_id'], upload['storage_key'], parts)
+                    url = storage.url(upload['storage_key'])
+                    cur.execute(f"""
+                        INSERT INTO {SCHEMA}.media_files (content_hash, kind, storage_key, url, content_type, size_bytes)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                        ON CONFLICT (content_hash) DO UPDATE SET content_hash = EXCLUDED.content_hash
+                        RETURNING url
+                    """, (content_hash, upload['kind'], upload['storage_key'], url, upload['content_type'], upload['total_size']))
+                    url = cur.fetchone()['url']
+
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.uploads
+                    SET status = 'completed', content_hash = %s, url = %s, updated_at = CURRENT_TIMESTAMP
+                    WHERE id = %s
+                    RETURNING id, user_id, kind, filename, total_size, release_id, track_id, status, content_hash, url, updated_at
+                """, (content_hash, url, upload_id))
+                completed = dict(cur.fetchone())
+                completed['deduplicated'] = bool(existing)
+
+                if upload['kind'] == 'cover' and upload['release_id']:
+                    cur.execute(
+                        f"UPDATE {SCHEMA}.releases SET cover_url = %s, updated_at = CURRENT_TIMESTAMP "
+                        f"WHERE id = %s AND user_id = %s AND deleted_at IS NULL",
+                        (url, upload['release_id'], upload['user_id'])
+                    )
+                elif upload['kind'] == 'audio' and upload['track_id']:
+                    cur.execute(f"""
+                        UPDATE {SCHEMA}.tracks SET audio_url = %s
+                        WHERE id = %s AND release_id IN (SELECT id FROM {SCHEMA}.releases WHERE user_id = %s AND deleted_at IS NULL)
+                    """, (url, upload['track_id'], upload['user_id']))
+
+                cur.execute(f"DELETE FROM {SCHEMA}.upload_chunks WHERE upload_id = %s", (upload_id,))
+                conn.commit()
+
+                return {
+                    'statusCode': 200,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'upload': completed}, default=str),
+                    'isBase64Encoded': False
+                }
+
+            return {
+                'statusCode': 400,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Invalid action'}),
+                'isBase64Encoded': False
+            }
+
+        elif method == 'PUT':
+            upload_id = params.get('upload_id')
+            chunk = params.get('chunk')
+
+            if not upload_id or chunk is None or not chunk.isdigit():
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Missing upload_id or chunk'}),
+                    'isBase64Encoded': False
+                }
+
+            chunk_index = int(chunk)
+            cur.execute(f"SELECT * FROM {SCHEMA}.uploads WHERE id = %s", (upload_id,))
+            upload = cur.fetchone()
+
+            if not upload or upload['status'] != 'uploading':
+                return {
+                    'statusCode': 404 if not upload else 409,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Upload not found' if not upload else f"Upload is {upload['status']}"}),
+                    'isBase64Encoded': False
+                }
+
+            data = read_chunk_body(event)
+            is_last = chunk_index == upload['chunk_count'] - 1
+            expected_size = upload['total_size'] - chunk_index * upload['chunk_size'] if is_last else upload['chunk_size']
+            digest = hashlib.sha256(data).hexdigest()
+            client_digest = next(
+                (v for k, v in (event.get('headers') or {}).items() if k.lower() == 'x-chunk-sha256'), None
+            )
+
+            error = None
+            if chunk_index >= upload['chunk_count'] or len(data) != expected_size:
+                error = 'Invalid chunk index or size'
+            elif client_digest and client_digest.lower() != digest:
+                error = 'Chunk checksum mismatch'
+            elif chunk_index == 0 and not has_valid_signature(upload['kind'], data):
+                error = 'File content does not match its type'
+
+            if error:
+                return {
+                    'statusCode': 400,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': error}),
+                    'isBase64Encoded': False
+                }
+
+            etag = get_storage().write_part(upload_id, upload['storage_upload_id'], upload['storage_key'], chunk_index, data)
+            cur.execute(f"""
+                INSERT INTO {SCHEMA}.upload_chunks (upload_id, chunk_index, size_bytes, sha256, etag)
+                VALUES (%s, %s, %s, %s, %s)
+                ON CONFLICT (upload_id, chunk_index) DO UPDATE
+                SET size_bytes = EXCLUDED.size_bytes, sha256 = EXCLUDED.sha256, etag = EXCLUDED.etag, created_at = CURRENT_TIMESTAMP
+            """, (upload_id, chunk_index, len(data), digest, etag))
+            cur.execute(f"UPDATE {SCHEMA}.uploads SET updated_at = CURRENT_TIMESTAMP WHERE id = %s", (upload_id,))
+            conn.commit()
+
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'chunk': chunk_index, 'sha256': digest}),
+                'isBase64Encoded': False
+            }
+
+        elif method == 'DELETE':
+            upload_id = params.get('upload_id')
+            cur.execute(
+                f"UPDATE {SCHEMA}.uploads SET status = 'aborted', updated_at = CURRENT_TIMESTAMP WHERE id = %s AND status = 'uploading' RETURNING *",
+                (upload_id,)
+            )
+            upload = cur.fetchone()
+
+            if not upload:
+                return {
+                    'statusCode': 404,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Upload not found'}),
+                    'isBase64Encoded': False
+                }
+
+            get_storage().abort(upload_id, upload['storage_upload_id'], upload['storage_key'])
+            cur.execute(f"DELETE FROM {SCHEMA}.upload_chunks WHERE upload_id = %s", (upload_id,))
+            conn.commit()
+
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'message': 'Upload aborted'}),
+                'isBase64Encoded': False
+            }
+
+        return {
+            'statusCode': 405,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Method not allowed'}),
+            'isBase64Encoded': False
+        }
+
+    except Exception as e:
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+
+    finally:
+        if 'cur' in locals():
+            cur.close()
+        if 'conn' in locals():
+            sync_rate_limits(conn)
+            conn.close()
@@ -0,0 +1,940 @@
+"""Фоновая обработка медиа: анализ загруженных треков (длительность, громкость, пик, TikTok-момент), поиск дублей по аудио-отпечаткам, миниатюры обложек, загрузка отчётов площадок и удаление файлов без ссылок"""
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from fractions import Fraction
+import numpy as np
+import pandas as pd
+import psycopg2
+import soundfile as sf
+from PIL import Image
+from psycopg2.extras import RealDictCursor, execute_values
+from scipy.ndimage import maximum_filter
+from scipy.signal import lfilter, resample_poly
+
+SCHEMA = "t_p13732906_kedoo_music_platform"
+
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 's3')
+ANALYSIS_BATCH_SIZE = int(os.environ.get('ANALYSIS_BATCH_SIZE', '16'))
+ANALYSIS_STALE_MINUTES = 30
+
+BLOCK_FRAMES = 1 << 18
+SEGMENT_SECONDS = 0.1
+TIKTOK_MIN_SECONDS = 15
+TIKTOK_MAX_SECONDS = 30
+# Окно продлевается до 30 с, пока средняя энергия не падает больше чем на 1 дБ от лучшего 15-секундного окна
+TIKTOK_EXTEND_TOLERANCE_DB = 1.0
+
+# Отпечатки: моно 11025 Гц, окно 1024 / шаг 512, пары пиков спектра (f1, f2, dt) -> 26-битный хеш
+FINGERPRINT_RATE = 11025
+FINGERPRINT_WINDOW = 1024
+FINGERPRINT_HOP = 512
+PEAK_NEIGHBORHOOD = (21, 11)
+PEAK_MIN_DB = 10.0
+PEAK_DYNAMIC_RANGE_DB = 60.0
+FAN_OUT = 5
+MAX_TIME_DELTA = 63
+# В поиск по каталогу идёт детерминированная четверть хешей: одна и та же у запроса и у каталога
+LOOKUP_HASH_MODULUS = 4
+MATCH_BATCH_SIZE = int(os.environ.get('MATCH_BATCH_SIZE', '64'))
+
+# Миниатюры обложек: считаются один раз на файл (хеш содержимого), ключи неизменяемы
+THUMBNAIL_SIZES = (640, 256, 64)
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'image/webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'image/jpeg', {'quality': 85, 'optimize': True, 'progressive': True}),
+}
+THUMBNAIL_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+DERIVATIVES_BATCH_SIZE = int(os.environ.get('DERIVATIVES_BATCH_SIZE', '32'))
+COVER_TABLES = ('releases', 'smartlinks', 'videos')
+
+# Отчёты площадок: читаются кусками по REPORT_CHUNK_ROWS строк, колонки ищутся по синонимам без учёта регистра
+# Файл удаляется не раньше чем через GC_GRACE_HOURS после потери последней ссылки
+GC_BATCH_SIZE = int(os.environ.get('GC_BATCH_SIZE', '50'))
+GC_GRACE_HOURS = int(os.environ.get('GC_GRACE_HOURS', '24'))
+
+REPORT_CHUNK_ROWS = int(os.environ.get('REPORT_CHUNK_ROWS', '500000'))
+REPORT_COLUMNS = {
+    'isrc': ('isrc',),
+    'upc': ('upc', 'ean', 'barcode', 'icpn', 'product upc'),
+    'streams': ('streams', 'quantity', 'plays', 'units', 'stream count', 'количество', 'прослушивания'),
+    'revenue': ('revenue', 'net revenue', 'amount', 'royalty', 'earnings', 'payable', 'доход', 'сумма'),
+}
+
+def get_db_connection():
+    return psycopg2.connect(os.environ['DATABASE_URL'])
+
+class LocalStorage:
+    def __init__(self, root: str, public_url: str):
+        self.root = root
+        self.public_url = public_url.rstrip('/')
+
+    @contextmanager
+    def local_copy(self, key: str):
+        yield os.path.join(self.root, key)
+
+    def put(self, key: str, data: bytes, content_type: str):
+        target = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(target + '.tmp', target)
+
+    def url(self, key: str) -> str:
+        return f'{self.public_url}/{key}'
+
+    def delete(self, keys: list):
+        for key in keys:
+            try:
+                os.remove(os.path.join(self.root, key))
+            except FileNotFoundError:
+                pass
+
+class S3Storage:
+    def __init__(self, bucket: str, public_url: str):
+        import boto3
+        self.client = boto3.client(
+            's3',
+            endpoint_url=os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev'),
+            aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+            aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
+        )
+        self.bucket = bucket
+        self.public_url = public_url.rstrip('/')
+
+    @contextmanager
+    def local_copy(self, key: str):
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        try:
+            self.client.download_file(self.bucket, key, path)
+            yield path
+        finally:
+            os.remove(path)
+
+    def put(self, key: str, data: bytes, content_type: str):
+        self.client.put_object(
+            Bucket=self.bucket, Key=key, Body=data, ContentType=content_type, CacheControl=THUMBNAIL_CACHE_CONTROL
+        )
+
+    def url(self, key: str) -> str:
+        return f'{self.public_url}/{key}'
+
+    def delete(self, keys: list):
+        # DeleteObjects принимает до 1000 ключей за запрос
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in keys[start:start + 1000]], 'Quiet': True}
+            )
+
+def get_storage():
+    if STORAGE_BACKEND == 'local':
+        return LocalStorage(
+            os.environ.get('LOCAL_STORAGE_ROOT', '/tmp/kedoo-media'),
+            os.environ.get('LOCAL_STORAGE_URL', '/media')
+        )
+    return S3Storage(
+        os.environ.get('S3_BUCKET', 'files'),
+        os.environ.get('PUBLIC_MEDIA_URL', f"https://cdn.poehali.dev/projects/{os.environ.get('AWS_ACCESS_KEY_ID')}/bucket")
+    )
+
+def biquad(kind: str, gain_db: float, q: float, fc: float, rate: int):
+    a_gain = 10 ** (gain_db / 40.0)
+    w0 = 2.0 * np.pi * fc / rate
+    alpha = np.sin(w0) / (2.0 * q)
+    cos_w0 = np.cos(w0)
+    if kind == 'high_shelf':
+        sq = 2 * np.sqrt(a_gain) * alpha
+        b = [a_gain * ((a_gain + 1) + (a_gain - 1) * cos_w0 + sq),
+             -2 * a_gain * ((a_gain - 1) + (a_gain + 1) * cos_w0),
+             a_gain * ((a_gain + 1) + (a_gain - 1) * cos_w0 - sq)]
+        a = [(a_gain + 1) - (a_gain - 1) * cos_w0 + sq,
+             2 * ((a_gain - 1) - (a_gain + 1) * cos_w0),
+             (a_gain + 1) - (a_gain - 1) * cos_w0 - sq]
+    else:
+        b = [(1 + cos_w0) / 2, -(1 + cos_w0), (1 + cos_w0) / 2]
+        a = [1 + alpha, -2 * cos_w0, 1 - alpha]
+    return np.array(b) / a[0], np.array(a) / a[0]
+
+def k_weighting(rate: int) -> list:
+    """Двухкаскадный K-фильтр ITU-R BS.1770-4, пересчитанный под частоту дискретизации файла"""
+    return [
+        biquad('high_shelf', 4.0, 1 / np.sqrt(2), 1500.0, rate),
+        biquad('high_pass', 0.0, 0.5, 38.0, rate),
+    ]
+
+def integrated_loudness(weighted_segments: np.ndarray, segment_frames: int) -> float:
+    """Стробированная интегральная громкость по 400-мс блокам с перекрытием 75% (сегменты по 100 мс)"""
+    if len(weighted_segments) < 4:
+        return None
+    cumulative = np.vstack([np.zeros(weighted_segments.shape[1]), np.cumsum(weighted_segments, axis=0)])
+    block_power = ((cumulative[4:] - cumulative[:-4]) / (4 * segment_frames)).sum(axis=1)
+    with np.errstate(divide='ignore'):
+        block_loudness = -0.691 + 10 * np.log10(block_power)
+    gated = block_power[block_loudness > -70.0]
+    if not len(gated):
+        return None
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) - 10.0
+    gated = block_power[(block_loudness > -70.0) & (block_loudness > relative_gate)]
+    if not len(gated):
+        return None
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+def suggest_tiktok_moment(envelope: np.ndarray):
+    """Самое энергичное окно 15–30 с по огибающей средней мощности (RMS²) с шагом 100 мс; возвращает начало окна в секундах"""
+    per_second = int(round(1 / SEGMENT_SECONDS))
+    min_len = TIKTOK_MIN_SECONDS * per_second
+    if len(envelope) < min_len:
+        return None
+    cumulative = np.concatenate([[0.0], np.cumsum(envelope)])
+
+    def best_window(length: int):
+        means = (cumulative[length:] - cumulative[:-length]) / length
+        start = int(np.argmax(means))
+        return start, float(means[start])
+
+    start, best_mean = best_window(min_len)
+    if best_mean <= 0:
+        return 0.0
+    threshold = best_mean * 10 ** (-TIKTOK_EXTEND_TOLERANCE_DB / 10)
+    for seconds in range(TIKTOK_MAX_SECONDS, TIKTOK_MIN_SECONDS, -1):
+        length = seconds * per_second
+        if length <= len(envelope):
+            candidate_start, candidate_mean = best_window(length)
+            if candidate_mean >= threshold:
+                start = candidate_start
+                break
+    return start * SEGMENT_SECONDS
+
+def format_moment(seconds: float) -> str:
+    total = int(seconds)
+    return f'{total // 60}:{total % 60:02d}'
+
+def spectrogram_frames(samples: np.ndarray) -> np.ndarray:
+    frames = np.lib.stride_tricks.sliding_window_view(samples, FINGERPRINT_WINDOW)[::FINGERPRINT_HOP]
+    spectrum = np.abs(np.fft.rfft(frames * np.hanning(FINGERPRINT_WINDOW), axis=1))
+    return (20 * np.log10(spectrum + 1e-10)).astype(np.float32)
+
+def fingerprint_hashes(spectrogram: np.ndarray):
+    """Пики спектрограммы (локальные максимумы) и хеши пар пик-якорь -> пик из целевой зоны"""
+    if not len(spectrogram):
+        return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int32)
+    local_max = maximum_filter(spectrogram, size=(PEAK_NEIGHBORHOOD[1], PEAK_NEIGHBORHOOD[0]))
+    threshold = max(np.median(spectrogram) + PEAK_MIN_DB, spectrogram.max() - PEAK_DYNAMIC_RANGE_DB)
+    times, freqs = np.nonzero((spectrogram == local_max) & (spectrogram > threshold))
+    order = np.lexsort((freqs, times))
+    times, freqs = times[order].astype(np.int64), freqs[order].astype(np.int64)
+
+    hashes, offsets = [], []
+    for k in range(1, FAN_OUT + 1):
+        dt = times[k:] - times[:-k]
+        ok = (dt > 0) & (dt <= MAX_TIME_DELTA)
+        hashes.append((freqs[:-k][ok] << 16) | (freqs[k:][ok] << 6) | dt[ok])
+        offsets.append(times[:-k][ok])
+    return np.concatenate(hashes).astype(np.int32), np.concatenate(offsets).astype(np.int32)
+
+def analyze_audio(path: str, fingerprint: bool = False) -> dict:
+    """Потоковый анализ файла блоками: весь файл в память не загружается"""
+    with sf.SoundFile(path) as f:
+        rate = f.samplerate
+        channels = f.channels
+        segment_frames = int(rate * SEGMENT_SECONDS)
+        resample_ratio = Fraction(FINGERPRINT_RATE, rate).limit_denominator(1000)
+        carry_mono = np.zeros(0, dtype=np.float32)
+        spectrogram = []
+        filters = k_weighting(rate)
+        states = [np.zeros((2, channels)) for _ in filters]
+        carry_weighted = np.zeros((0, channels))
+        carry_plain = np.zeros(0)
+        weighted_segments = []
+        envelope = []
+        peak = 0.0
+        frames = 0
+
+        while True:
+            block = f.read(BLOCK_FRAMES, dtype='float32', always_2d=True)
+            if not len(block):
+                break
+            frames += len(block)
+            peak = max(peak, float(np.abs(block).max()))
+
+            weighted = block.astype(np.float64)
+            for i, (b, a) in enumerate(filters):
+                weighted, states[i] = lfilter(b, a, weighted, axis=0, zi=states[i])
+
+            weighted = np.concatenate([carry_weighted, weighted ** 2])
+            plain = np.concatenate([carry_plain, (block.astype(np.float64) ** 2).mean(axis=1)])
+            full = len(weighted) // segment_frames * segment_frames
+            if full:
+                weighted_segments.append(weighted[:full].reshape(-1, segment_frames, channels).sum(axis=1))
+                envelope.append(plain[:full].reshape(-1, segment_frames).mean(axis=1))
+            carry_weighted = weighted[full:]
+            carry_plain = plain[full:]
+
+            if fingerprint:
+                mono = resample_poly(block.mean(axis=1), resample_ratio.numerator, resample_ratio.denominator)
+                mono = np.concatenate([carry_mono, mono.astype(np.float32)])
+                if len(mono) >= FINGERPRINT_WINDOW:
+                    frame_count = (len(mono) - FINGERPRINT_WINDOW) // FINGERPRINT_HOP + 1
+                    spectrogram.append(spectrogram_frames(mono))
+                    carry_mono = mono[frame_count * FINGERPRINT_HOP:]
+                else:
+                    carry_mono = mono
+
+    weighted_segments = np.vstack(weighted_segments) if weighted_segments else np.zeros((0, channels))
+    energy = np.concatenate(envelope) if envelope else np.zeros(0)
+    moment = suggest_tiktok_moment(energy)
+
+    result = {
+        'duration_seconds': round(frames / rate, 3),
+        'loudness_lufs': integrated_loudness(weighted_segments, segment_frames),
+        'peak_dbfs': round(float(20 * np.log10(peak)), 2) if peak > 0 else None,
+        'suggested_tiktok_moment': format_moment(moment) if moment is not None else None,
+    }
+    if fingerprint:
+        result['fingerprint'] = fingerprint_hashes(np.vstack(spectrogram) if spectrogram else np.zeros((0, FINGERPRINT_WINDOW // 2 + 1)))
+    return result
+
+def analyze_track(job: dict) -> dict:
+    """Выполняется в дочернем процессе: скачивает файл из хранилища и анализирует его"""
+    try:
+        with get_storage().local_copy(job['storage_key']) as path:
+            result = analyze_audio(path, fingerprint=job['needs_fingerprint'])
+        if result['loudness_lufs'] is not None:
+            result['loudness_lufs'] = round(result['loudness_lufs'], 2)
+        return {'id': job['id'], 'media_id': job['media_id'], 'status': 'done', 'error': None, **result}
+    except Exception as e:
+        return {'id': job['id'], 'media_id': job['media_id'], 'status': 'failed', 'error': str(e)[:1000],
+                'duration_seconds': None, 'loudness_lufs': None, 'peak_dbfs': None, 'suggested_tiktok_moment': None}
+
+def copy_known_analysis(conn) -> int:
+    """Треки с уже проанализированным файлом (например, тот же мастер в другом релизе или трек, которому вернули прежний файл) берут готовый результат"""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            UPDATE {SCHEMA}.tracks t
+            SET duration_seconds = d.duration_seconds,
+                loudness_lufs = d.loudness_lufs,
+                peak_dbfs = d.peak_dbfs,
+                suggested_tiktok_moment = d.suggested_tiktok_moment,
+                tiktok_moment = COALESCE(t.tiktok_moment, d.suggested_tiktok_moment),
+                analysis_status = 'done',
+                analysis_error = NULL,
+                analyzed_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT DISTINCT ON (audio_url) audio_url, duration_seconds, loudness_lufs, peak_dbfs, suggested_tiktok_moment
+                FROM {SCHEMA}.tracks
+                WHERE analysis_status = 'done' AND audio_url IN (
+                    SELECT audio_url FROM {SCHEMA}.tracks
+                    WHERE audio_url IS NOT NULL AND analysis_status = 'pending'
+                )
+                ORDER BY audio_url, analyzed_at DESC
+            ) d
+            WHERE t.audio_url = d.audio_url AND t.analysis_status = 'pending'
+        """)
+        copied = cur.rowcount
+    conn.commit()
+    return copied
+
+def claim_tracks(conn) -> list:
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f"""
+            UPDATE {SCHEMA}.tracks t
+            SET analysis_status = 'processing', analysis_started_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT t.id, m.id AS media_id, m.storage_key, m.fingerprinted_at IS NULL AS needs_fingerprint
+                FROM {SCHEMA}.tracks t
+                JOIN {SCHEMA}.media_files m ON m.url = t.audio_url
+                WHERE t.audio_url IS NOT NULL
+                  AND (t.analysis_status = 'pending'
+                       OR (t.analysis_status = 'processing'
+                           AND t.analysis_started_at < CURRENT_TIMESTAMP - make_interval(mins => %s)))
+                ORDER BY t.id
+                LIMIT %s
+                FOR UPDATE OF t SKIP LOCKED
+            ) q
+            WHERE t.id = q.id
+            RETURNING t.id, t.release_id, q.media_id, q.storage_key, q.needs_fingerprint
+        """, (ANALYSIS_STALE_MINUTES, ANALYSIS_BATCH_SIZE))
+        jobs = [dict(row) for row in cur.fetchall()]
+    conn.commit()
+
+    # Один файл в пачке отпечатывается один раз, даже если он привязан к нескольким трекам
+    fingerprinted = set()
+    for job in jobs:
+        if job['needs_fingerprint'] and job['media_id'] in fingerprinted:
+            job['needs_fingerprint'] = False
+        elif job['needs_fingerprint']:
+            fingerprinted.add(job['media_id'])
+    return jobs
+
+def save_analysis(conn, results: list):
+    with conn.cursor() as cur:
+        execute_values(cur, f"""
+            UPDATE {SCHEMA}.tracks t
+            SET duration_seconds = v.duration_seconds::NUMERIC,
+                loudness_lufs = v.loudness_lufs::NUMERIC,
+                peak_dbfs = v.peak_dbfs::NUMERIC,
+                suggested_tiktok_moment = v.suggested_tiktok_moment,
+                tiktok_moment = COALESCE(t.tiktok_moment, v.suggested_tiktok_moment),
+                analysis_status = v.status,
+                analysis_error = v.error,
+                analyzed_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v(id, status, error, duration_seconds, loudness_lufs, peak_dbfs, suggested_tiktok_moment)
+            WHERE t.id = v.id
+        """, [
+            (r['id'], r['status'], r['error'], r['duration_seconds'], r['loudness_lufs'], r['peak_dbfs'], r['suggested_tiktok_moment'])
+            for r in results
+        ])
+    conn.commit()
+
+def save_fingerprints(conn, results: list) -> int:
+    """Хеши пишутся через COPY; повторная отпечатка того же файла заменяет старые хеши"""
+    fingerprinted = [r for r in results if r.get('fingerprint') is not None]
+    if not fingerprinted:
+        return 0
+    with conn.cursor() as cur:
+        media_ids = [r['media_id'] for r in fingerprinted]
+        cur.execute(f"DELETE FROM {SCHEMA}.audio_fingerprints WHERE media_id = ANY(%s)", (media_ids,))
+        for r in fingerprinted:
+            hashes, offsets = r['fingerprint']
+            buffer = io.StringIO()
+            np.savetxt(buffer, np.column_stack([hashes, np.full(len(hashes), r['media_id']), offsets]), fmt='%d', delimiter='\t')
+            buffer.seek(0)
+            cur.copy_expert(f"COPY {SCHEMA}.audio_fingerprints (hash, media_id, time_offset) FROM STDIN", buffer)
+            cur.execute(
+                f"UPDATE {SCHEMA}.media_files SET fingerprint_hash_count = %s, fingerprinted_at = CURRENT_TIMESTAMP WHERE id = %s",
+                (int(np.count_nonzero(hashes % LOOKUP_HASH_MODULUS == 0)), r['media_id'])
+            )
+    conn.commit()
+    return len(fingerprinted)
+
+def run_analysis(conn) -> dict:
+    copied = copy_known_analysis(conn)
+    jobs = claim_tracks(conn)
+    if not jobs:
+        return {'copied': copied, 'analyzed': 0, 'failed': 0}
+
+    with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as pool:
+        results = list(pool.map(analyze_track, jobs))
+
+    save_analysis(conn, results)
+    fingerprinted = save_fingerprints(conn, results)
+    failed = sum(1 for r in results if r['status'] == 'failed')
+    return {'copied': copied, 'analyzed': len(results) - failed, 'failed': failed, 'fingerprinted': fingerprinted}
+
+def release_held_for_moderation(cur) -> int:
+    """Отправляет на модерацию релизы, ждавшие оценки отпечатков, если у всех их треков она уже есть.
+    Ждём только треки с файлом в media_files: аудио по ссылке мимо uploads воркер не анализирует и оценки не будет"""
+    cur.execute(f"""
+        UPDATE {SCHEMA}.releases r
+        SET status = 'on_moderation', moderation_requested_at = NULL, updated_at = CURRENT_TIMESTAMP
+        WHERE r.moderation_requested_at IS NOT NULL AND r.deleted_at IS NULL AND r.status = 'draft'
+          AND NOT EXISTS (
+              SELECT 1 FROM {SCHEMA}.tracks t
+              JOIN {SCHEMA}.media_files m ON m.url = t.audio_url
+              WHERE t.release_id = r.id AND t.fingerprint_checked_at IS NULL AND t.analysis_status <> 'failed'
+          )
+    """)
+    return cur.rowcount
+
+def run_fingerprint_match(conn) -> dict:
+    """Оценка совпадения с каталогом для треков, ещё не проверенных модерацией: одним пакетным запросом на пачку.
+    Релизы, отправленные на модерацию до конца проверки, переводятся в on_moderation после неё"""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f"""
+            SELECT t.id, t.release_id, t.audio_url, m.id AS media_id, m.fingerprint_hash_count
+            FROM {SCHEMA}.tracks t
+            JOIN {SCHEMA}.media_files m ON m.url = t.audio_url
+            WHERE t.audio_url IS NOT NULL AND t.fingerprint_checked_at IS NULL AND m.fingerprinted_at IS NOT NULL
+            ORDER BY t.id
+            LIMIT %s
+        """, (MATCH_BATCH_SIZE,))
+        tracks = [dict(row) for row in cur.fetchall()]
+        if not tracks:
+            released = release_held_for_moderation(cur)
+            conn.commit()
+            return {'checked': 0, 'released': released}
+
+        # Точные дубли: тот же файл (тот же хеш содержимого) уже стоит в другом релизе
+        cur.execute(f"""
+            SELECT DISTINCT ON (q.id) q.id, o.id AS match_track_id, o.release_id AS match_release_id
+            FROM unnest(%s::int[], %s::int[], %s::text[]) AS q(id, release_id, audio_url)
+            JOIN {SCHEMA}.tracks o ON o.audio_url = q.audio_url AND o.release_id <> q.release_id
+            ORDER BY q.id, o.id
+        """, ([t['id'] for t in tracks], [t['release_id'] for t in tracks], [t['audio_url'] for t in tracks]))
+        matches = {row['id']: (row['match_track_id'], row['match_release_id'], 1.0) for row in cur.fetchall()}
+
+        # Похожие записи: голосование по смещению времени между совпавшими хешами
+        media_ids = list({t['media_id'] for t in tracks})
+        cur.execute(f"""
+            WITH votes AS (
+                SELECT q.media_id, f.media_id AS match_media_id, COUNT(*) AS votes
+                FROM {SCHEMA}.audio_fingerprints q
+                JOIN {SCHEMA}.audio_fingerprints f ON f.hash = q.hash AND f.media_id <> q.media_id
+                WHERE q.media_id = ANY(%s) AND q.hash %% %s = 0
+                GROUP BY q.media_id, f.media_id, f.time_offset - q.time_offset
+            )
+            SELECT media_id, match_media_id, MAX(votes) AS votes
+            FROM votes
+            GROUP BY media_id, match_media_id
+        """, (media_ids, LOOKUP_HASH_MODULUS))
+        candidates = {}
+        for row in cur.fetchall():
+            candidates.setdefault(row['media_id'], []).append((row['match_media_id'], row['votes']))
+
+        match_media_ids = list({m for items in candidates.values() for m, _ in items})
+        owners = {}
+        if match_media_ids:
+            cur.execute(f"""
+                SELECT m.id AS media_id, t.id AS track_id, t.release_id
+                FROM {SCHEMA}.media_files m
+                JOIN {SCHEMA}.tracks t ON t.audio_url = m.url
+                WHERE m.id = ANY(%s)
+            """, (match_media_ids,))
+            for row in cur.fetchall():
+                owners.setdefault(row['media_id'], []).append((row['track_id'], row['release_id']))
+
+        for t in tracks:
+            total = t['fingerprint_hash_count'] or 0
+            for match_media_id, votes in candidates.get(t['media_id'], []):
+                score = min(1.0, votes / total) if total else 0.0
+                for track_id, release_id in owners.get(match_media_id, []):
+                    if release_id != t['release_id'] and score > matches.get(t['id'], (None, None, 0.0))[2]:
+                        matches[t['id']] = (track_id, release_id, score)
+
+        rows = []
+        for t in tracks:
+            match_track_id, match_release_id, score = matches.get(t['id'], (None, None, 0.0))
+            rows.append((t['id'], match_track_id, match_release_id, round(score, 4)))
+
+        execute_values(cur, f"""
+            UPDATE {SCHEMA}.tracks t
+            SET fingerprint_match_track_id = v.match_track_id,
+                fingerprint_match_release_id = v.match_release_id,
+                fingerprint_match_score = v.score::NUMERIC,
+                fingerprint_checked_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v(id, match_track_id, match_release_id, score)
+            WHERE t.id = v.id
+        """, rows, template='(%s, %s::int, %s::int, %s)')
+        released = release_held_for_moderation(cur)
+    conn.commit()
+    return {'checked': len(tracks), 'matched': sum(1 for t in tracks if t['id'] in matches), 'released': released}
+
+def thumbnail_key(storage_key: str, size: int, ext: str) -> str:
+    """Миниатюры лежат рядом с оригиналом; ключ оригинала уникален для содержимого, поэтому и ключи миниатюр неизменяемы"""
+    return f'{os.path.splitext(storage_key)[0]}_{size}.{ext}'
+
+def render_thumbnails(path: str) -> dict:
+    """Декодирует обложку один раз и уменьшает её каскадом 640 -> 256 -> 64; возвращает {размер: {формат: bytes}}"""
+    with Image.open(path) as image:
+        # JPEG декодируется сразу в уменьшенном масштабе (DCT scaling), если оригинал намного больше 640 px
+        image.draft('RGB', (THUMBNAIL_SIZES[0], THUMBNAIL_SIZES[0]))
+        image = image.convert('RGB')
+
+    rendered = {}
+    for size in THUMBNAIL_SIZES:
+        image.thumbnail((size, size), Image.LANCZOS)
+        rendered[size] = {}
+        for ext, (pil_format, _, options) in THUMBNAIL_FORMATS.items():
+            buffer = io.BytesIO()
+            image.save(buffer, pil_format, **options)
+            rendered[size][ext] = buffer.getvalue()
+    return rendered
+
+def generate_derivatives(job: dict) -> dict:
+    """Выполняется в дочернем процессе: скачивает обложку, строит миниатюры и выгружает их в хранилище"""
+    try:
+        storage = get_storage()
+        with storage.local_copy(job['storage_key']) as path:
+            rendered = render_thumbnails(path)
+        thumbnails = {}
+        for size, formats in rendered.items():
+            thumbnails[str(size)] = {}
+            for ext, data in formats.items():
+                key = thumbnail_key(job['storage_key'], size, ext)
+                storage.put(key, data, THUMBNAIL_FORMATS[ext][1])
+                thumbnails[str(size)][ext] = storage.url(key)
+        return {'id': job['id'], 'url': job['url'], 'thumbnails': thumbnails, 'error': None}
+    except Exception as e:
+        return {'id': job['id'], 'url': job['url'], 'thumbnails': None, 'error': str(e)[:1000]}
+
+def claim_covers(conn) -> list:
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f"""
+            UPDATE {SCHEMA}.media_files m
+            SET derivatives_started_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT id
+                FROM {SCHEMA}.media_files
+                WHERE kind = 'cover' AND derivatives_at IS NULL
+                  AND (derivatives_started_at IS NULL
+                       OR derivatives_started_at < CURRENT_TIMESTAMP - make_interval(mins => %s))
+                ORDER BY id
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            ) q
+            WHERE m.id = q.id
+            RETURNING m.id, m.url, m.storage_key
+        """, (ANALYSIS_STALE_MINUTES, DERIVATIVES_BATCH_SIZE))
+        jobs = [dict(row) for row in cur.fetchall()]
+    conn.commit()
+    return jobs
+
+def run_derivatives(conn) -> dict:
+    """Миниатюры для новых обложек; готовый набор сразу проставляется релизам, смартлинкам и видео с этой обложкой.
+    Обложки захватываются отметкой derivatives_started_at и коммитом: пока идёт обработка, блокировки не держатся"""
+    jobs = claim_covers(conn)
+    if not jobs:
+        return {'generated': 0, 'failed': 0}
+
+    with ProcessPoolExecutor(max_workers=min(len(jobs), os.cpu_count() or 1)) as pool:
+        results = list(pool.map(generate_derivatives, jobs))
+
+    with conn.cursor() as cur:
+        # Битые файлы тоже помечаются обработанными, чтобы не попадать в очередь бесконечно
+        execute_values(cur, f"""
+            UPDATE {SCHEMA}.media_files m
+            SET thumbnails = v.thumbnails::JSONB, derivatives_at = CURRENT_TIMESTAMP
+            FROM (VALUES %s) AS v(id, thumbnails)
+            WHERE m.id = v.id
+        """, [(r['id'], json.dumps(r['thumbnails']) if r['thumbnails'] else None) for r in results])
+
+        generated = [r for r in results if r['thumbnails']]
+        if generated:
+            urls = [r['url'] for r in generated]
+            thumbnails = [json.dumps(r['thumbnails']) for r in generated]
+            for table in COVER_TABLES:
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.{table} t
+                    SET cover_thumbnails = v.thumbnails::JSONB
+                    FROM unnest(%s::text[], %s::text[]) AS v(url, thumbnails)
+                    WHERE t.cover_url = v.url
+                """, (urls, thumbnails))
+    conn.commit()
+    return {'generated': len(generated), 'failed': len(results) - len(generated)}
+
+def load_catalog_index(conn) -> dict:
+    """Индекс каталога в памяти: (UPC, ISRC), ISRC и UPC -> релиз, релиз -> владелец; ключи нормализованы как в отчётах"""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            SELECT r.id, r.user_id, r.upc, t.isrc
+            FROM {SCHEMA}.releases r
+            LEFT JOIN {SCHEMA}.tracks t ON t.release_id = r.id AND t.isrc IS NOT NULL
+            WHERE r.deleted_at IS NULL
+            ORDER BY r.created_at, r.id
+        """)
+        catalog = pd.DataFrame(cur.fetchall(), columns=['release_id', 'user_id', 'upc', 'isrc'])
+    conn.commit()
+
+    catalog['upc'] = normalize_upc(catalog['upc'].fillna(''))
+    catalog['isrc'] = normalize_isrc(catalog['isrc'].fillna(''))
+    with_isrc = catalog[catalog['isrc'] != '']
+    with_upc = catalog[catalog['upc'] != '']
+    pairs = with_isrc[with_isrc['upc'] != '']
+    pair = pd.Series(pairs['release_id'].values, index=pairs['upc'] + '|' + pairs['isrc'])
+    # При повторах побеждает последний (самый новый) релиз
+    return {
+        'pair': pair[~pair.index.duplicated(keep='last')],
+        'isrc': with_isrc.drop_duplicates('isrc', keep='last').set_index('isrc')['release_id'],
+        'upc': with_upc.drop_duplicates('upc', keep='last').set_index('upc')['release_id'],
+        'owner': catalog.drop_duplicates('release_id').set_index('release_id')['user_id'],
+    }
+
+def normalize_isrc(values: pd.Series) -> pd.Series:
+    return values.astype(str).str.upper().str.replace(r'[^A-Z0-9]', '', regex=True)
+
+def normalize_upc(values: pd.Series) -> pd.Series:
+    # UPC-A (12 цифр) и EAN-13 с ведущим нулём — один и тот же код
+    return values.astype(str).str.replace(r'\D', '', regex=True).str.lstrip('0')
+
+NUMBER_GROUPING = re.compile(r"[\s\u00a0'’]")
+
+def detect_decimal_separator(values: pd.Series):
+    """Десятичный разделитель столбца по образцу значений файла: «1.234.567,89» и «1,234.56» решают сразу (последний
+    знак — десятичный), повтор знака делает его разделителем тысяч, одиночный знак не перед тремя цифрами — десятичный.
+    Одиночное «2,000» неоднозначно и само по себе ничего не решает; без решающих значений — None"""
+    values = values.str.replace(NUMBER_GROUPING, '', regex=True)
+    last_dot = values.str.rfind('.')
+    last_comma = values.str.rfind(',')
+    both = (last_dot >= 0) & (last_comma >= 0)
+    votes = {
+        '.': int((both & (last_dot > last_comma)).sum()),
+        ',': int((both & (last_comma > last_dot)).sum()),
+    }
+    for sep, other in (('.', ','), (',', '.')):
+        only = values.str.contains(sep, regex=False) & ~values.str.contains(other, regex=False)
+        repeated = only & (values.str.count(re.escape(sep)) > 1)
+        votes[other] += int(repeated.sum())
+        single = only & ~repeated
+        not_grouping = single & ~values.str.contains(rf'\d{re.escape(sep)}\d{{3}}$', regex=True)
+        votes[sep] += int(not_grouping.sum())
+    if votes['.'] == votes[',']:
+        return None
+    return '.' if votes['.'] > votes[','] else ','
+
+def parse_number(values: pd.Series, decimal) -> tuple:
+    """Число с известным для файла десятичным разделителем (None — целые, оба знака разделяют тысячи).
+    Возвращает значения и маску непустых, но нераспознанных ячеек; такие ячейки дают 0 и считаются ошибками"""
+    cleaned = values.str.replace(NUMBER_GROUPING, '', regex=True)
+    for sep in ('.', ','):
+        if sep != decimal:
+            cleaned = cleaned.str.replace(sep, '', regex=False)
+    if decimal == ',':
+        cleaned = cleaned.str.replace(',', '.', regex=False)
+    parsed = pd.to_numeric(cleaned.where(cleaned.str.fullmatch(r'[-+]?(\d+\.?\d*|\.\d+)')), errors='coerce')
+    invalid = parsed.isna() & (values.str.strip() != '')
+    return parsed.fillna(0), invalid
+
+def parse_count(values: pd.Series, decimal=None) -> tuple:
+    parsed, invalid = parse_number(values, decimal)
+    return parsed.round().astype(np.int64), invalid
+
+def parse_amount(values: pd.Series, decimal='.') -> tuple:
+    """Суммы «1 234,56», «1,234.56», «1.234.567,89», «0.0042» — разделитель определяется для столбца всего файла"""
+    return parse_number(values, decimal)
+
+def detect_separator(path: str) -> str:
+    with open(path, 'rb') as raw:
+        head = raw.read(2)
+    opener = gzip.open if head == b'\x1f\x8b' else open
+    with opener(path, 'rt', encoding='utf-8-sig', errors='replace') as f:
+        header = f.readline()
+    return max(('\t', ';', ','), key=header.count)
+
+def ingest_report(path: str, index: dict) -> tuple:
+    """Агрегирует отчёт по (релиз, ISRC) кусками: строки сопоставляются с каталогом векторно через Series.map"""
+    sep = detect_separator(path)
+    aliases = {alias: column for column, names in REPORT_COLUMNS.items() for alias in names}
+    reader = pd.read_csv(
+        path, sep=sep, dtype=str, keep_default_na=False, chunksize=REPORT_CHUNK_ROWS, compression='infer',
+        encoding='utf-8-sig', usecols=lambda name: name.strip().lower() in aliases
+    )
+    stats = {'rows_total': 0, 'rows_matched': 0, 'rows_invalid': 0, 'streams_total': 0, 'revenue_total': 0.0,
+             'unmatched_revenue': 0.0}
+    partials = []
+    # Разделитель десятичной части решается один раз на столбец по первому куску, где он определим: отчёт одной
+    # площадки выгружен в одной локали, а значение «2,000» по отдельности читается двояко
+    decimals = {}
+
+    for chunk in reader:
+        chunk = chunk.rename(columns=lambda name: aliases[name.strip().lower()])
+        if 'isrc' not in chunk and 'upc' not in chunk:
+            raise ValueError('Report has neither ISRC nor UPC column')
+        isrc = normalize_isrc(chunk['isrc']) if 'isrc' in chunk else pd.Series('', index=chunk.index)
+        upc = normalize_upc(chunk['upc']) if 'upc' in chunk else pd.Series('', index=chunk.index)
+        invalid = pd.Series(False, index=chunk.index)
+        streams = pd.Series(0, index=chunk.index)
+        revenue = pd.Series(0.0, index=chunk.index)
+        for column, default in (('streams', None), ('revenue', '.')):
+            if column not in chunk:
+                continue
+            if column not in decimals:
+                detected = detect_decimal_separator(chunk[column])
+                if detected is not None:
+                    decimals[column] = detected
+            decimal = decimals.get(column, default)
+            if column == 'streams':
+                streams, bad = parse_count(chunk[column], decimal)
+            else:
+                revenue, bad = parse_amount(chunk[column], decimal)
+            invalid |= bad
+
+        release_id = (upc + '|' + isrc).map(index['pair'])
+        release_id = release_id.fillna(isrc.map(index['isrc'])).fillna(upc.map(index['upc']))
+        matched = release_id.notna()
+
+        stats['rows_total'] += len(chunk)
+        stats['rows_matched'] += int(matched.sum())
+        stats['rows_invalid'] += int(invalid.sum())
+        stats['streams_total'] += int(streams.sum())
+        stats['revenue_total'] += float(revenue.sum())
+        stats['unmatched_revenue'] += float(revenue[~matched].sum())
+
+        partials.append(pd.DataFrame({
+            'release_id': release_id[matched].astype(np.int64),
+            'isrc': isrc[matched],
+            'streams': streams[matched],
+            'revenue': revenue[matched],
+        }).groupby(['release_id', 'isrc'], as_index=False).sum())
+
+    if not partials:
+        return pd.DataFrame(columns=['release_id', 'isrc', 'user_id', 'streams', 'revenue']), stats
+    facts = pd.concat(partials).groupby(['release_id', 'isrc'], as_index=False).sum()
+    facts['user_id'] = facts['release_id'].map(index['owner']).astype(np.int64)
+    return facts, stats
+
+def save_royalty_facts(conn, report: dict, facts: pd.DataFrame):
+    """COPY во временную таблицу и upsert в royalty_facts: повторная обработка отчёта перезаписывает его факты"""
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            CREATE TEMP TABLE royalty_facts_staging
+            (LIKE {SCHEMA}.royalty_facts INCLUDING DEFAULTS) ON COMMIT DROP
+        """)
+        facts = facts.assign(report_id=report['id'], platform=report['platform'], period_month=report['period_month'])
+        buffer = io.StringIO()
+        facts[['report_id', 'release_id', 'isrc', 'user_id', 'platform', 'period_month', 'streams', 'revenue']].to_csv(
+            buffer, sep='\t', header=False, index=False, float_format='%.6f'
+        )
+        buffer.seek(0)
+        cur.copy_expert(
+            "COPY royalty_facts_staging (report_id, release_id, isrc, user_id, platform, period_month, streams, revenue) FROM STDIN",
+            buffer
+        )
+        cur.execute(f"DELETE FROM {SCHEMA}.royalty_facts WHERE report_id = %s", (report['id'],))
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.royalty_facts (report_id, release_id, isrc, user_id, platform, period_month, streams, revenue)
+            SELECT report_id, release_id, isrc, user_id, platform, period_month, streams, revenue FROM royalty_facts_staging
+            ON CONFLICT (report_id, release_id, isrc) DO UPDATE
+            SET user_id = EXCLUDED.user_id, streams = EXCLUDED.streams, revenue = EXCLUDED.revenue
+        """)
+
+def run_royalties(conn) -> dict:
+    """Один отчёт за запуск: отчёт на миллионы строк занимает весь таймаут функции"""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f"""
+            UPDATE {SCHEMA}.royalty_reports r
+            SET status = 'processing', started_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT r.id, m.storage_key
+                FROM {SCHEMA}.royalty_reports r
+                JOIN {SCHEMA}.media_files m ON m.content_hash = r.content_hash
+                WHERE r.status = 'pending'
+                   OR (r.status = 'processing' AND r.started_at < CURRENT_TIMESTAMP - make_interval(mins => %s))
+                ORDER BY r.id
+                LIMIT 1
+                FOR UPDATE OF r SKIP LOCKED
+            ) q
+            WHERE r.id = q.id
+            RETURNING r.id, r.platform, r.period_month, q.storage_key
+        """, (ANALYSIS_STALE_MINUTES,))
+        report = cur.fetchone()
+    conn.commit()
+    if not report:
+        return {'ingested': 0}
+
+    try:
+        index = load_catalog_index(conn)
+        with get_storage().local_copy(report['storage_key']) as path:
+            facts, stats = ingest_report(path, index)
+        save_royalty_facts(conn, report, facts)
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                UPDATE {SCHEMA}.royalty_reports
+                SET status = 'done', error = NULL, processed_at = CURRENT_TIMESTAMP,
+                    rows_total = %s, rows_matched = %s, rows_invalid = %s, streams_total = %s, revenue_total = %s,
+                    unmatched_revenue = %s
+                WHERE id = %s
+            """, (stats['rows_total'], stats['rows_matched'], stats['rows_invalid'], stats['streams_total'],
+                  round(stats['revenue_total'], 6), round(stats['unmatched_revenue'], 6), report['id']))
+        conn.commit()
+        return {'ingested': 1, 'report_id': report['id'], 'facts': len(facts), **stats}
+    except Exception as e:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(
+                f"UPDATE {SCHEMA}.royalty_reports SET status = 'failed', error = %s, processed_at = CURRENT_TIMESTAMP WHERE id = %s",
+                (str(e)[:1000], report['id'])
+            )
+        conn.commit()
+        return {'ingested': 0, 'report_id': report['id'], 'failed': 1}
+
+def media_storage_keys(media: dict) -> list:
+    keys = [media['storage_key']]
+    if media['thumbnails']:
+        keys += [thumbnail_key(media['storage_key'], size, ext) for size in THUMBNAIL_SIZES for ext in THUMBNAIL_FORMATS]
+    return keys
+
+def run_media_gc(conn) -> dict:
+    """Разбирает media_gc_queue: ссылки проверяются по индексам url-столбцов, файлы без ссылок удаляются вместе с
+    миниатюрами и отпечатками. Строки в БД удаляются до объектов в хранилище: лишний объект безвреден, битая ссылка — нет"""
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(f"""
+            SELECT q.url, m.id, m.storage_key, m.thumbnails
+            FROM {SCHEMA}.media_gc_queue q
+            LEFT JOIN {SCHEMA}.media_files m ON m.url = q.url AND m.kind IN ('audio', 'cover')
+            WHERE q.queued_at < CURRENT_TIMESTAMP - make_interval(hours => %s)
+            ORDER BY q.queued_at
+            LIMIT %s
+            FOR UPDATE OF q SKIP LOCKED
+        """, (GC_GRACE_HOURS, GC_BATCH_SIZE))
+        queued = [dict(row) for row in cur.fetchall()]
+        if not queued:
+            conn.commit()
+            return {'deleted': 0, 'kept': 0}
+
+        urls = [item['url'] for item in queued]
+        cur.execute(f"""
+            SELECT v.url
+            FROM unnest(%s::text[]) AS v(url)
+            WHERE EXISTS (SELECT 1 FROM {SCHEMA}.tracks WHERE audio_url = v.url)
+               OR EXISTS (SELECT 1 FROM {SCHEMA}.releases WHERE cover_url = v.url)
+               OR EXISTS (SELECT 1 FROM {SCHEMA}.smartlinks WHERE cover_url = v.url)
+               OR EXISTS (SELECT 1 FROM {SCHEMA}.videos WHERE cover_url = v.url)
+        """, (urls,))
+        referenced = {row['url'] for row in cur.fetchall()}
+        orphans = [item for item in queued if item['id'] and item['url'] not in referenced]
+
+        if orphans:
+            media_ids = [item['id'] for item in orphans]
+            cur.execute(f"DELETE FROM {SCHEMA}.audio_fingerprints WHERE media_id = ANY(%s)", (media_ids,))
+            cur.execute(f"DELETE FROM {SCHEMA}.media_files WHERE id = ANY(%s)", (media_ids,))
+        cur.execute(f"DELETE FROM {SCHEMA}.media_gc_queue WHERE url = ANY(%s)", (urls,))
+    conn.commit()
+
+    if orphans:
+        get_storage().delete([key for item in orphans for key in media_storage_keys(item)])
+    return {'deleted': len(orphans), 'kept': len(queued) - len(orphans)}
+
+TASKS = {
+    'analysis': run_analysis,
+    'fingerprint_match': run_fingerprint_match,
+    'derivatives': run_derivatives,
+    'royalties': run_royalties,
+    'gc': run_media_gc,
+}
+
+# Запускается по таймеру или вручную: ?task=analysis|fingerprint_match|derivatives|royalties|gc, без task выполняются все задачи
+def handler(event: dict, context) -> dict:
+    params = event.get('queryStringParameters') or {}
+    task = params.get('task') or event.get('task')
+
+    if task and task not in TASKS:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid task'}),
+            'isBase64Encoded': False
+        }
+
+    conn = get_db_connection()
+
+    try:
+        results = {}
+        for name, run in TASKS.items():
+            if not task or task == name:
+                results[name] = run(conn)
+
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'results': results}, default=str),
+            'isBase64Encoded': False
+        }
+
+    except Exception as e:
+        conn.rollback()
+        return {
+            'statusCode': 500,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': str(e)}),
+            'isBase64Encoded': False
+        }
+
+    finally:
+        conn.close()
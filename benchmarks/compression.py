@@ -0,0 +1,114 @@
+"""Бенчмарк: время CPU и размер ответа при сжатии JSON-списков релизов gzip и brotli.
+
+Запуск: python benchmarks/compression.py [--rows 50 1000 10000] [--repeat 20]
+
+Ответ — синтетический список релизов модератора со всеми полями RELEASE_LIST_FIELDS, включая миниатюры обложек,
+как его отдаёт GET releases. Основная строка — compress_response из backend/releases с настройками функции
+(brotli q4 или gzip -6 по Accept-Encoding, base64 для шлюза); для сравнения сжимается тот же JSON при brotli q11
+и gzip -9. Выводится медиана времени на ответ, размер после base64 и степень сжатия относительно исходного JSON.
+БД не нужна; без модуля brotli строки br пропускаются.
+"""
+import argparse
+import base64
+import gzip
+import importlib.util
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+STATUSES = ('draft', 'on_moderation', 'approved', 'rejected', 'live')
+LANGUAGES = ('ru', 'en', 'kk', 'uk', 'instrumental')
+WORDS = ('ночь', 'город', 'summer', 'love', 'волна', 'dream', 'свет', 'fire', 'тишина', 'echo', 'дорога', 'neon')
+
+def load_releases():
+    spec = importlib.util.spec_from_file_location('releases_index', os.path.join(BACKEND, 'releases', 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def sample_release(rng: random.Random, release_id: int) -> dict:
+    created_at = datetime(2024, 1, 1) + timedelta(minutes=rng.randrange(1_000_000))
+    cover_key = f'cover/{rng.getrandbits(128):032x}/cover.jpg'
+    return {
+        'id': release_id,
+        'user_id': rng.randrange(1, 5000),
+        'album_name': ' '.join(rng.choice(WORDS) for _ in range(rng.randrange(1, 4))).capitalize(),
+        'artists': ', '.join(f'{rng.choice(WORDS).capitalize()} {rng.choice(WORDS)}' for _ in range(rng.randrange(1, 3))),
+        'upc': f'{rng.randrange(10 ** 12):013d}',
+        'old_release_date': None,
+        'release_date': (created_at + timedelta(days=rng.randrange(7, 60))).date().isoformat(),
+        'is_rerelease': rng.random() < 0.1,
+        'status': rng.choice(STATUSES),
+        'rejection_reason': None,
+        'live_at': None,
+        'track_count': rng.randrange(1, 15),
+        'has_any_explicit': rng.random() < 0.3,
+        'languages': rng.sample(LANGUAGES, rng.randrange(1, 3)),
+        'total_duration_seconds': rng.randrange(120, 3600),
+        'cover_thumbnails': {
+            str(size): {ext: f'https://cdn.example.com/{cover_key}.{size}.{ext}' for ext in ('webp', 'avif')}
+            for size in (64, 256, 640)
+        },
+        'moderation_requested_at': None,
+        'created_at': created_at.isoformat(sep=' '),
+        'updated_at': (created_at + timedelta(hours=rng.randrange(1, 500))).isoformat(sep=' '),
+    }
+
+def response_for(rows: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    body = json.dumps({'releases': [sample_release(rng, i + 1) for i in range(rows)]}, default=str)
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': body,
+        'isBase64Encoded': False
+    }
+
+def measure(compress, repeat: int) -> tuple:
+    """Медиана процессорного времени на вызов (мс) и размер результата в байтах"""
+    timings = []
+    for _ in range(repeat):
+        started = time.process_time()
+        size = compress()
+        timings.append((time.process_time() - started) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2], size
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[50, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    releases = load_releases()
+    print(f"{'rows':>6}{'json KiB':>10}  {'codec':<16}{'ms':>9}{'base64 KiB':>12}{'ratio':>8}")
+    for rows in args.rows:
+        response = response_for(rows, args.seed)
+        raw = response['body'].encode('utf-8')
+        variants = []
+        for encoding in ('br', 'gzip'):
+            if encoding == 'br' and brotli is None:
+                continue
+            event = {'headers': {'Accept-Encoding': encoding}}
+            variants.append((f'{encoding} (handler)', lambda event=event: len(releases.compress_response(event, response)['body'])))
+        if brotli is not None:
+            variants.append(('br q11', lambda: len(base64.b64encode(brotli.compress(raw, quality=11)))))
+        variants.append(('gzip -9', lambda: len(base64.b64encode(gzip.compress(raw, compresslevel=9, mtime=0)))))
+
+        for name, compress in variants:
+            repeat = args.repeat if 'q11' not in name else max(1, args.repeat // 10)
+            ms, size = measure(compress, repeat)
+            print(f"{rows:>6}{len(raw) / 1024:>10.0f}  {name:<16}{ms:>9.1f}{size / 1024:>12.1f}{len(raw) / size:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
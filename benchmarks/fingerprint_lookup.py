@@ -0,0 +1,133 @@
+"""Бенчмарк: задержка пакетного поиска совпадений по аудио-отпечаткам на каталоге из 1M треков.
+
+Запуск: DATABASE_URL=... python benchmarks/fingerprint_lookup.py [--tracks 1000000] [--hashes-per-track 400]
+        [--batch 64] [--rounds 20] [--keep]
+
+Каталог строится в отдельной схеме fingerprint_bench с той же таблицей и тем же покрывающим индексом, что
+audio_fingerprints (V0016), рабочие таблицы не трогаются. Хеши — равномерные 26-битные, как у воркера; в каждом
+раунде пачка запросов — перезаливы случайных треков каталога со сдвигом по времени, поэтому голосование находит
+совпадения. Замеряется тот же запрос голосования, что в run_fingerprint_match; выводятся p50/p95/max на пачку и
+на трек. Реальный трек даёт несколько тысяч хешей — плотность задаётся --hashes-per-track, таблица растёт
+линейно (1M × 400 ≈ 400M строк, ~25 ГБ с индексом).
+"""
+import argparse
+import io
+import os
+import time
+import numpy as np
+import psycopg2
+
+BENCH_SCHEMA = 'fingerprint_bench'
+HASH_BITS = 26
+MAX_OFFSET = 6000
+LOAD_CHUNK_TRACKS = 20000
+# Как в backend/worker: в поиск идёт четверть хешей, выбранная по модулю
+LOOKUP_HASH_MODULUS = 4
+
+VOTE_QUERY = f"""
+    WITH votes AS (
+        SELECT q.media_id, f.media_id AS match_media_id, COUNT(*) AS votes
+        FROM {BENCH_SCHEMA}.audio_fingerprints q
+        JOIN {BENCH_SCHEMA}.audio_fingerprints f ON f.hash = q.hash AND f.media_id <> q.media_id
+        WHERE q.media_id = ANY(%s) AND q.hash %% %s = 0
+        GROUP BY q.media_id, f.media_id, f.time_offset - q.time_offset
+    )
+    SELECT media_id, match_media_id, MAX(votes) AS votes
+    FROM votes
+    GROUP BY media_id, match_media_id
+"""
+
+def track_hashes(rng, count: int):
+    return rng.integers(0, 1 << HASH_BITS, count, dtype=np.int64), rng.integers(0, MAX_OFFSET, count, dtype=np.int64)
+
+def copy_rows(cur, media_ids, hashes, offsets):
+    buffer = io.StringIO()
+    np.savetxt(buffer, np.column_stack([hashes, media_ids, offsets]), fmt='%d', delimiter='\t')
+    buffer.seek(0)
+    cur.copy_expert(f"COPY {BENCH_SCHEMA}.audio_fingerprints (hash, media_id, time_offset) FROM STDIN", buffer)
+
+def build_catalog(conn, tracks: int, per_track: int, seed: int):
+    rng = np.random.default_rng(seed)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE")
+        cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA}")
+        cur.execute(f"""
+            CREATE TABLE {BENCH_SCHEMA}.audio_fingerprints (
+                hash INTEGER NOT NULL,
+                media_id INTEGER NOT NULL,
+                time_offset INTEGER NOT NULL
+            )
+        """)
+        conn.commit()
+        for start in range(0, tracks, LOAD_CHUNK_TRACKS):
+            count = min(LOAD_CHUNK_TRACKS, tracks - start)
+            media_ids = np.repeat(np.arange(start + 1, start + count + 1, dtype=np.int64), per_track)
+            hashes, offsets = track_hashes(rng, count * per_track)
+            copy_rows(cur, media_ids, hashes, offsets)
+            conn.commit()
+            print(f"loaded {start + count}/{tracks} tracks", flush=True)
+        # Индексы строятся после загрузки, как и в рабочей схеме — покрывающий по hash и по media_id
+        cur.execute(f"CREATE INDEX ON {BENCH_SCHEMA}.audio_fingerprints(hash) INCLUDE (media_id, time_offset)")
+        cur.execute(f"CREATE INDEX ON {BENCH_SCHEMA}.audio_fingerprints(media_id)")
+        cur.execute(f"ANALYZE {BENCH_SCHEMA}.audio_fingerprints")
+    conn.commit()
+
+def add_reuploads(conn, tracks: int, batch: int, next_media_id: int, rng) -> list:
+    """Копирует хеши случайных треков каталога под новыми media_id со сдвигом по времени"""
+    sources = rng.choice(np.arange(1, tracks + 1), batch, replace=False)
+    query_ids = list(range(next_media_id, next_media_id + batch))
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            INSERT INTO {BENCH_SCHEMA}.audio_fingerprints (hash, media_id, time_offset)
+            SELECT f.hash, q.query_id, f.time_offset + 7
+            FROM unnest(%s::int[], %s::int[]) AS q(source_id, query_id)
+            JOIN {BENCH_SCHEMA}.audio_fingerprints f ON f.media_id = q.source_id
+        """, ([int(s) for s in sources], query_ids))
+    conn.commit()
+    return query_ids
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--tracks', type=int, default=1_000_000)
+    parser.add_argument('--hashes-per-track', type=int, default=400)
+    parser.add_argument('--batch', type=int, default=64, help='треков в одном запросе, как MATCH_BATCH_SIZE воркера')
+    parser.add_argument('--rounds', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--skip-load', action='store_true', help='использовать каталог от прошлого запуска')
+    parser.add_argument('--keep', action='store_true', help='не удалять схему после замера')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    if not args.skip_load:
+        started = time.perf_counter()
+        build_catalog(conn, args.tracks, args.hashes_per_track, args.seed)
+        print(f"catalog built in {time.perf_counter() - started:.1f} s")
+
+    rng = np.random.default_rng(args.seed + 1)
+    latencies = []
+    found = 0
+    next_media_id = args.tracks + 1
+    with conn.cursor() as cur:
+        for _ in range(args.rounds):
+            query_ids = add_reuploads(conn, args.tracks, args.batch, next_media_id, rng)
+            next_media_id += args.batch
+            started = time.perf_counter()
+            cur.execute(VOTE_QUERY, (query_ids, LOOKUP_HASH_MODULUS))
+            rows = cur.fetchall()
+            latencies.append((time.perf_counter() - started) * 1000)
+            conn.commit()
+            found += len({row[0] for row in rows})
+
+        latencies = np.array(latencies)
+        print(f"tracks={args.tracks} hashes/track={args.hashes_per_track} batch={args.batch} rounds={args.rounds}")
+        print(f"batch ms: p50={np.percentile(latencies, 50):.1f} p95={np.percentile(latencies, 95):.1f} max={latencies.max():.1f}")
+        print(f"per track ms: p50={np.percentile(latencies, 50) / args.batch:.2f}")
+        print(f"re-uploads matched: {found}/{args.batch * args.rounds}")
+
+        if not args.keep:
+            cur.execute(f"DROP SCHEMA {BENCH_SCHEMA} CASCADE")
+            conn.commit()
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""Бенчмарк: сколько времени планирования экономит реестр подготовленных запросов releases и auth.
+
+Запуск: DATABASE_URL=... python benchmarks/prepared_statements.py [--iterations 500] [--release-id 1] [--user-id 1]
+
+Для каждого запроса из STATEMENTS сравнивается обычный запрос с параметрами (разбор и план на
+каждом вызове) с EXECUTE заранее подготовленного плана; дополнительно выводится «Planning Time»
+из EXPLAIN ANALYZE для обоих вариантов. Пишущие запросы выполняются внутри транзакции, которая
+откатывается.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import time
+import psycopg2
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+def load_statements(function: str) -> dict:
+    spec = importlib.util.spec_from_file_location(f'{function}_index', os.path.join(BACKEND, function, 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.STATEMENTS
+
+def sample_params(args) -> dict:
+    """Параметры для каждого запроса; запросы без набора параметров пропускаются"""
+    window = (None, None)
+    return {
+        'releases': {
+            'release_detail': (args.release_id,),
+            'release_lyrics': (args.release_id,),
+            'track_lyrics': (args.release_id,),
+            'list_by_user': (args.user_id,) + window,
+            'list_by_user_status': (args.user_id,) + window + ('draft',),
+            'list_all': window,
+            'list_all_status': window + ('on_moderation',),
+            'insert_track': (args.release_id, 'Benchmark', 'Benchmark', None, None, None, None, None,
+                             None, False, False, None, 1),
+        },
+        'auth': {
+            'login': ('benchmark@example.com', '0' * 64),
+        },
+    }
+
+def plain_query(statement: str) -> str:
+    """$1, $2… → %s для обычного cur.execute"""
+    return re.sub(r'\$\d+', '%s', statement.replace('%', '%%'))
+
+def planning_time(cur, query: str, params: tuple) -> float:
+    cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {query}", params)
+    plan = cur.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0].get('Planning Time', 0.0)
+
+def benchmark(conn, name: str, statement: str, params: tuple, iterations: int) -> dict:
+    cur = conn.cursor()
+    query = plain_query(statement)
+    # В тексте $n может встречаться повторно и не по порядку — для %s параметры разворачиваются по вхождениям
+    order = [int(n) - 1 for n in re.findall(r'\$(\d+)', statement)]
+    ordered = tuple(params[i] for i in order)
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        cur.execute(query, ordered)
+    plain_ms = (time.perf_counter() - started) * 1000
+
+    cur.execute(f"PREPARE bench_{name} AS {statement}")
+    execute = f"EXECUTE bench_{name} ({', '.join(['%s'] * len(params))})" if params else f"EXECUTE bench_{name}"
+    started = time.perf_counter()
+    for _ in range(iterations):
+        cur.execute(execute, params)
+    prepared_ms = (time.perf_counter() - started) * 1000
+
+    result = {
+        'statement': name,
+        'plain_ms_per_call': plain_ms / iterations,
+        'prepared_ms_per_call': prepared_ms / iterations,
+        'plain_planning_ms': planning_time(cur, query, ordered),
+        'prepared_planning_ms': planning_time(cur, execute, params),
+    }
+    cur.execute(f"DEALLOCATE bench_{name}")
+    cur.close()
+    conn.rollback()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=500)
+    parser.add_argument('--release-id', type=int, default=1)
+    parser.add_argument('--user-id', type=int, default=1)
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    params = sample_params(args)
+
+    print(f"{'statement':<28}{'plain ms':>12}{'prepared ms':>14}{'plan plain':>13}{'plan prep':>12}")
+    for function, samples in params.items():
+        statements = load_statements(function)
+        for name, statement in statements.items():
+            if name not in samples:
+                continue
+            row = benchmark(conn, name, statement, samples[name], args.iterations)
+            print(f"{function + '.' + name:<28}{row['plain_ms_per_call']:>12.3f}{row['prepared_ms_per_call']:>14.3f}"
+                  f"{row['plain_planning_ms']:>13.3f}{row['prepared_planning_ms']:>12.3f}")
+
+    conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Бенчмарк: пропускная способность загрузки 500 МБ мастера через функцию uploads.
+
+Запуск: DATABASE_URL=... python benchmarks/uploads_throughput.py [--size-mb 500] [--runs 3] [--storage-root /tmp/...]
+
+Функция вызывается в процессе, как её вызывает шлюз: части по 5 МБ приходят base64-телом PUT, хранилище —
+LocalStorage (STORAGE_BACKEND=local), БД — настоящая. Каждый прогон загружает новый случайный WAV (init, все части,
+complete), поэтому complete собирает файл, а не находит дубль. Выводятся МБ/с на весь файл, p50/p95/max на часть
+и время complete; отдельно — сколько из времени части занимают base64 и SHA-256 (верхняя граница без БД и диска).
+Строки uploads и media_files прогона удаляются в конце, файлы — вместе с --storage-root, если он временный.
+"""
+import argparse
+import base64
+import hashlib
+import importlib.util
+import json
+import os
+import shutil
+import struct
+import tempfile
+import time
+import numpy as np
+import psycopg2
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+def load_uploads(storage_root: str):
+    os.environ['STORAGE_BACKEND'] = 'local'
+    os.environ['LOCAL_STORAGE_ROOT'] = storage_root
+    # PUT-ведро функции пропускает клиента не быстрее 10 частей (50 МБ) в секунду — замер упёрся бы в него
+    os.environ['RATE_LIMITS'] = json.dumps({'PUT': [1_000_000, 1_000_000]})
+    spec = importlib.util.spec_from_file_location('uploads_index', os.path.join(BACKEND, 'uploads', 'index.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def wav_chunks(size: int, chunk_size: int, rng):
+    """WAV-заголовок и случайные сэмплы, по части за раз: весь файл в памяти не держится"""
+    header = b'RIFF' + struct.pack('<I', size - 8) + b'WAVE' + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 2, 48000, 288000, 6, 24)
+    header += b'data' + struct.pack('<I', size - len(header) - 8)
+    offset = 0
+    while offset < size:
+        length = min(chunk_size, size - offset)
+        data = rng.integers(0, 256, length, dtype=np.uint8).tobytes()
+        if offset == 0:
+            data = header + data[len(header):]
+        yield data
+        offset += length
+
+def call(uploads, method: str, params=None, body=None) -> dict:
+    event = {'httpMethod': method, 'queryStringParameters': params, 'body': body,
+             'requestContext': {'identity': {'sourceIp': '127.0.0.1'}}}
+    response = uploads.handler(event, None)
+    if response['statusCode'] >= 300:
+        raise RuntimeError(f"{method} {params}: {response['statusCode']} {response['body']}")
+    return json.loads(response['body'])
+
+def run_once(uploads, size: int, user_id: int, rng) -> dict:
+    upload = call(uploads, 'POST', body=json.dumps({
+        'action': 'init', 'user_id': user_id, 'kind': 'audio', 'filename': 'benchmark.wav', 'total_size': size
+    }))['upload']
+
+    chunk_ms = []
+    encode_ms = []
+    started = time.perf_counter()
+    for index, data in enumerate(wav_chunks(size, uploads.CHUNK_SIZE, rng)):
+        chunk_started = time.perf_counter()
+        body = base64.b64encode(data).decode('ascii')
+        hashlib.sha256(base64.b64decode(body)).hexdigest()
+        encode_ms.append((time.perf_counter() - chunk_started) * 1000)
+        chunk_started = time.perf_counter()
+        call(uploads, 'PUT', {'upload_id': upload['id'], 'chunk': str(index)}, body)
+        chunk_ms.append((time.perf_counter() - chunk_started) * 1000)
+
+    complete_started = time.perf_counter()
+    completed = call(uploads, 'POST', body=json.dumps({'action': 'complete', 'upload_id': upload['id']}))['upload']
+    finished = time.perf_counter()
+    return {
+        'upload_id': upload['id'],
+        'content_hash': completed['content_hash'],
+        'seconds': finished - started,
+        'complete_ms': (finished - complete_started) * 1000,
+        'chunk_ms': chunk_ms,
+        'encode_ms': encode_ms,
+    }
+
+def cleanup(results: list):
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM t_p13732906_kedoo_music_platform.media_files WHERE content_hash = ANY(%s)",
+                    ([r['content_hash'] for r in results],))
+        cur.execute("DELETE FROM t_p13732906_kedoo_music_platform.uploads WHERE id = ANY(%s::uuid[])",
+                    ([r['upload_id'] for r in results],))
+    conn.commit()
+    conn.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=500)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--user-id', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--storage-root', help='каталог LocalStorage; по умолчанию временный')
+    args = parser.parse_args()
+
+    storage_root = args.storage_root or tempfile.mkdtemp(prefix='uploads-bench-')
+    uploads = load_uploads(storage_root)
+    rng = np.random.default_rng(args.seed)
+    size = args.size_mb * 1024 * 1024
+
+    results = []
+    try:
+        for run in range(args.runs):
+            result = run_once(uploads, size, args.user_id, rng)
+            results.append(result)
+            chunk_ms = np.array(result['chunk_ms'])
+            print(f"run {run + 1}: {args.size_mb / result['seconds']:.1f} MB/s, {result['seconds']:.1f} s total, "
+                  f"chunk ms p50={np.percentile(chunk_ms, 50):.1f} p95={np.percentile(chunk_ms, 95):.1f} "
+                  f"max={chunk_ms.max():.1f}, complete {result['complete_ms']:.0f} ms, "
+                  f"base64+sha256 per chunk {np.median(result['encode_ms']):.1f} ms", flush=True)
+
+        throughput = [args.size_mb / r['seconds'] for r in results]
+        print(f"size={args.size_mb} MB chunks={len(results[0]['chunk_ms'])} runs={args.runs}")
+        print(f"MB/s: median={np.median(throughput):.1f} min={min(throughput):.1f} max={max(throughput):.1f}")
+    finally:
+        if results:
+            cleanup(results)
+        if not args.storage_root:
+            shutil.rmtree(storage_root, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+-- Denormalized track stats on releases, maintained by triggers on tracks
+ALTER TABLE t_p13732906_kedoo_music_platform.releases ADD COLUMN IF NOT EXISTS track_count INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE t_p13732906_kedoo_music_platform.releases ADD COLUMN IF NOT EXISTS has_any_explicit BOOLEAN NOT NULL DEFAULT FALSE;
+ALTER TABLE t_p13732906_kedoo_music_platform.releases ADD COLUMN IF NOT EXISTS languages TEXT[] NOT NULL DEFAULT '{}';
+
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.refresh_release_track_stats(p_release_id INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    UPDATE t_p13732906_kedoo_music_platform.releases r
+    SET track_count = s.track_count,
+        has_any_explicit = s.has_any_explicit,
+        languages = s.languages
+    FROM (
+        SELECT COUNT(*)::INTEGER AS track_count,
+               COALESCE(BOOL_OR(has_explicit), FALSE) AS has_any_explicit,
+               COALESCE(ARRAY_AGG(DISTINCT language) FILTER (WHERE language IS NOT NULL), '{}') AS languages
+        FROM t_p13732906_kedoo_music_platform.tracks
+        WHERE release_id = p_release_id
+    ) s
+    WHERE r.id = p_release_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Inserts are applied as a delta; updates and deletes recount the single affected release
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.tracks_maintain_release_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE t_p13732906_kedoo_music_platform.releases
+        SET track_count = track_count + 1,
+            has_any_explicit = has_any_explicit OR COALESCE(NEW.has_explicit, FALSE),
+            languages = CASE
+                WHEN NEW.language IS NULL OR NEW.language = ANY(languages) THEN languages
+                ELSE array_append(languages, NEW.language::TEXT)
+            END
+        WHERE id = NEW.release_id;
+        RETURN NEW;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM t_p13732906_kedoo_music_platform.refresh_release_track_stats(OLD.release_id);
+        RETURN OLD;
+    END IF;
+
+    PERFORM t_p13732906_kedoo_music_platform.refresh_release_track_stats(NEW.release_id);
+    IF OLD.release_id IS DISTINCT FROM NEW.release_id THEN
+        PERFORM t_p13732906_kedoo_music_platform.refresh_release_track_stats(OLD.release_id);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_tracks_release_stats_insert
+    AFTER INSERT ON t_p13732906_kedoo_music_platform.tracks
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.tracks_maintain_release_stats();
+
+CREATE TRIGGER trg_tracks_release_stats_update
+    AFTER UPDATE OF release_id, has_explicit, language ON t_p13732906_kedoo_music_platform.tracks
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.tracks_maintain_release_stats();
+
+CREATE TRIGGER trg_tracks_release_stats_delete
+    AFTER DELETE ON t_p13732906_kedoo_music_platform.tracks
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.tracks_maintain_release_stats();
+
+-- Backfill existing releases
+UPDATE t_p13732906_kedoo_music_platform.releases r
+SET track_count = s.track_count,
+    has_any_explicit = s.has_any_explicit,
+    languages = s.languages
+FROM (
+    SELECT release_id,
+           COUNT(*)::INTEGER AS track_count,
+           COALESCE(BOOL_OR(has_explicit), FALSE) AS has_any_explicit,
+           COALESCE(ARRAY_AGG(DISTINCT language) FILTER (WHERE language IS NOT NULL), '{}') AS languages
+    FROM t_p13732906_kedoo_music_platform.tracks
+    GROUP BY release_id
+) s
+WHERE r.id = s.release_id;
@@ -0,0 +1,78 @@
+-- Monthly range partitioning by created_at for tickets, releases and studio tables.
+-- The original tables are kept as *_unpartitioned until the partitioned copies are verified.
+
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.create_monthly_partition(p_table TEXT, p_month DATE)
+RETURNS VOID AS $$
+DECLARE
+    month_start DATE := date_trunc('month', p_month)::DATE;
+BEGIN
+    EXECUTE format(
+        'CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.%I PARTITION OF t_p13732906_kedoo_music_platform.%I FOR VALUES FROM (%L) TO (%L)',
+        p_table || '_p' || to_char(month_start, 'YYYYMM'),
+        p_table,
+        month_start,
+        (month_start + INTERVAL '1 month')::DATE
+    );
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.ensure_monthly_partitions(p_table TEXT, p_months_ahead INTEGER)
+RETURNS VOID AS $$
+DECLARE
+    m DATE := date_trunc('month', CURRENT_DATE)::DATE;
+BEGIN
+    WHILE m <= date_trunc('month', CURRENT_DATE) + make_interval(months => p_months_ahead) LOOP
+        PERFORM t_p13732906_kedoo_music_platform.create_monthly_partition(p_table, m);
+        m := (m + INTERVAL '1 month')::DATE;
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+-- tracks.release_id cannot reference a partitioned releases table without created_at in the key
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks DROP CONSTRAINT IF EXISTS tracks_release_id_fkey;
+
+DO $$
+DECLARE
+    t TEXT;
+    m DATE;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['releases', 'tickets', 'promo_releases', 'videos', 'platform_accounts'] LOOP
+        EXECUTE format('UPDATE t_p13732906_kedoo_music_platform.%I SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL', t);
+        EXECUTE format('ALTER TABLE t_p13732906_kedoo_music_platform.%I RENAME TO %I', t, t || '_unpartitioned');
+        EXECUTE format(
+            'CREATE TABLE t_p13732906_kedoo_music_platform.%I (LIKE t_p13732906_kedoo_music_platform.%I INCLUDING DEFAULTS INCLUDING CONSTRAINTS) PARTITION BY RANGE (created_at)',
+            t, t || '_unpartitioned'
+        );
+        EXECUTE format('ALTER TABLE t_p13732906_kedoo_music_platform.%I ALTER COLUMN created_at SET NOT NULL', t);
+        EXECUTE format('ALTER TABLE t_p13732906_kedoo_music_platform.%I ADD PRIMARY KEY (id, created_at)', t);
+        EXECUTE format('ALTER SEQUENCE t_p13732906_kedoo_music_platform.%I OWNED BY t_p13732906_kedoo_music_platform.%I.id', t || '_id_seq', t);
+
+        EXECUTE format(
+            'SELECT date_trunc(''month'', COALESCE(MIN(created_at), CURRENT_TIMESTAMP))::DATE FROM t_p13732906_kedoo_music_platform.%I',
+            t || '_unpartitioned'
+        ) INTO m;
+        WHILE m < date_trunc('month', CURRENT_DATE) LOOP
+            PERFORM t_p13732906_kedoo_music_platform.create_monthly_partition(t, m);
+            m := (m + INTERVAL '1 month')::DATE;
+        END LOOP;
+        PERFORM t_p13732906_kedoo_music_platform.ensure_monthly_partitions(t, 3);
+        EXECUTE format(
+            'CREATE TABLE t_p13732906_kedoo_music_platform.%I PARTITION OF t_p13732906_kedoo_music_platform.%I DEFAULT',
+            t || '_default', t
+        );
+
+        EXECUTE format(
+            'INSERT INTO t_p13732906_kedoo_music_platform.%I SELECT * FROM t_p13732906_kedoo_music_platform.%I',
+            t, t || '_unpartitioned'
+        );
+
+        EXECUTE format('CREATE INDEX %I ON t_p13732906_kedoo_music_platform.%I (user_id, created_at DESC)', 'idx_' || t || '_user_id_created_at', t);
+        EXECUTE format('CREATE INDEX %I ON t_p13732906_kedoo_music_platform.%I (status, created_at DESC)', 'idx_' || t || '_status_created_at', t);
+        EXECUTE format('CREATE INDEX %I ON t_p13732906_kedoo_music_platform.%I (created_at DESC)', 'idx_' || t || '_created_at', t);
+    END LOOP;
+END $$;
+
+ALTER TABLE t_p13732906_kedoo_music_platform.releases
+    ADD FOREIGN KEY (user_id) REFERENCES t_p13732906_kedoo_music_platform.users(id);
+ALTER TABLE t_p13732906_kedoo_music_platform.tickets
+    ADD FOREIGN KEY (user_id) REFERENCES t_p13732906_kedoo_music_platform.users(id);
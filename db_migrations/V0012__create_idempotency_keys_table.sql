@@ -0,0 +1,13 @@
+-- Stored responses for retried POST requests carrying an Idempotency-Key header
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.idempotency_keys (
+    scope VARCHAR(50) NOT NULL,
+    idempotency_key VARCHAR(255) NOT NULL,
+    request_hash CHAR(64) NOT NULL,
+    status_code INTEGER,
+    response_body TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (scope, idempotency_key)
+);
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires_at ON t_p13732906_kedoo_music_platform.idempotency_keys(expires_at);
@@ -0,0 +1,10 @@
+-- Global per-window request counters, synced in batches from in-process token buckets
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.rate_limit_counters (
+    scope VARCHAR(100) NOT NULL,
+    bucket_key VARCHAR(255) NOT NULL,
+    window_start TIMESTAMP NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (scope, bucket_key, window_start)
+);
+
+CREATE INDEX IF NOT EXISTS idx_rate_limit_counters_window_start ON t_p13732906_kedoo_music_platform.rate_limit_counters(window_start);
@@ -0,0 +1,46 @@
+-- Content-addressed media files (deduplicated by content hash)
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.media_files (
+    content_hash CHAR(64) PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL CHECK (kind IN ('audio', 'cover')),
+    storage_key TEXT NOT NULL,
+    url TEXT NOT NULL,
+    content_type VARCHAR(100),
+    size_bytes BIGINT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_media_files_url ON t_p13732906_kedoo_music_platform.media_files(url);
+
+-- Resumable chunked uploads
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.uploads (
+    id UUID PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    kind VARCHAR(20) NOT NULL CHECK (kind IN ('audio', 'cover')),
+    filename VARCHAR(500) NOT NULL,
+    content_type VARCHAR(100),
+    total_size BIGINT NOT NULL,
+    chunk_size INTEGER NOT NULL,
+    chunk_count INTEGER NOT NULL,
+    storage_key TEXT NOT NULL,
+    storage_upload_id TEXT,
+    release_id INTEGER,
+    track_id INTEGER,
+    status VARCHAR(20) DEFAULT 'uploading' CHECK (status IN ('uploading', 'completed', 'aborted')),
+    content_hash CHAR(64),
+    url TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_uploads_user_id ON t_p13732906_kedoo_music_platform.uploads(user_id);
+CREATE INDEX IF NOT EXISTS idx_uploads_status ON t_p13732906_kedoo_music_platform.uploads(status);
+
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.upload_chunks (
+    upload_id UUID NOT NULL,
+    chunk_index INTEGER NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    sha256 CHAR(64) NOT NULL,
+    etag TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (upload_id, chunk_index)
+);
@@ -0,0 +1,69 @@
+-- Audio analysis results on tracks, filled by the background worker after upload
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks ADD COLUMN IF NOT EXISTS duration_seconds NUMERIC(10, 3);
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks ADD COLUMN IF NOT EXISTS loudness_lufs NUMERIC(6, 2);
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks ADD COLUMN IF NOT EXISTS peak_dbfs NUMERIC(6, 2);
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks ADD COLUMN IF NOT EXISTS suggested_tiktok_moment VARCHAR(10);
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks ADD COLUMN IF NOT EXISTS analysis_status VARCHAR(20) NOT NULL DEFAULT 'pending'
+    CHECK (analysis_status IN ('pending', 'processing', 'done', 'failed'));
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks ADD COLUMN IF NOT EXISTS analysis_error TEXT;
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks ADD COLUMN IF NOT EXISTS analysis_started_at TIMESTAMP;
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks ADD COLUMN IF NOT EXISTS analyzed_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_tracks_analysis_queue ON t_p13732906_kedoo_music_platform.tracks(id)
+    WHERE audio_url IS NOT NULL AND analysis_status IN ('pending', 'processing');
+CREATE INDEX IF NOT EXISTS idx_tracks_audio_url ON t_p13732906_kedoo_music_platform.tracks(audio_url);
+
+-- Release total duration joins the trigger-maintained track stats
+ALTER TABLE t_p13732906_kedoo_music_platform.releases ADD COLUMN IF NOT EXISTS total_duration_seconds NUMERIC(12, 3) NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.refresh_release_track_stats(p_release_id INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    UPDATE t_p13732906_kedoo_music_platform.releases r
+    SET track_count = s.track_count,
+        has_any_explicit = s.has_any_explicit,
+        languages = s.languages,
+        total_duration_seconds = s.total_duration_seconds
+    FROM (
+        SELECT COUNT(*)::INTEGER AS track_count,
+               COALESCE(BOOL_OR(has_explicit), FALSE) AS has_any_explicit,
+               COALESCE(ARRAY_AGG(DISTINCT language) FILTER (WHERE language IS NOT NULL), '{}') AS languages,
+               COALESCE(SUM(duration_seconds), 0) AS total_duration_seconds
+        FROM t_p13732906_kedoo_music_platform.tracks
+        WHERE release_id = p_release_id
+    ) s
+    WHERE r.id = p_release_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.tracks_maintain_release_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE t_p13732906_kedoo_music_platform.releases
+        SET track_count = track_count + 1,
+            has_any_explicit = has_any_explicit OR COALESCE(NEW.has_explicit, FALSE),
+            languages = CASE
+                WHEN NEW.language IS NULL OR NEW.language = ANY(languages) THEN languages
+                ELSE array_append(languages, NEW.language::TEXT)
+            END,
+            total_duration_seconds = total_duration_seconds + COALESCE(NEW.duration_seconds, 0)
+        WHERE id = NEW.release_id;
+        RETURN NEW;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM t_p13732906_kedoo_music_platform.refresh_release_track_stats(OLD.release_id);
+        RETURN OLD;
+    END IF;
+
+    PERFORM t_p13732906_kedoo_music_platform.refresh_release_track_stats(NEW.release_id);
+    IF OLD.release_id IS DISTINCT FROM NEW.release_id THEN
+        PERFORM t_p13732906_kedoo_music_platform.refresh_release_track_stats(OLD.release_id);
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_tracks_release_stats_update ON t_p13732906_kedoo_music_platform.tracks;
+CREATE TRIGGER trg_tracks_release_stats_update
+    AFTER UPDATE OF release_id, has_explicit, language, duration_seconds ON t_p13732906_kedoo_music_platform.tracks
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.tracks_maintain_release_stats();
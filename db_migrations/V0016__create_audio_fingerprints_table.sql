@@ -0,0 +1,26 @@
+-- Spectral-peak fingerprints per uploaded audio file, for duplicate and re-upload detection
+ALTER TABLE t_p13732906_kedoo_music_platform.media_files ADD COLUMN IF NOT EXISTS id SERIAL;
+ALTER TABLE t_p13732906_kedoo_music_platform.media_files ADD COLUMN IF NOT EXISTS fingerprint_hash_count INTEGER;
+ALTER TABLE t_p13732906_kedoo_music_platform.media_files ADD COLUMN IF NOT EXISTS fingerprinted_at TIMESTAMP;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_media_files_id ON t_p13732906_kedoo_music_platform.media_files(id);
+
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.audio_fingerprints (
+    hash INTEGER NOT NULL,
+    media_id INTEGER NOT NULL,
+    time_offset INTEGER NOT NULL
+);
+
+-- Covering index: catalog lookups are index-only scans on hash
+CREATE INDEX IF NOT EXISTS idx_audio_fingerprints_hash ON t_p13732906_kedoo_music_platform.audio_fingerprints(hash) INCLUDE (media_id, time_offset);
+CREATE INDEX IF NOT EXISTS idx_audio_fingerprints_media_id ON t_p13732906_kedoo_music_platform.audio_fingerprints(media_id);
+
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks ADD COLUMN IF NOT EXISTS fingerprint_match_track_id INTEGER;
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks ADD COLUMN IF NOT EXISTS fingerprint_match_release_id INTEGER;
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks ADD COLUMN IF NOT EXISTS fingerprint_match_score NUMERIC(5, 4);
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks ADD COLUMN IF NOT EXISTS fingerprint_checked_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_tracks_fingerprint_queue ON t_p13732906_kedoo_music_platform.tracks(id)
+    WHERE audio_url IS NOT NULL AND fingerprint_checked_at IS NULL;
+
+-- Tracks analyzed before fingerprinting existed go through the worker again
+UPDATE t_p13732906_kedoo_music_platform.tracks SET analysis_status = 'pending' WHERE analysis_status = 'done';
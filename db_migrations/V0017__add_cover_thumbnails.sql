@@ -0,0 +1,36 @@
+-- Cover derivatives (64/256/640 px, WebP and JPEG) generated once per content hash
+ALTER TABLE t_p13732906_kedoo_music_platform.media_files ADD COLUMN IF NOT EXISTS thumbnails JSONB;
+ALTER TABLE t_p13732906_kedoo_music_platform.media_files ADD COLUMN IF NOT EXISTS derivatives_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_media_files_derivatives_queue ON t_p13732906_kedoo_music_platform.media_files(id)
+    WHERE kind = 'cover' AND derivatives_at IS NULL;
+
+ALTER TABLE t_p13732906_kedoo_music_platform.releases ADD COLUMN IF NOT EXISTS cover_thumbnails JSONB;
+ALTER TABLE t_p13732906_kedoo_music_platform.smartlinks ADD COLUMN IF NOT EXISTS cover_thumbnails JSONB;
+ALTER TABLE t_p13732906_kedoo_music_platform.videos ADD COLUMN IF NOT EXISTS cover_thumbnails JSONB;
+
+CREATE INDEX IF NOT EXISTS idx_releases_cover_url ON t_p13732906_kedoo_music_platform.releases(cover_url);
+CREATE INDEX IF NOT EXISTS idx_smartlinks_cover_url ON t_p13732906_kedoo_music_platform.smartlinks(cover_url);
+CREATE INDEX IF NOT EXISTS idx_videos_cover_url ON t_p13732906_kedoo_music_platform.videos(cover_url);
+
+-- Rows pick up already generated thumbnails when cover_url is set; the worker fills the rest
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.fill_cover_thumbnails()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.cover_thumbnails := (
+        SELECT thumbnails FROM t_p13732906_kedoo_music_platform.media_files WHERE url = NEW.cover_url
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_releases_cover_thumbnails
+    BEFORE INSERT OR UPDATE OF cover_url ON t_p13732906_kedoo_music_platform.releases
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.fill_cover_thumbnails();
+
+CREATE TRIGGER trg_smartlinks_cover_thumbnails
+    BEFORE INSERT OR UPDATE OF cover_url ON t_p13732906_kedoo_music_platform.smartlinks
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.fill_cover_thumbnails();
+
+CREATE TRIGGER trg_videos_cover_thumbnails
+    BEFORE INSERT OR UPDATE OF cover_url ON t_p13732906_kedoo_music_platform.videos
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.fill_cover_thumbnails();
@@ -0,0 +1,45 @@
+-- Monthly DSP usage reports are uploaded as regular media files (kind 'report')
+ALTER TABLE t_p13732906_kedoo_music_platform.media_files DROP CONSTRAINT IF EXISTS media_files_kind_check;
+ALTER TABLE t_p13732906_kedoo_music_platform.media_files ADD CONSTRAINT media_files_kind_check
+    CHECK (kind IN ('audio', 'cover', 'report'));
+ALTER TABLE t_p13732906_kedoo_music_platform.uploads DROP CONSTRAINT IF EXISTS uploads_kind_check;
+ALTER TABLE t_p13732906_kedoo_music_platform.uploads ADD CONSTRAINT uploads_kind_check
+    CHECK (kind IN ('audio', 'cover', 'report'));
+
+-- One row per report file; the same file (content hash) cannot be ingested twice
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.royalty_reports (
+    id SERIAL PRIMARY KEY,
+    content_hash CHAR(64) NOT NULL UNIQUE,
+    platform VARCHAR(50) NOT NULL CHECK (platform IN ('yandex_music', 'vk_music', 'spotify', 'apple_music', 'youtube_music')),
+    period_month DATE NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending' CHECK (status IN ('pending', 'processing', 'done', 'failed')),
+    rows_total BIGINT,
+    rows_matched BIGINT,
+    streams_total BIGINT,
+    revenue_total NUMERIC(18, 6),
+    unmatched_revenue NUMERIC(18, 6),
+    error TEXT,
+    uploaded_by INTEGER,
+    started_at TIMESTAMP,
+    processed_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_royalty_reports_queue ON t_p13732906_kedoo_music_platform.royalty_reports(id)
+    WHERE status IN ('pending', 'processing');
+
+-- Aggregated facts: one row per report, release and ISRC ('' for rows matched by UPC only)
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.royalty_facts (
+    report_id INTEGER NOT NULL,
+    release_id INTEGER NOT NULL,
+    isrc VARCHAR(50) NOT NULL,
+    user_id INTEGER NOT NULL,
+    platform VARCHAR(50) NOT NULL,
+    period_month DATE NOT NULL,
+    streams BIGINT NOT NULL DEFAULT 0,
+    revenue NUMERIC(18, 6) NOT NULL DEFAULT 0,
+    PRIMARY KEY (report_id, release_id, isrc)
+);
+
+CREATE INDEX IF NOT EXISTS idx_royalty_facts_user_month ON t_p13732906_kedoo_music_platform.royalty_facts(user_id, period_month);
+CREATE INDEX IF NOT EXISTS idx_royalty_facts_isrc_month ON t_p13732906_kedoo_music_platform.royalty_facts(isrc, period_month);
@@ -0,0 +1,120 @@
+-- Append-only log of status transitions, filled by triggers on every moderated table
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.status_events (
+    id BIGSERIAL PRIMARY KEY,
+    entity_type VARCHAR(20) NOT NULL,
+    entity_id INTEGER NOT NULL,
+    from_status VARCHAR(50),
+    to_status VARCHAR(50) NOT NULL,
+    reason TEXT,
+    actor_id INTEGER,
+    created_at TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+);
+
+-- Rows are appended in time order, so a BRIN index covers date ranges at a fraction of a btree's size
+CREATE INDEX IF NOT EXISTS idx_status_events_created_at ON t_p13732906_kedoo_music_platform.status_events
+    USING BRIN (created_at) WITH (pages_per_range = 32);
+CREATE INDEX IF NOT EXISTS idx_status_events_entity ON t_p13732906_kedoo_music_platform.status_events(entity_type, entity_id, id);
+
+-- Actor comes from the transaction-local setting kedoo.actor_id (set by the API handlers);
+-- on insert it falls back to the row owner. TG_ARGV: entity type, reason column.
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.log_status_event()
+RETURNS TRIGGER AS $$
+DECLARE
+    actor INTEGER := NULLIF(current_setting('kedoo.actor_id', true), '')::INTEGER;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        actor := COALESCE(actor, (to_jsonb(NEW) ->> 'user_id')::INTEGER);
+    END IF;
+
+    INSERT INTO t_p13732906_kedoo_music_platform.status_events
+        (entity_type, entity_id, from_status, to_status, reason, actor_id)
+    VALUES (
+        TG_ARGV[0],
+        NEW.id,
+        CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END,
+        NEW.status,
+        to_jsonb(NEW) ->> TG_ARGV[1],
+        actor
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_releases_status_insert
+    AFTER INSERT ON t_p13732906_kedoo_music_platform.releases
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.log_status_event('release', 'rejection_reason');
+CREATE TRIGGER trg_releases_status_update
+    AFTER UPDATE OF status ON t_p13732906_kedoo_music_platform.releases
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION t_p13732906_kedoo_music_platform.log_status_event('release', 'rejection_reason');
+
+CREATE TRIGGER trg_smartlinks_status_insert
+    AFTER INSERT ON t_p13732906_kedoo_music_platform.smartlinks
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.log_status_event('smartlink', 'rejection_reason');
+CREATE TRIGGER trg_smartlinks_status_update
+    AFTER UPDATE OF status ON t_p13732906_kedoo_music_platform.smartlinks
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION t_p13732906_kedoo_music_platform.log_status_event('smartlink', 'rejection_reason');
+
+CREATE TRIGGER trg_tickets_status_insert
+    AFTER INSERT ON t_p13732906_kedoo_music_platform.tickets
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.log_status_event('ticket', 'moderator_response');
+CREATE TRIGGER trg_tickets_status_update
+    AFTER UPDATE OF status ON t_p13732906_kedoo_music_platform.tickets
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION t_p13732906_kedoo_music_platform.log_status_event('ticket', 'moderator_response');
+
+CREATE TRIGGER trg_promo_releases_status_insert
+    AFTER INSERT ON t_p13732906_kedoo_music_platform.promo_releases
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.log_status_event('promo', 'rejection_reason');
+CREATE TRIGGER trg_promo_releases_status_update
+    AFTER UPDATE OF status ON t_p13732906_kedoo_music_platform.promo_releases
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION t_p13732906_kedoo_music_platform.log_status_event('promo', 'rejection_reason');
+
+CREATE TRIGGER trg_videos_status_insert
+    AFTER INSERT ON t_p13732906_kedoo_music_platform.videos
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.log_status_event('video', 'rejection_reason');
+CREATE TRIGGER trg_videos_status_update
+    AFTER UPDATE OF status ON t_p13732906_kedoo_music_platform.videos
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION t_p13732906_kedoo_music_platform.log_status_event('video', 'rejection_reason');
+
+CREATE TRIGGER trg_platform_accounts_status_insert
+    AFTER INSERT ON t_p13732906_kedoo_music_platform.platform_accounts
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.log_status_event('platform', 'rejection_reason');
+CREATE TRIGGER trg_platform_accounts_status_update
+    AFTER UPDATE OF status ON t_p13732906_kedoo_music_platform.platform_accounts
+    FOR EACH ROW WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION t_p13732906_kedoo_music_platform.log_status_event('platform', 'rejection_reason');
+
+-- Existing rows get a baseline event at their last update so timelines and SLA have a starting point
+INSERT INTO t_p13732906_kedoo_music_platform.status_events (entity_type, entity_id, to_status, reason, created_at)
+SELECT 'release', id, status, rejection_reason, COALESCE(updated_at, created_at) FROM t_p13732906_kedoo_music_platform.releases
+UNION ALL
+SELECT 'smartlink', id, status, rejection_reason, COALESCE(updated_at, created_at) FROM t_p13732906_kedoo_music_platform.smartlinks
+UNION ALL
+SELECT 'ticket', id, status, moderator_response, COALESCE(updated_at, created_at) FROM t_p13732906_kedoo_music_platform.tickets
+UNION ALL
+SELECT 'promo', id, status, rejection_reason, COALESCE(updated_at, created_at) FROM t_p13732906_kedoo_music_platform.promo_releases
+UNION ALL
+SELECT 'video', id, status, rejection_reason, COALESCE(updated_at, created_at) FROM t_p13732906_kedoo_music_platform.videos
+UNION ALL
+SELECT 'platform', id, status, rejection_reason, COALESCE(updated_at, created_at) FROM t_p13732906_kedoo_music_platform.platform_accounts
+ORDER BY 5;
+
+-- Time from entering moderation to the decision, precomputed per day by the maintenance function
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.moderation_sla_daily (
+    day DATE NOT NULL,
+    entity_type VARCHAR(20) NOT NULL,
+    decisions INTEGER NOT NULL,
+    accepted INTEGER NOT NULL,
+    rejected INTEGER NOT NULL,
+    avg_seconds NUMERIC(12, 1),
+    p50_seconds NUMERIC(12, 1),
+    p90_seconds NUMERIC(12, 1),
+    p99_seconds NUMERIC(12, 1),
+    max_seconds NUMERIC(12, 1),
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (day, entity_type)
+);
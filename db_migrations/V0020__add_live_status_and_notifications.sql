@@ -0,0 +1,24 @@
+-- Accepted releases go live on their release_date (processed by the scheduler function)
+ALTER TABLE t_p13732906_kedoo_music_platform.releases DROP CONSTRAINT IF EXISTS check_status;
+ALTER TABLE t_p13732906_kedoo_music_platform.releases ADD CONSTRAINT check_status
+    CHECK (status IN ('draft', 'on_moderation', 'accepted', 'rejected', 'live'));
+ALTER TABLE t_p13732906_kedoo_music_platform.releases ADD COLUMN IF NOT EXISTS live_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_releases_status_release_date ON t_p13732906_kedoo_music_platform.releases(status, release_date);
+
+-- Smartlinks of the same artist and UPC are marked when the release goes live
+ALTER TABLE t_p13732906_kedoo_music_platform.smartlinks ADD COLUMN IF NOT EXISTS release_live_at TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_smartlinks_user_id_upc ON t_p13732906_kedoo_music_platform.smartlinks(user_id, upc);
+
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.notifications (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    type VARCHAR(50) NOT NULL,
+    entity_type VARCHAR(20),
+    entity_id INTEGER,
+    payload JSONB,
+    read_at TIMESTAMP,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_notifications_user_id ON t_p13732906_kedoo_music_platform.notifications(user_id, id DESC);
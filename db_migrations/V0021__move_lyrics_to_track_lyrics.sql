@@ -0,0 +1,23 @@
+-- Lyrics leave the hot tracks rows; bodies are stored compressed by the API (encoding 'zlib')
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.track_lyrics (
+    track_id INTEGER PRIMARY KEY REFERENCES t_p13732906_kedoo_music_platform.tracks(id) ON DELETE CASCADE,
+    encoding VARCHAR(10) NOT NULL DEFAULT 'plain' CHECK (encoding IN ('plain', 'zlib')),
+    body BYTEA NOT NULL,
+    size_bytes INTEGER NOT NULL,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Compressed bodies are not worth a second pglz pass; large ones still go out of line
+ALTER TABLE t_p13732906_kedoo_music_platform.track_lyrics ALTER COLUMN body SET STORAGE EXTERNAL;
+
+-- Existing lyrics are copied as 'plain'; the maintenance task 'lyrics' recompresses them in batches
+INSERT INTO t_p13732906_kedoo_music_platform.track_lyrics (track_id, encoding, body, size_bytes)
+SELECT id, 'plain', convert_to(lyrics, 'UTF8'), octet_length(lyrics)
+FROM t_p13732906_kedoo_music_platform.tracks
+WHERE lyrics IS NOT NULL AND lyrics <> ''
+ON CONFLICT (track_id) DO NOTHING;
+
+CREATE INDEX IF NOT EXISTS idx_track_lyrics_plain ON t_p13732906_kedoo_music_platform.track_lyrics(track_id)
+    WHERE encoding = 'plain';
+
+ALTER TABLE t_p13732906_kedoo_music_platform.tracks DROP COLUMN IF EXISTS lyrics;
@@ -0,0 +1,152 @@
+-- Normalized ISRC/UPC registry across releases, tracks, smartlinks and studio entities, maintained by triggers.
+-- ISRC: upper case without separators; UPC/EAN: 13 digits (UPC-A gets a leading zero)
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.normalize_code(p_type TEXT, p_value TEXT)
+RETURNS TEXT AS $$
+    SELECT CASE
+        WHEN p_value IS NULL OR btrim(p_value) = '' THEN NULL
+        WHEN p_type = 'isrc' THEN upper(regexp_replace(p_value, '[^A-Za-z0-9]', '', 'g'))
+        WHEN length(regexp_replace(p_value, '[\s-]', '', 'g')) < 13 THEN lpad(regexp_replace(p_value, '[\s-]', '', 'g'), 13, '0')
+        ELSE regexp_replace(p_value, '[\s-]', '', 'g')
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.code_is_valid(p_type TEXT, p_code TEXT)
+RETURNS BOOLEAN AS $$
+    SELECT CASE
+        WHEN p_type = 'isrc' THEN p_code ~ '^[A-Z]{2}[A-Z0-9]{3}[0-9]{7}$'
+        WHEN p_code !~ '^[0-9]{13}$' THEN FALSE
+        ELSE (10 - (
+            SELECT SUM(substr(p_code, i, 1)::INTEGER * CASE WHEN i % 2 = 0 THEN 3 ELSE 1 END)
+            FROM generate_series(1, 12) AS i
+        ) % 10) % 10 = substr(p_code, 13, 1)::INTEGER
+    END
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.code_registry (
+    id BIGSERIAL PRIMARY KEY,
+    code_type VARCHAR(4) NOT NULL CHECK (code_type IN ('isrc', 'upc')),
+    code VARCHAR(20) NOT NULL,
+    entity_type VARCHAR(20) NOT NULL,
+    entity_id INTEGER NOT NULL,
+    field VARCHAR(30) NOT NULL,
+    user_id INTEGER,
+    is_valid BOOLEAN NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_code_registry_entity_field ON t_p13732906_kedoo_music_platform.code_registry(entity_type, entity_id, field);
+CREATE INDEX IF NOT EXISTS idx_code_registry_code ON t_p13732906_kedoo_music_platform.code_registry(code_type, code);
+-- A UPC identifies exactly one release; smartlinks and promo submissions reference it freely
+CREATE UNIQUE INDEX IF NOT EXISTS idx_code_registry_release_upc ON t_p13732906_kedoo_music_platform.code_registry(code)
+    WHERE code_type = 'upc' AND entity_type = 'release';
+
+-- TG_ARGV: entity type, then (column, code type) pairs
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.sync_code_registry()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_row JSONB;
+    v_owner INTEGER;
+    v_field TEXT;
+    v_type TEXT;
+    v_code TEXT;
+    i INTEGER := 1;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM t_p13732906_kedoo_music_platform.code_registry
+        WHERE entity_type = TG_ARGV[0] AND entity_id = OLD.id;
+        RETURN NULL;
+    END IF;
+
+    v_row := to_jsonb(NEW);
+    v_owner := (v_row ->> 'user_id')::INTEGER;
+    IF v_owner IS NULL AND v_row ? 'release_id' THEN
+        SELECT user_id INTO v_owner FROM t_p13732906_kedoo_music_platform.releases WHERE id = NEW.release_id;
+    END IF;
+
+    WHILE i < TG_NARGS LOOP
+        v_field := TG_ARGV[i];
+        v_type := TG_ARGV[i + 1];
+        v_code := t_p13732906_kedoo_music_platform.normalize_code(v_type, v_row ->> v_field);
+
+        IF v_code IS NULL THEN
+            DELETE FROM t_p13732906_kedoo_music_platform.code_registry
+            WHERE entity_type = TG_ARGV[0] AND entity_id = NEW.id AND field = v_field;
+        ELSE
+            INSERT INTO t_p13732906_kedoo_music_platform.code_registry AS c
+                (code_type, code, entity_type, entity_id, field, user_id, is_valid)
+            VALUES (v_type, v_code, TG_ARGV[0], NEW.id, v_field, v_owner,
+                    t_p13732906_kedoo_music_platform.code_is_valid(v_type, v_code))
+            ON CONFLICT (entity_type, entity_id, field) DO UPDATE
+            SET code = EXCLUDED.code, user_id = EXCLUDED.user_id, is_valid = EXCLUDED.is_valid, updated_at = CURRENT_TIMESTAMP
+            WHERE (c.code, c.user_id) IS DISTINCT FROM (EXCLUDED.code, EXCLUDED.user_id);
+        END IF;
+        i := i + 2;
+    END LOOP;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_releases_code_registry
+    AFTER INSERT OR UPDATE OF upc, user_id OR DELETE ON t_p13732906_kedoo_music_platform.releases
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.sync_code_registry('release', 'upc', 'upc');
+
+CREATE TRIGGER trg_tracks_code_registry
+    AFTER INSERT OR UPDATE OF isrc, release_id OR DELETE ON t_p13732906_kedoo_music_platform.tracks
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.sync_code_registry('track', 'isrc', 'isrc');
+
+CREATE TRIGGER trg_smartlinks_code_registry
+    AFTER INSERT OR UPDATE OF upc, user_id OR DELETE ON t_p13732906_kedoo_music_platform.smartlinks
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.sync_code_registry('smartlink', 'upc', 'upc');
+
+CREATE TRIGGER trg_promo_releases_code_registry
+    AFTER INSERT OR UPDATE OF upc, key_track_isrc, user_id OR DELETE ON t_p13732906_kedoo_music_platform.promo_releases
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.sync_code_registry('promo', 'upc', 'upc', 'key_track_isrc', 'isrc');
+
+CREATE TRIGGER trg_platform_accounts_code_registry
+    AFTER INSERT OR UPDATE OF latest_release_upc, upcoming_release_upc, user_id OR DELETE ON t_p13732906_kedoo_music_platform.platform_accounts
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.sync_code_registry('platform', 'latest_release_upc', 'upc', 'upcoming_release_upc', 'upc');
+
+-- Backfill; on duplicate release UPCs the oldest release keeps the code
+INSERT INTO t_p13732906_kedoo_music_platform.code_registry (code_type, code, entity_type, entity_id, field, user_id, is_valid)
+SELECT v.code_type, v.code, v.entity_type, v.entity_id, v.field, v.user_id,
+       t_p13732906_kedoo_music_platform.code_is_valid(v.code_type, v.code)
+FROM (
+    SELECT 'upc' AS code_type, t_p13732906_kedoo_music_platform.normalize_code('upc', upc) AS code,
+           'release' AS entity_type, id AS entity_id, 'upc' AS field, user_id, created_at
+    FROM t_p13732906_kedoo_music_platform.releases
+    UNION ALL
+    SELECT 'isrc', t_p13732906_kedoo_music_platform.normalize_code('isrc', t.isrc), 'track', t.id, 'isrc', r.user_id, t.created_at
+    FROM t_p13732906_kedoo_music_platform.tracks t
+    LEFT JOIN t_p13732906_kedoo_music_platform.releases r ON r.id = t.release_id
+    UNION ALL
+    SELECT 'upc', t_p13732906_kedoo_music_platform.normalize_code('upc', upc), 'smartlink', id, 'upc', user_id, created_at
+    FROM t_p13732906_kedoo_music_platform.smartlinks
+    UNION ALL
+    SELECT 'upc', t_p13732906_kedoo_music_platform.normalize_code('upc', upc), 'promo', id, 'upc', user_id, created_at
+    FROM t_p13732906_kedoo_music_platform.promo_releases
+    UNION ALL
+    SELECT 'isrc', t_p13732906_kedoo_music_platform.normalize_code('isrc', key_track_isrc), 'promo', id, 'key_track_isrc', user_id, created_at
+    FROM t_p13732906_kedoo_music_platform.promo_releases
+    UNION ALL
+    SELECT 'upc', t_p13732906_kedoo_music_platform.normalize_code('upc', latest_release_upc), 'platform', id, 'latest_release_upc', user_id, created_at
+    FROM t_p13732906_kedoo_music_platform.platform_accounts
+    UNION ALL
+    SELECT 'upc', t_p13732906_kedoo_music_platform.normalize_code('upc', upcoming_release_upc), 'platform', id, 'upcoming_release_upc', user_id, created_at
+    FROM t_p13732906_kedoo_music_platform.platform_accounts
+) v
+WHERE v.code IS NOT NULL
+ORDER BY v.created_at, v.entity_id
+ON CONFLICT DO NOTHING;
+
+-- New codes are handed out in blocks: one nextval reserves CODE_BLOCK_SIZE numbers for a function instance
+CREATE SEQUENCE IF NOT EXISTS t_p13732906_kedoo_music_platform.isrc_designation_seq START WITH 1 INCREMENT BY 100;
+CREATE SEQUENCE IF NOT EXISTS t_p13732906_kedoo_music_platform.upc_item_seq START WITH 1 INCREMENT BY 100;
+
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.code_allocations (
+    code_type VARCHAR(4) NOT NULL CHECK (code_type IN ('isrc', 'upc')),
+    code VARCHAR(20) NOT NULL,
+    user_id INTEGER,
+    allocated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (code_type, code)
+);
@@ -0,0 +1,67 @@
+-- Threaded ticket conversations. tickets is partitioned by created_at (PK id, created_at), so messages reference it by id without a FK.
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.ticket_messages (
+    ticket_id INTEGER NOT NULL,
+    id BIGSERIAL,
+    author_id INTEGER,
+    author_role VARCHAR(10) NOT NULL CHECK (author_role IN ('user', 'moderator')),
+    body TEXT NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (ticket_id, id)
+);
+
+-- Per-participant unread counters live on the ticket row, so the list shows badges without reading messages
+ALTER TABLE t_p13732906_kedoo_music_platform.tickets
+    ADD COLUMN IF NOT EXISTS last_message_id BIGINT,
+    ADD COLUMN IF NOT EXISTS last_message_at TIMESTAMP,
+    ADD COLUMN IF NOT EXISTS unread_user INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS unread_moderator INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS user_read_id BIGINT NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS moderator_read_id BIGINT NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_tickets_unread_user ON t_p13732906_kedoo_music_platform.tickets(user_id) WHERE unread_user > 0;
+CREATE INDEX IF NOT EXISTS idx_tickets_unread_moderator ON t_p13732906_kedoo_music_platform.tickets(last_message_at) WHERE unread_moderator > 0;
+
+-- Existing conversations: the opening message, then the moderator response if there is one
+INSERT INTO t_p13732906_kedoo_music_platform.ticket_messages (ticket_id, author_id, author_role, body, created_at)
+SELECT ticket_id, author_id, author_role, body, created_at
+FROM (
+    SELECT id AS ticket_id, user_id AS author_id, 'user' AS author_role, message AS body, created_at, 0 AS seq
+    FROM t_p13732906_kedoo_music_platform.tickets
+    WHERE message IS NOT NULL
+    UNION ALL
+    SELECT id, NULL, 'moderator', moderator_response, updated_at, 1
+    FROM t_p13732906_kedoo_music_platform.tickets
+    WHERE moderator_response IS NOT NULL AND moderator_response <> ''
+) m
+ORDER BY ticket_id, seq;
+
+-- Backfilled history counts as read by both sides
+UPDATE t_p13732906_kedoo_music_platform.tickets t
+SET last_message_id = m.last_id, last_message_at = m.last_at, user_read_id = m.last_id, moderator_read_id = m.last_id
+FROM (
+    SELECT ticket_id, MAX(id) AS last_id, MAX(created_at) AS last_at
+    FROM t_p13732906_kedoo_music_platform.ticket_messages
+    GROUP BY ticket_id
+) m
+WHERE t.id = m.ticket_id;
+
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.bump_ticket_unread()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE t_p13732906_kedoo_music_platform.tickets
+    SET last_message_id = NEW.id,
+        last_message_at = NEW.created_at,
+        -- Replying means the author has read the thread up to this message
+        unread_user = CASE WHEN NEW.author_role = 'user' THEN 0 ELSE unread_user + 1 END,
+        unread_moderator = CASE WHEN NEW.author_role = 'moderator' THEN 0 ELSE unread_moderator + 1 END,
+        user_read_id = CASE WHEN NEW.author_role = 'user' THEN NEW.id ELSE user_read_id END,
+        moderator_read_id = CASE WHEN NEW.author_role = 'moderator' THEN NEW.id ELSE moderator_read_id END,
+        updated_at = CURRENT_TIMESTAMP
+    WHERE id = NEW.ticket_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_ticket_messages_unread
+    AFTER INSERT ON t_p13732906_kedoo_music_platform.ticket_messages
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.bump_ticket_unread();
@@ -0,0 +1,62 @@
+-- Soft delete for releases: DELETE only stamps deleted_at, the maintenance purge task removes dependent rows in batches
+ALTER TABLE t_p13732906_kedoo_music_platform.releases ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
+
+-- Read paths filter on deleted_at IS NULL; the list/scheduler indexes only cover live rows
+DROP INDEX IF EXISTS t_p13732906_kedoo_music_platform.idx_releases_user_id_created_at;
+DROP INDEX IF EXISTS t_p13732906_kedoo_music_platform.idx_releases_status_created_at;
+DROP INDEX IF EXISTS t_p13732906_kedoo_music_platform.idx_releases_created_at;
+DROP INDEX IF EXISTS t_p13732906_kedoo_music_platform.idx_releases_status_release_date;
+
+CREATE INDEX IF NOT EXISTS idx_releases_user_id_created_at ON t_p13732906_kedoo_music_platform.releases(user_id, created_at DESC)
+    WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_releases_status_created_at ON t_p13732906_kedoo_music_platform.releases(status, created_at DESC)
+    WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_releases_created_at ON t_p13732906_kedoo_music_platform.releases(created_at DESC)
+    WHERE deleted_at IS NULL;
+CREATE INDEX IF NOT EXISTS idx_releases_status_release_date ON t_p13732906_kedoo_music_platform.releases(status, release_date)
+    WHERE deleted_at IS NULL;
+-- Purge queue
+CREATE INDEX IF NOT EXISTS idx_releases_deleted_at ON t_p13732906_kedoo_music_platform.releases(deleted_at)
+    WHERE deleted_at IS NOT NULL;
+
+-- Purge deletes royalty facts by release in batches
+CREATE INDEX IF NOT EXISTS idx_royalty_facts_release_id ON t_p13732906_kedoo_music_platform.royalty_facts(release_id);
+
+-- Media URLs that lost a reference; the worker gc task deletes the file once nothing points at it
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.media_gc_queue (
+    url TEXT PRIMARY KEY,
+    queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_media_gc_queue_queued_at ON t_p13732906_kedoo_music_platform.media_gc_queue(queued_at);
+
+-- TG_ARGV[0]: column with the media URL
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.queue_media_gc()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_old TEXT := to_jsonb(OLD) ->> TG_ARGV[0];
+BEGIN
+    IF v_old IS NOT NULL AND (TG_OP = 'DELETE' OR v_old IS DISTINCT FROM to_jsonb(NEW) ->> TG_ARGV[0]) THEN
+        INSERT INTO t_p13732906_kedoo_music_platform.media_gc_queue (url)
+        VALUES (v_old)
+        ON CONFLICT (url) DO UPDATE SET queued_at = CURRENT_TIMESTAMP;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_tracks_media_gc
+    AFTER UPDATE OF audio_url OR DELETE ON t_p13732906_kedoo_music_platform.tracks
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.queue_media_gc('audio_url');
+
+CREATE TRIGGER trg_releases_media_gc
+    AFTER UPDATE OF cover_url OR DELETE ON t_p13732906_kedoo_music_platform.releases
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.queue_media_gc('cover_url');
+
+CREATE TRIGGER trg_smartlinks_media_gc
+    AFTER UPDATE OF cover_url OR DELETE ON t_p13732906_kedoo_music_platform.smartlinks
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.queue_media_gc('cover_url');
+
+CREATE TRIGGER trg_videos_media_gc
+    AFTER UPDATE OF cover_url OR DELETE ON t_p13732906_kedoo_music_platform.videos
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.queue_media_gc('cover_url');
@@ -0,0 +1,3 @@
+-- Per-platform release URLs found by the smartlinks resolver ({"spotify": "https://...", ...})
+ALTER TABLE t_p13732906_kedoo_music_platform.smartlinks ADD COLUMN IF NOT EXISTS platform_links JSONB;
+ALTER TABLE t_p13732906_kedoo_music_platform.smartlinks ADD COLUMN IF NOT EXISTS platform_links_resolved_at TIMESTAMP;
@@ -0,0 +1,6 @@
+-- A release submitted for moderation while some of its tracks still wait for the fingerprint match stays in draft
+-- with moderation_requested_at set; the worker fingerprint_match task moves it to on_moderation once every track is scored
+ALTER TABLE t_p13732906_kedoo_music_platform.releases ADD COLUMN IF NOT EXISTS moderation_requested_at TIMESTAMP;
+
+CREATE INDEX IF NOT EXISTS idx_releases_moderation_requested ON t_p13732906_kedoo_music_platform.releases(moderation_requested_at)
+    WHERE moderation_requested_at IS NOT NULL AND deleted_at IS NULL;
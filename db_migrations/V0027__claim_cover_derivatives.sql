@@ -0,0 +1,3 @@
+-- The derivatives task claims covers by stamping derivatives_started_at and commits before rendering,
+-- so no row lock is held during Pillow and storage work; a stale stamp is reclaimed by the next run
+ALTER TABLE t_p13732906_kedoo_music_platform.media_files ADD COLUMN IF NOT EXISTS derivatives_started_at TIMESTAMP;
@@ -0,0 +1,29 @@
+-- Smartlinks and promo submissions of a deleted release, captured when the release is deleted.
+-- The purge task deletes exactly these rows instead of re-matching by UPC later, when the code may already
+-- belong to something else; each row is consumed together with the entity it points at
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.release_purge_dependents (
+    release_id INTEGER NOT NULL,
+    entity_type VARCHAR(20) NOT NULL CHECK (entity_type IN ('smartlink', 'promo')),
+    entity_id INTEGER NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (release_id, entity_type, entity_id)
+);
+
+-- Releases already waiting for the purge
+INSERT INTO t_p13732906_kedoo_music_platform.release_purge_dependents (release_id, entity_type, entity_id)
+SELECT r.id, c.entity_type, c.entity_id
+FROM t_p13732906_kedoo_music_platform.releases r
+JOIN t_p13732906_kedoo_music_platform.code_registry c
+    ON c.code_type = 'upc' AND c.code = t_p13732906_kedoo_music_platform.normalize_code('upc', r.upc)
+   AND c.user_id = r.user_id AND c.entity_type IN ('smartlink', 'promo') AND c.field = 'upc'
+WHERE r.deleted_at IS NOT NULL AND r.upc IS NOT NULL
+ON CONFLICT DO NOTHING;
+
+-- Release UPCs of deleted releases were released from the registry at delete time; restore them until the purge
+-- removes the release row (the registry trigger drops the entry then)
+INSERT INTO t_p13732906_kedoo_music_platform.code_registry (code_type, code, entity_type, entity_id, field, user_id, is_valid)
+SELECT 'upc', t_p13732906_kedoo_music_platform.normalize_code('upc', r.upc), 'release', r.id, 'upc', r.user_id,
+       t_p13732906_kedoo_music_platform.code_is_valid('upc', t_p13732906_kedoo_music_platform.normalize_code('upc', r.upc))
+FROM t_p13732906_kedoo_music_platform.releases r
+WHERE r.deleted_at IS NOT NULL AND r.upc IS NOT NULL AND btrim(r.upc) <> ''
+ON CONFLICT DO NOTHING;
@@ -0,0 +1,31 @@
+-- V0011 kept the original tables as *_unpartitioned until the partitioned copies were verified.
+-- A copy is dropped when every one of its rows is present in the partitioned table by (id, created_at).
+-- A copy with missing rows is kept and reported: those rows were deleted or archived since V0011, or never copied,
+-- and have to be reviewed before dropping the copy by hand
+DO $$
+DECLARE
+    t TEXT;
+    total BIGINT;
+    missing BIGINT;
+BEGIN
+    FOREACH t IN ARRAY ARRAY['releases', 'tickets', 'promo_releases', 'videos', 'platform_accounts'] LOOP
+        IF to_regclass(format('t_p13732906_kedoo_music_platform.%I', t || '_unpartitioned')) IS NULL THEN
+            CONTINUE;
+        END IF;
+
+        EXECUTE format(
+            'SELECT COUNT(*), COUNT(*) FILTER (WHERE NOT EXISTS (
+                 SELECT 1 FROM t_p13732906_kedoo_music_platform.%I p WHERE p.id = u.id AND p.created_at = u.created_at
+             ))
+             FROM t_p13732906_kedoo_music_platform.%I u',
+            t, t || '_unpartitioned'
+        ) INTO total, missing;
+
+        IF missing = 0 THEN
+            EXECUTE format('DROP TABLE t_p13732906_kedoo_music_platform.%I', t || '_unpartitioned');
+            RAISE NOTICE '%_unpartitioned: % rows verified, dropped', t, total;
+        ELSE
+            RAISE WARNING '%_unpartitioned: % of % rows are not in %, kept for manual review', t, missing, total, t;
+        END IF;
+    END LOOP;
+END $$;
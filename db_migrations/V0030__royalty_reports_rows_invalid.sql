@@ -0,0 +1,2 @@
+-- Rows whose streams or revenue cell could not be parsed are counted here instead of being ingested as silent zeros
+ALTER TABLE t_p13732906_kedoo_music_platform.royalty_reports ADD COLUMN IF NOT EXISTS rows_invalid BIGINT;
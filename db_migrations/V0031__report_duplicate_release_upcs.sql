@@ -0,0 +1,55 @@
+-- The V0022 backfill skipped every release whose UPC was already held by an older release (ON CONFLICT DO NOTHING),
+-- so those duplicates were neither registered nor reported. They are recorded here until the release gets another
+-- UPC or is deleted; the releases API already answers 409 with the owner when such a release is saved unchanged
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.code_registry_conflicts (
+    release_id INTEGER PRIMARY KEY,
+    code VARCHAR(20) NOT NULL,
+    owner_release_id INTEGER NOT NULL,
+    user_id INTEGER,
+    detected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_code_registry_conflicts_code ON t_p13732906_kedoo_music_platform.code_registry_conflicts(code);
+
+INSERT INTO t_p13732906_kedoo_music_platform.code_registry_conflicts (release_id, code, owner_release_id, user_id)
+SELECT r.id, c.code, c.entity_id, r.user_id
+FROM t_p13732906_kedoo_music_platform.releases r
+JOIN t_p13732906_kedoo_music_platform.code_registry c
+  ON c.code_type = 'upc' AND c.entity_type = 'release'
+ AND c.code = t_p13732906_kedoo_music_platform.normalize_code('upc', r.upc)
+WHERE c.entity_id <> r.id
+  AND NOT EXISTS (
+      SELECT 1 FROM t_p13732906_kedoo_music_platform.code_registry own
+      WHERE own.entity_type = 'release' AND own.entity_id = r.id AND own.field = 'upc'
+  )
+ON CONFLICT (release_id) DO NOTHING;
+
+DO $$
+DECLARE
+    conflicts BIGINT;
+BEGIN
+    SELECT COUNT(*) INTO conflicts FROM t_p13732906_kedoo_music_platform.code_registry_conflicts;
+    IF conflicts > 0 THEN
+        RAISE WARNING '% releases share a UPC with an older release, see code_registry_conflicts', conflicts;
+    END IF;
+END $$;
+
+-- A conflict is resolved once the release carries a different UPC (its own registry row is then written by
+-- trg_releases_code_registry) or is deleted
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.resolve_code_registry_conflict()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        DELETE FROM t_p13732906_kedoo_music_platform.code_registry_conflicts WHERE release_id = OLD.id;
+    ELSE
+        DELETE FROM t_p13732906_kedoo_music_platform.code_registry_conflicts
+        WHERE release_id = NEW.id
+          AND code IS DISTINCT FROM t_p13732906_kedoo_music_platform.normalize_code('upc', NEW.upc);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_releases_code_registry_conflict
+    AFTER UPDATE OF upc OR DELETE ON t_p13732906_kedoo_music_platform.releases
+    FOR EACH ROW EXECUTE FUNCTION t_p13732906_kedoo_music_platform.resolve_code_registry_conflict();
@@ -0,0 +1,16 @@
+-- The five designation digits of an ISRC number recordings within the year in the code, so the counter restarts
+-- every year instead of running on isrc_designation_seq across years. The codes function reserves blocks of 100
+CREATE TABLE IF NOT EXISTS t_p13732906_kedoo_music_platform.isrc_designation_counters (
+    year SMALLINT PRIMARY KEY,
+    last_number INTEGER NOT NULL
+);
+
+-- Years that already have codes continue after the highest designation handed out for them
+INSERT INTO t_p13732906_kedoo_music_platform.isrc_designation_counters (year, last_number)
+SELECT 2000 + substr(code, 6, 2)::INTEGER, MAX(substr(code, 8, 5)::INTEGER)
+FROM t_p13732906_kedoo_music_platform.code_allocations
+WHERE code_type = 'isrc'
+GROUP BY 1
+ON CONFLICT (year) DO UPDATE SET last_number = GREATEST(
+    t_p13732906_kedoo_music_platform.isrc_designation_counters.last_number, EXCLUDED.last_number
+);
@@ -0,0 +1,103 @@
+-- The V0010/V0015 row-level triggers recounted a release once per updated or deleted track, so replacing or
+-- re-analysing an album recounted it as many times as it has tracks. The stats are now maintained once per statement
+-- from transition tables: inserts are applied as a per-release delta, updates and deletes recount each affected
+-- release once. Transition tables cannot be combined with several events or a column list, hence three triggers
+-- and an explicit check for changed stats columns on update
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.refresh_release_track_stats(p_release_ids INTEGER[])
+RETURNS VOID AS $$
+BEGIN
+    UPDATE t_p13732906_kedoo_music_platform.releases r
+    SET track_count = s.track_count,
+        has_any_explicit = s.has_any_explicit,
+        languages = s.languages,
+        total_duration_seconds = s.total_duration_seconds
+    FROM (
+        SELECT ids.release_id,
+               COUNT(t.id)::INTEGER AS track_count,
+               COALESCE(BOOL_OR(t.has_explicit), FALSE) AS has_any_explicit,
+               COALESCE(ARRAY_AGG(DISTINCT t.language::TEXT) FILTER (WHERE t.language IS NOT NULL), '{}') AS languages,
+               COALESCE(SUM(t.duration_seconds), 0) AS total_duration_seconds
+        FROM (SELECT DISTINCT unnest(p_release_ids) AS release_id) ids
+        LEFT JOIN t_p13732906_kedoo_music_platform.tracks t ON t.release_id = ids.release_id
+        GROUP BY ids.release_id
+    ) s
+    WHERE r.id = s.release_id;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.tracks_release_stats_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE t_p13732906_kedoo_music_platform.releases r
+    SET track_count = r.track_count + d.track_count,
+        has_any_explicit = r.has_any_explicit OR d.has_any_explicit,
+        languages = ARRAY(SELECT DISTINCT l FROM unnest(r.languages || d.languages) AS l ORDER BY l),
+        total_duration_seconds = r.total_duration_seconds + d.total_duration_seconds
+    FROM (
+        SELECT release_id,
+               COUNT(*)::INTEGER AS track_count,
+               COALESCE(BOOL_OR(has_explicit), FALSE) AS has_any_explicit,
+               COALESCE(ARRAY_AGG(DISTINCT language::TEXT) FILTER (WHERE language IS NOT NULL), '{}') AS languages,
+               COALESCE(SUM(duration_seconds), 0) AS total_duration_seconds
+        FROM new_tracks
+        GROUP BY release_id
+    ) d
+    WHERE r.id = d.release_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.tracks_release_stats_update()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- Only rows whose stats columns changed; analysis status and metadata edits leave the release alone
+    PERFORM t_p13732906_kedoo_music_platform.refresh_release_track_stats(ARRAY(
+        SELECT o.release_id
+        FROM old_tracks o
+        LEFT JOIN new_tracks n ON n.id = o.id
+        WHERE n.id IS NULL
+           OR (o.release_id, o.has_explicit, o.language, o.duration_seconds)
+              IS DISTINCT FROM (n.release_id, n.has_explicit, n.language, n.duration_seconds)
+        UNION
+        SELECT n.release_id
+        FROM new_tracks n
+        LEFT JOIN old_tracks o ON o.id = n.id
+        WHERE o.id IS NULL
+           OR (o.release_id, o.has_explicit, o.language, o.duration_seconds)
+              IS DISTINCT FROM (n.release_id, n.has_explicit, n.language, n.duration_seconds)
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION t_p13732906_kedoo_music_platform.tracks_release_stats_delete()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM t_p13732906_kedoo_music_platform.refresh_release_track_stats(ARRAY(
+        SELECT DISTINCT release_id FROM old_tracks
+    ));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_tracks_release_stats_insert ON t_p13732906_kedoo_music_platform.tracks;
+DROP TRIGGER IF EXISTS trg_tracks_release_stats_update ON t_p13732906_kedoo_music_platform.tracks;
+DROP TRIGGER IF EXISTS trg_tracks_release_stats_delete ON t_p13732906_kedoo_music_platform.tracks;
+DROP FUNCTION IF EXISTS t_p13732906_kedoo_music_platform.tracks_maintain_release_stats();
+DROP FUNCTION IF EXISTS t_p13732906_kedoo_music_platform.refresh_release_track_stats(INTEGER);
+
+CREATE TRIGGER trg_tracks_release_stats_insert
+    AFTER INSERT ON t_p13732906_kedoo_music_platform.tracks
+    REFERENCING NEW TABLE AS new_tracks
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p13732906_kedoo_music_platform.tracks_release_stats_insert();
+
+CREATE TRIGGER trg_tracks_release_stats_update
+    AFTER UPDATE ON t_p13732906_kedoo_music_platform.tracks
+    REFERENCING OLD TABLE AS old_tracks NEW TABLE AS new_tracks
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p13732906_kedoo_music_platform.tracks_release_stats_update();
+
+CREATE TRIGGER trg_tracks_release_stats_delete
+    AFTER DELETE ON t_p13732906_kedoo_music_platform.tracks
+    REFERENCING OLD TABLE AS old_tracks
+    FOR EACH STATEMENT EXECUTE FUNCTION t_p13732906_kedoo_music_platform.tracks_release_stats_delete();
+
@@ -0,0 +1,70 @@
+"""Проверка общих блоков кода в функциях backend/.
+
+Запуск: python scripts/check_shared_blocks.py
+
+Функции деплоятся по отдельности и общих модулей не видят, поэтому общий код (идемпотентность, лимиты запросов,
+сжатие ответов) лежит копиями в каждой функции между строками «# >>> shared: <имя>» и «# <<< shared: <имя>».
+Скрипт находит все копии каждого блока и падает, если они различаются хотя бы байтом или маркеры не парные.
+Правка вносится в одну копию и переносится в остальные, пока проверка не пройдёт.
+"""
+import difflib
+import glob
+import os
+import re
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+MARKER = re.compile(r'^# (>>>|<<<) shared: ([a-z_]+)$')
+
+def collect_blocks(paths: list) -> tuple:
+    """Имя блока -> {файл: текст}; плюс список ошибок разметки"""
+    blocks = {}
+    errors = []
+    for full_path in paths:
+        path = os.path.relpath(full_path, ROOT)
+        with open(full_path, encoding='utf-8') as f:
+            lines = f.read().split('\n')
+        name, start = None, None
+        for number, line in enumerate(lines, 1):
+            match = MARKER.match(line)
+            if not match:
+                continue
+            kind, marker_name = match.groups()
+            if kind == '>>>':
+                if name:
+                    errors.append(f'{path}:{number}: block {marker_name} opened inside {name}')
+                name, start = marker_name, number
+            elif marker_name != name:
+                errors.append(f'{path}:{number}: closing {marker_name} without opening it')
+            else:
+                if path in blocks.setdefault(name, {}):
+                    errors.append(f'{path}:{number}: block {name} appears twice')
+                blocks[name][path] = '\n'.join(lines[start:number - 1])
+                name = None
+        if name:
+            errors.append(f'{path}:{start}: block {name} is not closed')
+    return blocks, errors
+
+def compare_blocks(blocks: dict) -> list:
+    errors = []
+    for name, copies in sorted(blocks.items()):
+        reference_path, reference = next(iter(sorted(copies.items())))
+        for path, text in sorted(copies.items()):
+            if text == reference:
+                continue
+            diff = difflib.unified_diff(reference.split('\n'), text.split('\n'), reference_path, path, lineterm='', n=1)
+            errors.append(f'shared block {name} differs:\n' + '\n'.join(diff))
+    return errors
+
+def main() -> int:
+    paths = sorted(glob.glob(os.path.join(ROOT, 'backend', '*', 'index.py')))
+    blocks, errors = collect_blocks(paths)
+    errors += compare_blocks(blocks)
+    for error in errors:
+        print(error, file=sys.stderr)
+    for name, copies in sorted(blocks.items()):
+        print(f"{name}: {len(copies)} copies ({', '.join(path.split(os.sep)[1] for path in sorted(copies))})")
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -14,18 +14,32 @@ export interface User {
   theme: string;
 }
 
+// Кто меняет статус: попадает в журнал status_events
+export interface ActorFields {
+  actor_id?: number;
+}
+
+export type CoverThumbnails = Record<'64' | '256' | '640', { webp: string; jpeg: string }>;
+
 export interface Release {
   id: number;
   user_id: number;
   album_name: string;
   artists: string;
   cover_url?: string;
+  cover_thumbnails?: CoverThumbnails | null;
   upc?: string;
   old_release_date?: string;
   release_date?: string;
   is_rerelease: boolean;
-  status: 'draft' | 'on_moderation' | 'accepted' | 'rejected';
+  status: 'draft' | 'on_moderation' | 'accepted' | 'rejected' | 'live';
+  live_at?: string;
+  moderation_requested_at?: string | null;
   rejection_reason?: string;
+  track_count?: number;
+  has_any_explicit?: boolean;
+  languages?: string[];
+  total_duration_seconds?: number;
   tracks?: Track[];
   created_at: string;
   updated_at: string;
@@ -46,6 +60,14 @@ export interface Track {
   language?: string;
   lyrics?: string;
   track_order?: number;
+  duration_seconds?: number;
+  loudness_lufs?: number;
+  peak_dbfs?: number;
+  suggested_tiktok_moment?: string;
+  analysis_status?: 'pending' | 'processing' | 'done' | 'failed';
+  fingerprint_match_track_id?: number;
+  fingerprint_match_release_id?: number;
+  fingerprint_match_score?: number;
 }
 
 export interface Smartlink {
@@ -54,14 +76,26 @@ export interface Smartlink {
   release_name: string;
   artists: string;
   cover_url?: string;
+  cover_thumbnails?: CoverThumbnails | null;
   upc?: string;
   status: 'draft' | 'on_moderation' | 'accepted' | 'rejected';
   rejection_reason?: string;
   smartlink_url?: string;
+  platform_links?: Partial<Record<DspPlatform, string>> | null;
+  release_live_at?: string;
   created_at: string;
   updated_at: string;
 }
 
+export type DspPlatform = 'yandex_music' | 'vk_music' | 'spotify' | 'apple_music' | 'youtube_music';
+
+export interface PlatformLinkResult {
+  status: 'found' | 'not_found' | 'timeout' | 'error' | 'not_configured';
+  url?: string | null;
+  cached?: boolean;
+  error?: string;
+}
+
 export interface PromoRelease {
   id: number;
   user_id: number;
@@ -85,6 +119,7 @@ export interface Video {
   video_name: string;
   artist_name: string;
   cover_url?: string;
+  cover_thumbnails?: CoverThumbnails | null;
   status: 'on_moderation' | 'accepted' | 'rejected';
   rejection_reason?: string;
   created_at: string;
@@ -113,9 +148,14 @@ export interface Ticket {
   id: number;
   user_id: number;
   subject: string;
-  message: string;
+  message?: string;
   status: 'open' | 'closed';
   moderator_response?: string;
+  has_response?: boolean;
+  last_message_id?: number | null;
+  last_message_at?: string | null;
+  unread_user?: number;
+  unread_moderator?: number;
   username?: string;
   user_email?: string;
   email?: string;
@@ -123,6 +163,15 @@ export interface Ticket {
   updated_at: string;
 }
 
+export interface TicketMessage {
+  ticket_id: number;
+  id: number;
+  author_id: number | null;
+  author_role: 'user' | 'moderator';
+  body: string;
+  created_at: string;
+}
+
 async function apiRequest(url: string, options: RequestInit = {}) {
   const response = await fetch(url, {
     ...options,
@@ -179,8 +228,15 @@ export const releasesAPI = {
     return apiRequest(`${API_URLS.releases}?${params.toString()}`);
   },
 
-  getById: async (release_id: number) => {
-    return apiRequest(`${API_URLS.releases}?release_id=${release_id}`);
+  getById: async (release_id: number, include?: 'lyrics'[]) => {
+    const params = new URLSearchParams({ release_id: release_id.toString() });
+    if (include?.length) params.append('include', include.join(','));
+
+    return apiRequest(`${API_URLS.releases}?${params.toString()}`);
+  },
+
+  getLyrics: async (track_id: number): Promise<{ track_id: number; lyrics: string | null }> => {
+    return apiRequest(`${API_URLS.releases}?track_id=${track_id}`);
   },
 
   create: async (releaseData: Partial<Release>) => {
@@ -190,7 +246,7 @@ export const releasesAPI = {
     });
   },
 
-  update: async (release_id: number, releaseData: Partial<Release>) => {
+  update: async (release_id: number, releaseData: Partial<Release> & ActorFields) => {
     return apiRequest(API_URLS.releases, {
       method: 'PUT',
       body: JSON.stringify({ release_id, ...releaseData }),
@@ -205,10 +261,11 @@ export const releasesAPI = {
 };
 
 export const ticketsAPI = {
-  getAll: async (user_id?: number, status?: string) => {
+  getAll: async (user_id?: number, status?: string, include?: ('message' | 'moderator_response')[]) => {
     const params = new URLSearchParams();
     if (user_id) params.append('user_id', user_id.toString());
     if (status) params.append('status', status);
+    if (include?.length) params.append('include', include.join(','));
     
     return apiRequest(`${API_URLS.tickets}?${params.toString()}`);
   },
@@ -224,12 +281,43 @@ export const ticketsAPI = {
     });
   },
 
-  update: async (ticket_id: number, data: { status?: string; moderator_response?: string }) => {
+  update: async (ticket_id: number, data: { status?: string; moderator_response?: string } & ActorFields) => {
     return apiRequest(API_URLS.tickets, {
       method: 'PUT',
       body: JSON.stringify({ ticket_id, ...data }),
     });
   },
+
+  // since_id — только новые сообщения после последнего полученного, before_id — более ранняя страница
+  getMessages: async (ticket_id: number, cursor: { since_id?: number; before_id?: number; limit?: number } = {}) => {
+    const params = new URLSearchParams({ ticket_id: ticket_id.toString(), action: 'messages' });
+    if (cursor.since_id) params.append('since_id', cursor.since_id.toString());
+    if (cursor.before_id) params.append('before_id', cursor.before_id.toString());
+    if (cursor.limit) params.append('limit', cursor.limit.toString());
+
+    return apiRequest(`${API_URLS.tickets}?${params.toString()}`);
+  },
+
+  sendMessage: async (ticket_id: number, author_role: 'user' | 'moderator', message: string, author_id?: number) => {
+    return apiRequest(API_URLS.tickets, {
+      method: 'POST',
+      body: JSON.stringify({ ticket_id, author_role, message, author_id }),
+    });
+  },
+
+  markRead: async (ticket_id: number, role: 'user' | 'moderator', last_read_id?: number) => {
+    return apiRequest(API_URLS.tickets, {
+      method: 'PUT',
+      body: JSON.stringify({ ticket_id, action: 'read', role, last_read_id }),
+    });
+  },
+
+  getUnread: async (user_id?: number) => {
+    const params = new URLSearchParams({ action: 'unread' });
+    if (user_id) params.append('user_id', user_id.toString());
+
+    return apiRequest(`${API_URLS.tickets}?${params.toString()}`);
+  },
 };
 
 export const smartlinksAPI = {
@@ -252,12 +340,20 @@ export const smartlinksAPI = {
     });
   },
 
-  update: async (smartlink_id: number, data: Partial<Smartlink>) => {
+  update: async (smartlink_id: number, data: Partial<Smartlink> & ActorFields) => {
     return apiRequest(API_URLS.smartlinks, {
       method: 'PUT',
       body: JSON.stringify({ smartlink_id, ...data }),
     });
   },
+
+  // Поиск ссылок на релиз по UPC на всех площадках сразу; force — мимо кэша резолвера
+  resolveLinks: async (smartlink_id: number, options: { platforms?: DspPlatform[]; force?: boolean } = {}) => {
+    return apiRequest(API_URLS.smartlinks, {
+      method: 'PUT',
+      body: JSON.stringify({ smartlink_id, action: 'resolve_links', ...options }),
+    }) as Promise<{ smartlink: Smartlink; platforms: Record<DspPlatform, PlatformLinkResult> }>;
+  },
 };
 
 export const studioAPI = {
@@ -277,7 +373,7 @@ export const studioAPI = {
       });
     },
 
-    update: async (id: number, data: Partial<PromoRelease>) => {
+    update: async (id: number, data: Partial<PromoRelease> & ActorFields) => {
       return apiRequest(`${API_URLS.studio}?type=promo`, {
         method: 'PUT',
         body: JSON.stringify({ id, ...data }),
@@ -301,7 +397,7 @@ export const studioAPI = {
       });
     },
 
-    update: async (id: number, data: Partial<Video>) => {
+    update: async (id: number, data: Partial<Video> & ActorFields) => {
       return apiRequest(`${API_URLS.studio}?type=video`, {
         method: 'PUT',
         body: JSON.stringify({ id, ...data }),
@@ -325,7 +421,7 @@ export const studioAPI = {
       });
     },
 
-    update: async (id: number, data: Partial<PlatformAccount>) => {
+    update: async (id: number, data: Partial<PlatformAccount> & ActorFields) => {
       return apiRequest(`${API_URLS.studio}?type=platform`, {
         method: 'PUT',
         body: JSON.stringify({ id, ...data }),
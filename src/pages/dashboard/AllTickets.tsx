@@ -8,9 +8,11 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle } f
 import Icon from '@/components/ui/icon';
 import { ticketsAPI, Ticket } from '@/lib/api';
 import { useToast } from '@/hooks/use-toast';
+import { useAuth } from '@/contexts/AuthContext';
 
 export default function AllTickets() {
   const { toast } = useToast();
+  const { user } = useAuth();
   const [tickets, setTickets] = useState<Ticket[]>([]);
   const [isLoading, setIsLoading] = useState(true);
   const [selectedTicket, setSelectedTicket] = useState<Ticket | null>(null);
@@ -24,7 +26,7 @@ export default function AllTickets() {
   const loadTickets = async () => {
     try {
       setIsLoading(true);
-      const response = await ticketsAPI.getAll();
+      const response = await ticketsAPI.getAll(undefined, undefined, ['message', 'moderator_response']);
       setTickets(response.tickets || []);
     } catch (error) {
       toast({
@@ -51,6 +53,7 @@ export default function AllTickets() {
       await ticketsAPI.update(selectedTicket.id, {
         status: 'closed',
         moderator_response: responseText,
+        actor_id: user?.id,
       });
       toast({ title: 'Успешно', description: 'Ответ отправлен' });
       setIsDialogOpen(false);
@@ -105,7 +108,12 @@ export default function AllTickets() {
                         От: {ticket.username || ticket.user_email} • {new Date(ticket.created_at).toLocaleDateString('ru-RU')}
                       </p>
                     </div>
-                    {getStatusBadge(ticket.status)}
+                    <div className="flex gap-2">
+                      {!!ticket.unread_moderator && (
+                        <Badge variant="destructive">Новых: {ticket.unread_moderator}</Badge>
+                      )}
+                      {getStatusBadge(ticket.status)}
+                    </div>
                   </div>
 
                   <div className="p-3 bg-muted rounded-lg">
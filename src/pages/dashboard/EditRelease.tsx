@@ -36,7 +36,7 @@ export default function EditRelease() {
       if (!id) return;
 
       try {
-        const response = await releasesAPI.getById(parseInt(id));
+        const response = await releasesAPI.getById(parseInt(id), ['lyrics']);
         const data: Release = response.release || response;
 
         if (data.status !== 'draft' && data.status !== 'rejected') {
@@ -9,9 +9,11 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle } f
 import Icon from '@/components/ui/icon';
 import { releasesAPI, Release } from '@/lib/api';
 import { useToast } from '@/hooks/use-toast';
+import { useAuth } from '@/contexts/AuthContext';
 
 export default function ModerationReleases() {
   const { toast } = useToast();
+  const { user } = useAuth();
   const [releases, setReleases] = useState<Release[]>([]);
   const [selectedRelease, setSelectedRelease] = useState<Release | null>(null);
   const [isLoading, setIsLoading] = useState(true);
@@ -38,7 +40,7 @@ export default function ModerationReleases() {
 
   const openRelease = async (release: Release, mode: 'view' | 'accept' | 'reject') => {
     try {
-      const response = await releasesAPI.getById(release.id);
+      const response = await releasesAPI.getById(release.id, ['lyrics']);
       const fullRelease = response.release || response;
       setSelectedRelease(fullRelease);
       setViewMode(mode);
@@ -62,6 +64,7 @@ export default function ModerationReleases() {
         status: 'accepted',
         upc: upcInput || undefined,
         tracks: updatedTracks,
+        actor_id: user?.id,
       });
       toast({ title: 'Успешно', description: 'Релиз принят' });
       closeDialog();
@@ -81,6 +84,7 @@ export default function ModerationReleases() {
       await releasesAPI.update(selectedRelease.id, {
         status: 'rejected',
         rejection_reason: rejectionReason,
+        actor_id: user?.id,
       });
       toast({ title: 'Успешно', description: 'Релиз отклонён' });
       closeDialog();
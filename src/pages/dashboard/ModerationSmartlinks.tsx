@@ -9,15 +9,18 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle } f
 import Icon from '@/components/ui/icon';
 import { smartlinksAPI, Smartlink } from '@/lib/api';
 import { useToast } from '@/hooks/use-toast';
+import { useAuth } from '@/contexts/AuthContext';
 
 export default function ModerationSmartlinks() {
   const { toast } = useToast();
+  const { user } = useAuth();
   const [smartlinks, setSmartlinks] = useState<Smartlink[]>([]);
   const [isLoading, setIsLoading] = useState(true);
   const [selectedSmartlink, setSelectedSmartlink] = useState<Smartlink | null>(null);
   const [action, setAction] = useState<'accept' | 'reject' | null>(null);
   const [smartlinkUrl, setSmartlinkUrl] = useState('');
   const [rejectionReason, setRejectionReason] = useState('');
+  const [resolvingId, setResolvingId] = useState<number | null>(null);
 
   useEffect(() => {
     loadSmartlinks();
@@ -53,6 +56,7 @@ export default function ModerationSmartlinks() {
       await smartlinksAPI.update(selectedSmartlink.id, {
         status: 'accepted',
         smartlink_url: smartlinkUrl,
+        actor_id: user?.id,
       });
       toast({ title: 'Успешно', description: 'Смартлинк принят' });
       setAction(null);
@@ -82,6 +86,7 @@ export default function ModerationSmartlinks() {
       await smartlinksAPI.update(selectedSmartlink.id, {
         status: 'rejected',
         rejection_reason: rejectionReason,
+        actor_id: user?.id,
       });
       toast({ title: 'Успешно', description: 'Смартлинк отклонён' });
       setAction(null);
@@ -97,6 +102,24 @@ export default function ModerationSmartlinks() {
     }
   };
 
+  const handleResolveLinks = async (smartlink: Smartlink) => {
+    try {
+      setResolvingId(smartlink.id);
+      const response = await smartlinksAPI.resolveLinks(smartlink.id);
+      const found = Object.values(response.platforms).filter((result) => result.status === 'found').length;
+      setSmartlinks((items) => items.map((item) => (item.id === smartlink.id ? { ...item, ...response.smartlink } : item)));
+      toast({ title: 'Готово', description: `Найдено площадок: ${found}` });
+    } catch (error) {
+      toast({
+        title: 'Ошибка',
+        description: 'Не удалось найти ссылки на площадках',
+        variant: 'destructive',
+      });
+    } finally {
+      setResolvingId(null);
+    }
+  };
+
   if (isLoading) {
     return (
       <div className="flex items-center justify-center min-h-[400px]">
@@ -144,6 +167,11 @@ export default function ModerationSmartlinks() {
                         {smartlink.upc && (
                           <p className="text-sm text-muted-foreground mt-1">UPC: {smartlink.upc}</p>
                         )}
+                        {smartlink.platform_links && Object.entries(smartlink.platform_links).map(([platform, url]) => (
+                          <a key={platform} href={url} target="_blank" rel="noopener noreferrer" className="block text-sm text-primary break-all">
+                            {platform}: {url}
+                          </a>
+                        ))}
                       </div>
                       <Badge>На модерации</Badge>
                     </div>
@@ -170,6 +198,17 @@ export default function ModerationSmartlinks() {
                         <Icon name="X" className="mr-2 h-4 w-4" />
                         Отклонить
                       </Button>
+                      {smartlink.upc && (
+                        <Button
+                          variant="outline"
+                          onClick={() => handleResolveLinks(smartlink)}
+                          disabled={resolvingId === smartlink.id}
+                          className="w-full sm:w-auto"
+                        >
+                          <Icon name={resolvingId === smartlink.id ? 'Loader2' : 'Search'} className={`mr-2 h-4 w-4${resolvingId === smartlink.id ? ' animate-spin' : ''}`} />
+                          Найти ссылки
+                        </Button>
+                      )}
                       {smartlink.cover_url && (
                         <a href={smartlink.cover_url} download target="_blank" rel="noopener noreferrer">
                           <Button variant="outline" className="w-full sm:w-auto">
@@ -8,9 +8,11 @@ import { Dialog, DialogContent, DialogDescription, DialogHeader, DialogTitle } f
 import Icon from '@/components/ui/icon';
 import { studioAPI, PromoRelease, Video, PlatformAccount } from '@/lib/api';
 import { useToast } from '@/hooks/use-toast';
+import { useAuth } from '@/contexts/AuthContext';
 
 export default function ModerationStudio() {
   const { toast } = useToast();
+  const { user } = useAuth();
   const [activeTab, setActiveTab] = useState('promo');
   const [isLoading, setIsLoading] = useState(true);
 
@@ -54,7 +56,7 @@ export default function ModerationStudio() {
 
     try {
       const api = itemType === 'promo' ? studioAPI.promo : itemType === 'video' ? studioAPI.video : studioAPI.platform;
-      await api.update(selectedItem.id, { status: 'accepted' });
+      await api.update(selectedItem.id, { status: 'accepted', actor_id: user?.id });
       toast({ title: 'Успешно', description: 'Заявка принята' });
       resetDialog();
       loadData();
@@ -71,7 +73,7 @@ export default function ModerationStudio() {
 
     try {
       const api = itemType === 'promo' ? studioAPI.promo : itemType === 'video' ? studioAPI.video : studioAPI.platform;
-      await api.update(selectedItem.id, { status: 'rejected', rejection_reason: rejectionReason });
+      await api.update(selectedItem.id, { status: 'rejected', rejection_reason: rejectionReason, actor_id: user?.id });
       toast({ title: 'Успешно', description: 'Заявка отклонена' });
       resetDialog();
       loadData();
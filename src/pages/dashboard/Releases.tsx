@@ -56,7 +56,7 @@ export default function Releases() {
 
   const handleWithdraw = async (releaseId: number) => {
     try {
-      await releasesAPI.update(releaseId, { status: 'draft' });
+      await releasesAPI.update(releaseId, { status: 'draft', actor_id: user?.id });
       toast({ title: 'Успешно', description: 'Релиз снят с модерации' });
       loadReleases();
     } catch (error) {
@@ -68,14 +68,20 @@ export default function Releases() {
     }
   };
 
-  const getStatusBadge = (status: string) => {
+  const getStatusBadge = (status: string, moderationRequestedAt?: string | null) => {
     const variants: Record<string, { label: string; variant: 'default' | 'secondary' | 'destructive' | 'outline' }> = {
       draft: { label: 'Черновик', variant: 'secondary' },
       on_moderation: { label: 'На модерации', variant: 'default' },
       accepted: { label: 'Принят', variant: 'outline' },
+      live: { label: 'Вышел', variant: 'outline' },
       rejected: { label: 'Отклонён', variant: 'destructive' },
     };
 
+    // Отправлен на модерацию, но ждёт проверки аудио на дубли — уйдёт модераторам автоматически
+    if (status === 'draft' && moderationRequestedAt) {
+      return <Badge variant="secondary">Проверка аудио</Badge>;
+    }
+
     const config = variants[status] || variants.draft;
     return <Badge variant={config.variant}>{config.label}</Badge>;
   };
@@ -101,7 +107,7 @@ export default function Releases() {
                   <p className="text-xs text-muted-foreground">Дата релиза: {new Date(release.release_date).toLocaleDateString('ru-RU')}</p>
                 )}
               </div>
-              {getStatusBadge(release.status)}
+              {getStatusBadge(release.status, release.moderation_requested_at)}
             </div>
 
             {release.rejection_reason && (
@@ -168,6 +174,7 @@ export default function Releases() {
           <TabsTrigger value="draft">Черновики ({filterReleases('draft').length})</TabsTrigger>
           <TabsTrigger value="on_moderation">На модерации ({filterReleases('on_moderation').length})</TabsTrigger>
           <TabsTrigger value="accepted">Приняты ({filterReleases('accepted').length})</TabsTrigger>
+          <TabsTrigger value="live">Вышли ({filterReleases('live').length})</TabsTrigger>
           <TabsTrigger value="rejected">Отклонены ({filterReleases('rejected').length})</TabsTrigger>
         </TabsList>
 
@@ -31,7 +31,7 @@ export default function Tickets() {
     
     try {
       setIsLoading(true);
-      const response = await ticketsAPI.getAll(user.id);
+      const response = await ticketsAPI.getAll(user.id, undefined, ['message', 'moderator_response']);
       setTickets(response.tickets || []);
     } catch (error) {
       toast({
@@ -132,9 +132,14 @@ export default function Tickets() {
                       {new Date(ticket.created_at).toLocaleString('ru-RU')}
                     </CardDescription>
                   </div>
-                  <Badge variant={ticket.status === 'open' ? 'default' : 'secondary'}>
-                    {ticket.status === 'open' ? 'Открыт' : 'Закрыт'}
-                  </Badge>
+                  <div className="flex gap-2">
+                    {!!ticket.unread_user && (
+                      <Badge variant="destructive">Новых: {ticket.unread_user}</Badge>
+                    )}
+                    <Badge variant={ticket.status === 'open' ? 'default' : 'secondary'}>
+                      {ticket.status === 'open' ? 'Открыт' : 'Закрыт'}
+                    </Badge>
+                  </div>
                 </div>
               </CardHeader>
               <CardContent className="space-y-4">
@@ -41,12 +41,14 @@ export default function ViewRelease() {
       draft: 'secondary',
       on_moderation: 'default',
       accepted: 'outline',
+      live: 'outline',
       rejected: 'destructive',
     };
     const labels: Record<string, string> = {
       draft: 'Черновик',
       on_moderation: 'На модерации',
       accepted: 'Принят',
+      live: 'Вышел',
       rejected: 'Отклонён',
     };
     return <Badge variant={variants[status] || 'default'}>{labels[status] || status}</Badge>;
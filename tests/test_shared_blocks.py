@@ -0,0 +1,26 @@
+"""Копии общих блоков в функциях backend/ совпадают побайтно (scripts/check_shared_blocks.py)"""
+import importlib.util
+import os
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+spec = importlib.util.spec_from_file_location('check_shared_blocks', os.path.join(ROOT, 'scripts', 'check_shared_blocks.py'))
+checker = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(checker)
+
+def test_shared_blocks_are_identical():
+    assert checker.main() == 0
+
+def test_every_shared_block_has_copies():
+    paths = [os.path.join(ROOT, 'backend', name, 'index.py') for name in sorted(os.listdir(os.path.join(ROOT, 'backend')))]
+    blocks, errors = checker.collect_blocks([path for path in paths if os.path.exists(path)])
+    assert not errors
+    assert {'idempotency', 'rate_limit', 'compression'} <= set(blocks)
+    assert all(len(copies) > 1 for copies in blocks.values())
+
+def test_differing_copy_is_reported(tmp_path):
+    for name, value in (('a', 1), ('b', 2)):
+        (tmp_path / f'{name}.py').write_text(f'x = 0\n# >>> shared: sample\nVALUE = {value}\n# <<< shared: sample\n')
+    blocks, errors = checker.collect_blocks([str(tmp_path / 'a.py'), str(tmp_path / 'b.py')])
+    assert not errors
+    assert checker.compare_blocks(blocks)
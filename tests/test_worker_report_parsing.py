@@ -0,0 +1,77 @@
+"""Разбор чисел в отчётах площадок (backend/worker): разделитель решается для столбца, мусор считается ошибкой"""
+import importlib.util
+import os
+import pandas as pd
+import pytest
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+spec = importlib.util.spec_from_file_location('worker_index', os.path.join(BACKEND, 'worker', 'index.py'))
+worker = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(worker)
+
+def column(*values):
+    return pd.Series(list(values), dtype=str)
+
+@pytest.mark.parametrize('values, expected', [
+    (('1,234,567', '2,000'), '.'),
+    (('1.234.567,89', '12,5'), ','),
+    (('1,234.56',), '.'),
+    (('0,0042',), ','),
+    (('2,000',), None),
+    (('1.234',), None),
+    (('', '15'), None),
+])
+def test_detect_decimal_separator(values, expected):
+    assert worker.detect_decimal_separator(column(*values)) == expected
+
+@pytest.mark.parametrize('value, decimal, expected', [
+    ('1,234,567', '.', 1234567.0),
+    ('2,000', '.', 2000.0),
+    ('1.234.567,89', ',', 1234567.89),
+    ('1 234,56', ',', 1234.56),
+    ('1,234.56', '.', 1234.56),
+    ('0.0042', '.', 0.0042),
+    ('-3.5', '.', -3.5),
+])
+def test_parse_amount(value, decimal, expected):
+    parsed, invalid = worker.parse_amount(column(value), decimal)
+    assert parsed[0] == pytest.approx(expected)
+    assert not invalid[0]
+
+@pytest.mark.parametrize('value, decimal, expected', [
+    ('1.234', None, 1234),
+    ('1,234,567', None, 1234567),
+    ('1 234', None, 1234),
+    ('12.6', '.', 13),
+])
+def test_parse_count(value, decimal, expected):
+    parsed, invalid = worker.parse_count(column(value), decimal)
+    assert parsed[0] == expected
+    assert not invalid[0]
+
+def test_unparsable_values_are_counted_not_zeroed():
+    parsed, invalid = worker.parse_amount(column('n/a', '', '1.2.3', '12.50'), '.')
+    assert list(invalid) == [True, False, True, False]
+    assert parsed[3] == pytest.approx(12.5)
+
+def test_ingest_report_decides_separator_per_column(tmp_path):
+    report = tmp_path / 'report.csv'
+    report.write_text(
+        'ISRC;Streams;Revenue\n'
+        'RUA1A2400001;1.234;2,000\n'
+        'RUA1A2400001;10;1.234.567,89\n'
+        'RUA1A2400002;5;oops\n',
+        encoding='utf-8'
+    )
+    index = {
+        'pair': {},
+        'isrc': {'RUA1A2400001': 7, 'RUA1A2400002': 8},
+        'upc': {},
+        'owner': {7: 1, 8: 2},
+    }
+    facts, stats = worker.ingest_report(str(report), index)
+    assert stats['rows_total'] == 3
+    assert stats['rows_invalid'] == 1
+    assert stats['streams_total'] == 1249
+    assert stats['revenue_total'] == pytest.approx(2.0 + 1234567.89)